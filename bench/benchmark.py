@@ -0,0 +1,321 @@
+"""Benchmarks of the control and measurement hot paths, runnable on any Linux box.
+
+Everything runs against a fake sysfs tree (profiler/fakesys.py) and a synthetic
+profile of the fake tree's CPU x GPU grid, so no Jetson, model or profiling result
+is needed:
+
+    controller   DVFSController update() and tell() latency as the history grows to n
+                 samples, exact and incremental, and the log-log scaling exponent in n
+    sampler      AGXPowerLogger achieved rate, missed deadlines, interval jitter and
+                 CPU share at 10 Hz and 1 kHz
+    actuation    setDVFS latency through dvfs.lib, DVFSActuator and per-cluster knobs
+    replay       simulate.replay() decisions and steps per second of the controllers
+
+Results are written as JSON, one entry per metric with its unit and whether lower or
+higher is better. Given a --baseline (an earlier --output), every shared metric that got
+worse by more than --tolerance is reported and the exit status is 1:
+
+    python bench/benchmark.py --output bench.json
+    python bench/benchmark.py --quick --baseline bench.json --output new.json
+    python bench/benchmark.py --only controller replay --sizes 50 100 200 400
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / 'bo'))
+sys.path.append(str(ROOT / 'profiler'))
+
+from simulate import ENERGY_SCALE, Environment, Profile, make_controller, parse_args as parse_replay_args, replay
+from DVFSController import DVFSController
+from dvfs import lib
+from dvfs.actuator import DVFSActuator
+from dvfs.knobs import KnobSpace, evenlySpaced
+from power.AGXPowerLogger import AGXPowerLogger
+from device.backend import SysfsBackend, getBackend, setBackend
+from fakesys import CPU_FREQUENCIES, EMC_FREQUENCIES, GPU_FREQUENCIES, makeFakeSysfs
+
+SUITES = ("controller", "sampler", "actuation", "replay")
+
+# Controllers of the replay suite, as bo/simulate.py options
+REPLAY_CONTROLLERS = {
+    "lut": ["--controller", "lut"],
+    "bo-incremental": ["--incremental"],
+    "bo-incremental-lcb": ["--incremental", "--acquisition", "lcb"],
+    "bo-incremental-tolerance": ["--incremental", "--update-tolerance", "0.01"],
+}
+
+class Results:
+    """Flat metric name -> {"value", "unit", "better"}"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, better="lower"):
+        if value is None or not np.isfinite(value):
+            return
+        self.metrics[name] = {"value": float(value), "unit": unit, "better": better}
+        print(f"{name:<60} {value:>14.4f} {unit}", file=sys.stderr)
+
+def synthetic_environment(cpu_list, gpu_list, seed=0):
+    """Profiles of three workloads over the grid: latency falls with each clock (saturating in the
+    one the workload leans on less), rail power grows with the square of each clock, plus noise"""
+    rng = np.random.default_rng(seed)
+    cpu, gpu = (np.array(axis, dtype=float) for axis in np.meshgrid(cpu_list, gpu_list, indexing="ij"))
+    c, g = (cpu / max(cpu_list)).ravel(), (gpu / max(gpu_list)).ravel()
+    gpu_power = 1.5 + 12.0 * g ** 2
+    cpu_power = 0.8 + 5.0 * c ** 2
+    profiles = []
+    # (multiplier, seconds at max clocks, CPU share, GPU share) of object detection, prefill and decode
+    for multiplier, base, cpu_share, gpu_share in ((60, 1.0, 0.3, 0.7), (1, 0.4, 0.2, 0.8), (100, 8.0, 0.5, 0.5)):
+        latency = base * (cpu_share / c + gpu_share / g) * rng.normal(1.0, 0.02, c.size)
+        energy = np.stack([gpu_power, cpu_power, np.full_like(c, 1.0)], axis=1) * latency[:, None] * ENERGY_SCALE
+        profiles.append(Profile([cpu_list, gpu_list], latency, energy, multiplier))
+    return Environment(*profiles)
+
+def synthetic_traces(env, length, seed=0, segment=8):
+    """Piecewise-constant SLOs, each level drawn between the 10th and 70th percentile of the
+    workload's throughput so that most steps are feasible and the cheapest config keeps moving"""
+    rng = np.random.default_rng(seed)
+    traces = []
+    for throughput in env.throughput:
+        low, high = np.quantile(throughput, [0.1, 0.7])
+        levels = rng.uniform(low, high, size=-(-length // segment))
+        traces.append(np.repeat(levels, segment)[:length].tolist())
+    return traces
+
+def observations(env, count, seed=0):
+    """count (config, fps_od, fps_p, tps, power) samples of random configs, with 2% measurement noise"""
+    rng = np.random.default_rng(seed)
+    samples = []
+    for idx in rng.integers(0, len(env.configs), size=count):
+        noise = rng.normal(1.0, 0.02, 4)
+        samples.append((env.configs[idx], *(env.throughput[:, idx] * noise[:3]), env.power[idx] * noise[3]))
+    return samples
+
+def scaling_exponent(sizes, seconds):
+    """Slope of log(seconds) against log(n): 1 is linear, 3 cubic growth"""
+    if len(sizes) < 2:
+        return None
+    return float(np.polyfit(np.log(sizes), np.log(seconds), 1)[0])
+
+def bench_controller(results, env, sizes, repeats, seed):
+    slos = list(zip(*synthetic_traces(env, 64, seed + 1, segment=1)))
+    for mode in ("exact", "incremental"):
+        update_ms = []
+        for n in sizes:
+            controller = DVFSController(env.cpu_list, env.gpu_list, incremental=mode == "incremental", cache_size=0)
+            samples = observations(env, n + repeats, seed)
+            history, timed = samples[:n - 1], samples[n - 1:]
+            # The exact models fit the seed history once, not once per sample
+            controller.update_batch(history)
+
+            update, tell, tell_std, tell_cached = [], [], [], []
+            for i, sample in enumerate(timed):
+                t0 = time.perf_counter()
+                controller.update_config(*sample)
+                update.append(time.perf_counter() - t0)
+
+                # The first tell of a version predicts the grid; later ones only select from it
+                required = slos[i % len(slos)]
+                controller.acquisition = "greedy"
+                t0 = time.perf_counter()
+                controller.tell(*required)
+                tell.append(time.perf_counter() - t0)
+                controller.acquisition = "lcb"
+                t0 = time.perf_counter()
+                controller.tell(*required)
+                tell_std.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                for other in slos:
+                    controller.tell(*other)
+                tell_cached.append((time.perf_counter() - t0) / len(slos))
+
+            prefix = f"controller/{mode}/n={n}"
+            update_ms.append(np.median(update) * 1e3)
+            results.add(f"{prefix}/update_ms", update_ms[-1], "ms")
+            results.add(f"{prefix}/tell_ms", np.median(tell) * 1e3, "ms")
+            results.add(f"{prefix}/tell_std_ms", np.median(tell_std) * 1e3, "ms")
+            results.add(f"{prefix}/tell_cached_grid_ms", np.median(tell_cached) * 1e3, "ms")
+        results.add(f"controller/{mode}/update_scaling_exponent", scaling_exponent(sizes, update_ms), "")
+
+def bench_sampler(results, root, duration):
+    backend = getBackend()
+    setBackend(SysfsBackend(root))
+    try:
+        for interval, label in ((0.1, "10Hz"), (0.001, "1kHz")):
+            logger = AGXPowerLogger(interval=interval)
+            # The main thread only sleeps, so the process CPU time is the sampler thread's
+            cpu0, t0 = time.process_time(), time.perf_counter()
+            logger.start()
+            time.sleep(duration)
+            logger.stop()
+            cpu, wall = time.process_time() - cpu0, time.perf_counter() - t0
+            logger.close()
+
+            times, _ = logger.getSamples()
+            error = np.abs(np.diff(times) - interval) * 1e6
+            prefix = f"sampler/{label}"
+            results.add(f"{prefix}/rate_hz", logger.count / wall, "Hz", better="higher")
+            results.add(f"{prefix}/missed_fraction", logger.missed / max(logger.count + logger.missed, 1), "")
+            results.add(f"{prefix}/jitter_mean_us", error.mean() if error.size else None, "us")
+            results.add(f"{prefix}/jitter_p99_us", np.percentile(error, 99) if error.size else None, "us")
+            results.add(f"{prefix}/cpu_percent", 100 * cpu / wall, "%")
+            results.add(f"{prefix}/sample_cpu_us", 1e6 * cpu / max(logger.count, 1), "us")
+    finally:
+        setBackend(backend)
+
+def latency_stats(results, prefix, seconds):
+    seconds = np.asarray(seconds) * 1e6
+    results.add(f"{prefix}/mean_us", seconds.mean(), "us")
+    results.add(f"{prefix}/p50_us", np.percentile(seconds, 50), "us")
+    results.add(f"{prefix}/p99_us", np.percentile(seconds, 99), "us")
+
+def bench_actuation(results, root, transitions, seed):
+    rng = np.random.default_rng(seed)
+    configs = list(zip(rng.choice(CPU_FREQUENCIES, transitions), rng.choice(GPU_FREQUENCIES, transitions),
+                       rng.choice(EMC_FREQUENCIES, transitions)))
+    configs = [tuple(int(v) for v in config) for config in configs]
+
+    backend = getBackend()
+    setBackend(SysfsBackend(root))
+    try:
+        seconds = []
+        for config in configs:
+            t0 = time.perf_counter()
+            lib.setDVFS(config)
+            seconds.append(time.perf_counter() - t0)
+        latency_stats(results, "actuation/lib", seconds)
+
+        with DVFSActuator(root=root, emc=True) as actuator:
+            latency_stats(results, "actuation/actuator", [actuator.setDVFS(config) for config in configs])
+
+        space = KnobSpace.perCluster(evenlySpaced(GPU_FREQUENCIES, 4), coreCounts=(1, 2, 4))
+        candidates = space.configs()
+        picks = [candidates[i] for i in rng.integers(0, len(candidates), size=transitions)]
+        with DVFSActuator(root=root) as actuator:
+            latency_stats(results, "actuation/actuator_clusters", [space.apply(config, actuator) for config in picks])
+    finally:
+        setBackend(backend)
+
+def bench_replay(results, env, steps, seed):
+    traces = synthetic_traces(env, steps, seed)
+    for name, options in REPLAY_CONTROLLERS.items():
+        controller = make_controller(parse_replay_args(options), env)
+        metrics, _ = replay(controller, env, traces)
+        prefix = f"replay/{name}"
+        results.add(f"{prefix}/decisions_per_second", metrics["decisions_per_second"], "1/s", better="higher")
+        results.add(f"{prefix}/steps_per_second", metrics["steps_per_second"], "1/s", better="higher")
+        results.add(f"{prefix}/tell_latency_mean_us", metrics["tell_latency_mean"] * 1e6, "us")
+        if metrics["update_latency_mean"] is not None:
+            results.add(f"{prefix}/update_latency_mean_us", metrics["update_latency_mean"] * 1e6, "us")
+        results.add(f"{prefix}/slo_miss_any", metrics["slo_miss_any"], "")
+
+def compare(metrics, baseline, tolerance):
+    """Relative change of every metric the baseline also has; a metric regresses when it moved the
+    wrong way by more than tolerance. Metrics that were zero in the baseline are not compared."""
+    comparison = {}
+    for name, metric in metrics.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], metric["value"]
+        if old == 0:
+            continue
+        change = (new - old) / abs(old)
+        worse = change if metric["better"] == "lower" else -change
+        comparison[name] = {"baseline": old, "value": new, "change": change, "regression": worse > tolerance}
+    return comparison
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the EOCS control and measurement hot paths")
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=list(SUITES), help="Suites to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes and shorter runs, e.g. for CI")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                        help="History lengths n of the controller suite (default: 25 50 100 200 400, quick: 25 50 100)")
+    parser.add_argument("--repeats", type=int, default=None, help="Timed updates per history length")
+    parser.add_argument("--sampler-duration", type=float, default=None, help="Seconds the sampler runs per rate")
+    parser.add_argument("--transitions", type=int, default=None, help="Transitions of the actuation suite")
+    parser.add_argument("--steps", type=int, default=None, help="Trace steps of the replay suite")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the results as JSON here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="Earlier --output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative change in the worse direction reported as a regression")
+    args = parser.parse_args(argv)
+
+    quick = args.quick
+    args.sizes = args.sizes or ([25, 50, 100] if quick else [25, 50, 100, 200, 400])
+    args.repeats = args.repeats or (3 if quick else 5)
+    args.sampler_duration = args.sampler_duration or (1.0 if quick else 5.0)
+    args.transitions = args.transitions or (200 if quick else 2000)
+    args.steps = args.steps or (150 if quick else 500)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = Results()
+    env = synthetic_environment(CPU_FREQUENCIES, GPU_FREQUENCIES, args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="eocs-bench-") as tmp:
+        for suite in args.only:
+            if suite == "controller":
+                bench_controller(results, env, args.sizes, args.repeats, args.seed)
+            elif suite == "sampler":
+                bench_sampler(results, makeFakeSysfs(os.path.join(tmp, "sampler")), args.sampler_duration)
+            elif suite == "actuation":
+                bench_actuation(results, makeFakeSysfs(os.path.join(tmp, "actuation")), args.transitions, args.seed)
+            else:
+                bench_replay(results, env, args.steps, args.seed)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "arguments": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        },
+        "metrics": results.metrics,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        report["baseline"] = {"path": args.baseline, "revision": baseline["meta"].get("revision"),
+                              "tolerance": args.tolerance}
+        report["comparison"] = compare(results.metrics, baseline["metrics"], args.tolerance)
+        regressions = [name for name, entry in report["comparison"].items() if entry["regression"]]
+        for name in regressions:
+            entry = report["comparison"][name]
+            print(f"REGRESSION {name}: {entry['baseline']:.4f} -> {entry['value']:.4f} ({entry['change']:+.0%})",
+                  file=sys.stderr)
+        print(f"{len(report['comparison'])} metrics compared, {len(regressions)} regressions", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,69 +1,319 @@
+import itertools
+from collections import OrderedDict, deque
+
 import numpy as np
+from scipy.stats import norm
 from sklearn.gaussian_process import GaussianProcessRegressor
 from sklearn.gaussian_process.kernels import RBF
+from IncrementalGP import IncrementalGP
 
 class DVFSController:
-    def __init__(self, cpu_frequency_list, gpu_frequency_list):
+    ACQUISITIONS = ("greedy", "lcb", "cei")
+
+    def __init__(self, cpu_frequency_list, gpu_frequency_list, incremental=False, max_history=None, warmup=10, refit_every=None,
+                 acquisition="greedy", beta=2.0, pof_threshold=0.9, emc_frequency_list=None, knobs=None,
+                 cache_size=256, slo_quantum=None, update_tolerance=None):
+        """With `incremental` set, the models extend their Cholesky factor per sample and only
+        re-optimise hyperparameters during `warmup` (and every `refit_every` samples).
+        `max_history` bounds the training set to a sliding window of the latest samples.
+
+        `acquisition` selects how tell() trades off power against SLO risk:
+        "greedy" takes the min predicted power whose posterior mean meets the SLOs,
+        "lcb" requires the `beta`-sigma lower bound of every throughput to meet its SLO and
+        minimises the lower bound of power, and "cei" maximises expected improvement on power
+        weighted by the probability of feasibility, among points with PoF >= `pof_threshold`.
+
+        With `emc_frequency_list` the memory clock is searched as a third knob: update() takes
+        its `emc_freq` and tell() returns (cpu_freq, gpu_freq, emc_freq).
+
+        `knobs` replaces the frequency lists with the values of arbitrary knobs, e.g. per-cluster
+        CPU frequencies and online core counts (profiler/dvfs/knobs.py). Observations then go
+        through update_config() and tell() returns one value per knob. Each knob is scaled by its
+        largest value so that core counts and frequencies in kHz/Hz weigh alike in the kernel.
+
+        tell() memoises up to `cache_size` decisions (0 disables it), keyed on the SLO tuple and
+        stamped with a model version that every update bumps; the grid predictions of the current
+        version are kept as well, so only new SLOs pay for the selection. With `slo_quantum`, one step
+        per workload as (fps_od in FPS, fps_p in prefills/s, tps in tokens/s; 0 leaves that SLO as is),
+        SLOs are rounded up to a multiple of their step before the lookup, and the decision meets the
+        rounded SLOs. With `update_tolerance`, a repeated observation of a
+        config already in the training set that every model predicts within that relative error
+        is dropped without a new version, so once the models converge the control loop mostly
+        hits the cache; configs not seen before are always learned."""
+        if acquisition not in self.ACQUISITIONS:
+            raise ValueError(f"Unknown acquisition {acquisition!r}, expected one of {self.ACQUISITIONS}")
+        # The workloads' SLOs differ by orders of magnitude, so one step cannot fit them all
+        if slo_quantum is not None and np.shape(slo_quantum) != (3,):
+            raise ValueError("slo_quantum takes one step per workload: (fps_od, fps_p, tps)")
+
         self.cpu_frequency_list = cpu_frequency_list
         self.gpu_frequency_list = gpu_frequency_list
+        self.emc_frequency_list = emc_frequency_list
+        self.acquisition = acquisition
+        self.beta = beta
+        self.pof_threshold = pof_threshold
+        self.incremental = incremental
+        self.max_history = max_history
 
         # Training data
-        self.X = []  # (cpu_freq, gpu_freq)
-        self.y_fps_od = []
-        self.y_fps_p = []
-        self.y_tps = []
-        self.y_power = []
+        self.X = deque(maxlen=max_history)  # (cpu_freq, gpu_freq[, emc_freq]), or one value per knob
+        self.y_fps_od = deque(maxlen=max_history)
+        self.y_fps_p = deque(maxlen=max_history)
+        self.y_tps = deque(maxlen=max_history)
+        self.y_power = deque(maxlen=max_history)
 
         # Gaussian Process models
         kernel = RBF(length_scale=1.0)
-        self.gp_fps_od = GaussianProcessRegressor(kernel=kernel, normalize_y=True)
-        self.gp_fps_p = GaussianProcessRegressor(kernel=kernel, normalize_y=True)
-        self.gp_tps = GaussianProcessRegressor(kernel=kernel, normalize_y=True)
-        self.gp_power = GaussianProcessRegressor(kernel=kernel, normalize_y=True)
+        if incremental:
+            def make_gp():
+                return IncrementalGP(kernel, normalize_y=True, max_history=max_history, warmup=warmup, refit_every=refit_every)
+        else:
+            def make_gp():
+                return GaussianProcessRegressor(kernel=kernel, normalize_y=True)
+        self.gp_fps_od = make_gp()
+        self.gp_fps_p = make_gp()
+        self.gp_tps = make_gp()
+        self.gp_power = make_gp()
+
+        # Candidate grid, evaluated as one batch per model in tell()
+        self.knobs = knobs
+        if knobs is None:
+            knobs = [cpu_frequency_list, gpu_frequency_list]
+            if emc_frequency_list is not None:
+                knobs.append(emc_frequency_list)
+            self.scale = np.ones(len(knobs))
+        else:
+            self.scale = np.array([max(knob) for knob in knobs], dtype=float)
+        self.candidate_list = list(itertools.product(*knobs))
+        self.candidates = np.array(self.candidate_list, dtype=float) / self.scale
+        self.fallback_index = self.candidate_list.index(tuple(max(knob) for knob in knobs))
+        if incremental:
+            for gp in (self.gp_fps_od, self.gp_fps_p, self.gp_tps, self.gp_power):
+                gp.set_candidates(self.candidates)
+
+        self.cache_size = cache_size
+        self.slo_quantum = None if slo_quantum is None else np.asarray(slo_quantum, dtype=float)
+        self.update_tolerance = update_tolerance
+        self.warmup = warmup
+        self.version = 0
+        self.decisions = OrderedDict()  # (SLOs, return_std) -> (version, decision)
+        self.grid = None                # (version, mean, std or None)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.skipped_updates = 0
 
         self.is_fitted = False
 
-    def update(self, cpu_freq, gpu_freq, fps_od, fps_p, tps, power):
+    def update(self, cpu_freq, gpu_freq, fps_od, fps_p, tps, power, emc_freq=None):
+        if self.knobs is not None:
+            raise ValueError("This controller searches named knobs; use update_config()")
+        x = [cpu_freq, gpu_freq]
+        if self.emc_frequency_list is not None:
+            if emc_freq is None:
+                raise ValueError("emc_freq is required when the controller searches the memory clock")
+            x.append(emc_freq)
+        self.update_config(x, fps_od, fps_p, tps, power)
+
+    def update_config(self, config, fps_od, fps_p, tps, power):
+        """update() with the config as one value per knob, in candidate order"""
+        if len(config) != len(self.scale):
+            raise ValueError(f"Expected {len(self.scale)} knob values, got {len(config)}")
+        x = list(np.asarray(config, dtype=float) / self.scale)
+        if self.update_tolerance is not None and self.is_fitted and self._explained(x, (fps_od, fps_p, tps, power)):
+            self.skipped_updates += 1
+            return
+
+        self._append(x, fps_od, fps_p, tps, power)
+        if self.incremental:
+            # Extend the existing factorisations with the new sample
+            self.gp_fps_od.update(x, fps_od)
+            self.gp_fps_p.update(x, fps_p)
+            self.gp_tps.update(x, tps)
+            self.gp_power.update(x, power)
+        else:
+            self._fit()
+
+        self.is_fitted = True
+        self.version += 1
+
+    def update_batch(self, samples):
+        """update_config() of many (config, fps_od, fps_p, tps, power) samples, e.g. to seed the controller
+        with an earlier run's observations. The exact models are fitted once on the whole batch; the
+        incremental ones still extend one sample at a time. `update_tolerance` does not apply."""
+        if self.incremental:
+            for config, fps_od, fps_p, tps, power in samples:
+                self.update_config(config, fps_od, fps_p, tps, power)
+            return
+
+        samples = list(samples)
+        if not samples:
+            return
+        for config, fps_od, fps_p, tps, power in samples:
+            if len(config) != len(self.scale):
+                raise ValueError(f"Expected {len(self.scale)} knob values, got {len(config)}")
+            self._append(list(np.asarray(config, dtype=float) / self.scale), fps_od, fps_p, tps, power)
+        self._fit()
+        self.is_fitted = True
+        self.version += 1
+
+    def _append(self, x, fps_od, fps_p, tps, power):
         # Add new training data
-        self.X.append([cpu_freq, gpu_freq])
+        self.X.append(x)
         self.y_fps_od.append(fps_od)
         self.y_fps_p.append(fps_p)
         self.y_tps.append(tps)
         self.y_power.append(power)
 
+    def _fit(self):
         # Fit all models
         X_train = np.array(self.X)
-        self.gp_fps_od.fit(X_train, self.y_fps_od)
-        self.gp_fps_p.fit(X_train, self.y_fps_p)
-        self.gp_tps.fit(X_train, self.y_tps)
-        self.gp_power.fit(X_train, self.y_power)
+        self.gp_fps_od.fit(X_train, list(self.y_fps_od))
+        self.gp_fps_p.fit(X_train, list(self.y_fps_p))
+        self.gp_tps.fit(X_train, list(self.y_tps))
+        self.gp_power.fit(X_train, list(self.y_power))
 
-        self.is_fitted = True
+    def _explained(self, x, y):
+        if len(self.y_power) < self.warmup or x not in self.X:
+            return False
+        models = (self.gp_fps_od, self.gp_fps_p, self.gp_tps, self.gp_power)
+        predicted = np.array([gp.predict([x])[0] for gp in models])
+        return np.all(np.abs(np.asarray(y, dtype=float) - predicted) <= self.update_tolerance * np.abs(predicted))
+
+    def cache_stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": self.cache_hits / lookups if lookups else None,
+            "entries": len(self.decisions),
+            "version": self.version,
+            "skipped_updates": self.skipped_updates,
+        }
+
+    def quantise(self, required):
+        """SLOs rounded up to the next multiple of slo_quantum"""
+        if self.slo_quantum is None:
+            return tuple(float(r) for r in required)
+        q = self.slo_quantum
+        rounded = np.where(q > 0, np.ceil(np.asarray(required, dtype=float) / np.where(q > 0, q, 1.0) - 1e-9) * q, required)
+        return tuple(float(r) for r in rounded)
+
+    def predict_grid(self, return_std=False):
+        """Predicts (fps_od, fps_p, tps, power) over the whole candidate grid with one call per model"""
+        if self.grid is not None and self.grid[0] == self.version and (self.grid[2] is not None or not return_std):
+            _, mean, std = self.grid
+            return (mean, std) if return_std else mean
+        if return_std:
+            mean, std = self._predict_grid(return_std=True)
+        else:
+            mean, std = self._predict_grid(), None
+        self.grid = (self.version, mean, std)
+        return (mean, std) if return_std else mean
+
+    def _predict_grid(self, return_std=False):
+        models = (self.gp_fps_od, self.gp_fps_p, self.gp_tps, self.gp_power)
+        if self.incremental:
+            predictions = [gp.predict_candidates(return_std=return_std) for gp in models]
+        else:
+            predictions = [gp.predict(self.candidates, return_std=return_std) for gp in models]
+        if not return_std:
+            return np.stack(predictions)
+        means, stds = zip(*predictions)
+        return np.stack(means), np.stack(stds)
 
-    def tell(self, required_fps_od, required_fps_p, required_tps):
+    def probability_of_feasibility(self, mean, std, required):
+        """Probability that each candidate meets all three throughput SLOs under the posterior"""
+        required = np.asarray(required, dtype=float)[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = (mean[:3] - required) / std[:3]
+        # Zero posterior std leaves a deterministic outcome
+        z = np.where(std[:3] > 0, z, np.where(mean[:3] >= required, np.inf, -np.inf))
+        return np.prod(norm.cdf(z), axis=0)
+
+    def tell(self, required_fps_od, required_fps_p, required_tps, return_std=False):
+        """Returns the (cpu_freq, gpu_freq[, emc_freq]), or the knob values, chosen by the acquisition mode for the given SLOs.
+        With `return_std`, the predicted std of (fps_od, fps_p, tps, power) at that point is appended."""
         if not self.is_fitted:
-            return max(self.cpu_frequency_list), max(self.gpu_frequency_list)
-
-        # Evaluate all combinations
-        candidates = []
-        for cpu_freq in self.cpu_frequency_list:
-            for gpu_freq in self.gpu_frequency_list:
-                x = np.array([[cpu_freq, gpu_freq]])
-
-                pred_fps_od = self.gp_fps_od.predict(x)[0]
-                pred_fps_p = self.gp_fps_p.predict(x)[0]
-                pred_tps = self.gp_tps.predict(x)[0]
-                pred_power = self.gp_power.predict(x)[0]
-
-                if (pred_fps_od >= required_fps_od and
-                    pred_fps_p >= required_fps_p and
-                    pred_tps >= required_tps):
-                    candidates.append((pred_power, cpu_freq, gpu_freq))
-
-        if not candidates:
-            return max(self.cpu_frequency_list), max(self.gpu_frequency_list)
-
-        # Choose the one with minimal power
-        candidates.sort()
-        _, best_cpu, best_gpu = candidates[0]
-        return best_cpu, best_gpu
\ No newline at end of file
+            fallback = self.candidate_list[self.fallback_index]
+            return fallback + (None,) if return_std else fallback
+
+        required = self.quantise((required_fps_od, required_fps_p, required_tps))
+        key = (required, return_std)
+        entry = self.decisions.get(key)
+        if entry is not None and entry[0] == self.version:
+            self.decisions.move_to_end(key)
+            self.cache_hits += 1
+            return entry[1]
+        self.cache_misses += 1
+
+        decision = self._tell(required, return_std)
+        if self.cache_size:
+            self.decisions[key] = (self.version, decision)
+            self.decisions.move_to_end(key)
+            while len(self.decisions) > self.cache_size:
+                self.decisions.popitem(last=False)
+        return decision
+
+    def _tell(self, required, return_std):
+        # Evaluate all combinations in one batch per model
+        if return_std or self.acquisition != "greedy":
+            mean, std = self.predict_grid(return_std=True)
+        else:
+            mean, std = self.predict_grid(), None
+
+        if self.acquisition == "greedy":
+            best = self._select_greedy(mean, required)
+        else:
+            best = self._select_uncertain(mean, std, required)
+
+        if return_std:
+            return self.candidate_list[best] + (std[:, best],)
+        return self.candidate_list[best]
+
+    def _select_greedy(self, mean, required):
+        pred_fps_od, pred_fps_p, pred_tps, pred_power = mean
+        feasible = np.flatnonzero((pred_fps_od >= required[0]) &
+                                  (pred_fps_p >= required[1]) &
+                                  (pred_tps >= required[2]))
+        if feasible.size == 0:
+            return self.fallback_index
+        return self._argmin(feasible, pred_power[feasible])
+
+    def _select_uncertain(self, mean, std, required):
+        pof = self.probability_of_feasibility(mean, std, required)
+
+        if self.acquisition == "lcb":
+            lower = mean[:3] - self.beta * std[:3]
+            feasible = np.flatnonzero(np.all(lower >= np.asarray(required, dtype=float)[:, None], axis=0))
+            score = mean[3] - self.beta * std[3]
+        else:
+            feasible = np.flatnonzero(pof >= self.pof_threshold)
+            best_power = self._best_observed_power(required)
+            if best_power is None:
+                # Nothing observed meets these SLOs yet: look for feasibility first
+                score = -pof
+            else:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    z = (best_power - mean[3]) / std[3]
+                    ei = std[3] * (z * norm.cdf(z) + norm.pdf(z))
+                ei = np.where(std[3] > 0, ei, np.maximum(best_power - mean[3], 0.0))
+                # Ties on zero EI fall back to the lower predicted power
+                score = -(ei * pof) + 1e-12 * mean[3]
+
+        if feasible.size == 0:
+            # Rather than jumping to max frequency, take the point most likely to meet the SLOs
+            return int(np.argmax(pof))
+        return self._argmin(feasible, score[feasible])
+
+    def _best_observed_power(self, required):
+        y = np.array([self.y_fps_od, self.y_fps_p, self.y_tps, self.y_power])
+        feasible = np.all(y[:3] >= np.asarray(required, dtype=float)[:, None], axis=0)
+        if not feasible.any():
+            return None
+        return y[3, feasible].min()
+
+    def _argmin(self, indices, score):
+        # Ties broken by lower cpu, then gpu (then emc) frequency, i.e. by the knobs in order
+        keys = [self.candidates[indices, d] for d in reversed(range(self.candidates.shape[1]))]
+        order = np.lexsort(keys + [score])
+        return indices[order[0]]
@@ -0,0 +1,178 @@
+import numpy as np
+from scipy.linalg import cho_solve, solve_triangular
+from sklearn.base import clone
+from sklearn.gaussian_process import GaussianProcessRegressor
+
+class IncrementalGP:
+    """Gaussian process regressor whose Cholesky factor is extended one sample at a time.
+
+    Kernel hyperparameters are optimised with a regular GaussianProcessRegressor
+    for the first `warmup` samples (and every `refit_every` samples afterwards,
+    if given) and held fixed in between, so adding a sample costs O(n^2)
+    instead of O(n^3). With `max_history` set, the oldest sample is evicted by
+    a rank-one update of the factor, keeping both time and memory bounded.
+
+    For a fixed candidate set (set_candidates()), the cross-kernel with the
+    training set and its triangular solve are extended by one row per sample
+    as well, so predict_candidates() costs O(n * candidates) instead of
+    re-evaluating the kernel over the whole grid.
+    """
+
+    def __init__(self, kernel, alpha=1e-10, normalize_y=True, max_history=None, warmup=10, refit_every=None):
+        self.kernel = kernel
+        self.alpha = alpha
+        self.normalize_y = normalize_y
+        self.max_history = max_history
+        self.warmup = warmup
+        self.refit_every = refit_every
+
+        self.kernel_ = None
+        self.X = None
+        self.y = np.empty(0)
+        self.L = None
+        self.alpha_ = None
+        self.y_mean = 0.0
+        self.y_std = 1.0
+        self.n_updates = 0
+
+        self.candidates = None
+        self.K_cand = None      # (n, candidates) kernel between the training set and the candidates
+        self.V_cand = None      # L^-1 K_cand
+        self.explained = None   # column sums of V_cand ** 2
+        self.prior_var = None
+
+    def update(self, x, y):
+        """Adds one observation and updates the posterior"""
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+        self.n_updates += 1
+        refit = (self.kernel_ is None or self.n_updates <= self.warmup or
+                 (self.refit_every is not None and self.n_updates % self.refit_every == 0))
+
+        if self.max_history is not None and len(self.y) >= self.max_history:
+            self._evict(update_factor=not refit)
+
+        if self.X is None or len(self.y) == 0:
+            self.X = x
+        else:
+            self.X = np.vstack([self.X, x])
+        self.y = np.append(self.y, float(y))
+
+        if refit:
+            self._refit()
+        else:
+            self._extend(x)
+            self._extend_candidates(x)
+        self._solve()
+
+    def predict(self, X, return_std=False):
+        """Predicts the posterior mean (and standard deviation) at X"""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        K_trans = self.kernel_(X, self.X)
+        y_mean = K_trans @ self.alpha_ * self.y_std + self.y_mean
+        if not return_std:
+            return y_mean
+
+        v = solve_triangular(self.L, K_trans.T, lower=True, check_finite=False)
+        y_var = self.kernel_.diag(X) - np.einsum("ij,ij->j", v, v)
+        y_std = np.sqrt(np.clip(y_var, 0.0, None)) * self.y_std
+        return y_mean, y_std
+
+    def set_candidates(self, X):
+        """Fixes the points predict_candidates() evaluates"""
+        self.candidates = np.atleast_2d(np.asarray(X, dtype=float))
+        self.K_cand = None
+        self.V_cand = None
+
+    def predict_candidates(self, return_std=False):
+        """predict() at the candidates, from the incrementally maintained cross-kernel"""
+        if self.K_cand is None:
+            self.K_cand = self.kernel_(self.X, self.candidates)
+            self.prior_var = self.kernel_.diag(self.candidates)
+        y_mean = self.alpha_ @ self.K_cand * self.y_std + self.y_mean
+        if not return_std:
+            return y_mean
+
+        if self.V_cand is None:
+            self.V_cand = solve_triangular(self.L, self.K_cand, lower=True, check_finite=False)
+            self.explained = np.einsum("ij,ij->j", self.V_cand, self.V_cand)
+        y_var = self.prior_var - self.explained
+        y_std = np.sqrt(np.clip(y_var, 0.0, None)) * self.y_std
+        return y_mean, y_std
+
+    def _extend_candidates(self, x):
+        if self.K_cand is None:
+            return
+        k = self.kernel_(x, self.candidates)
+        self.K_cand = np.vstack([self.K_cand, k])
+        if self.V_cand is not None:
+            # The new row of L^-1 K_cand, from the new row of L
+            n = self.L.shape[0] - 1
+            v = (k[0] - self.L[n, :n] @ self.V_cand) / self.L[n, n]
+            self.V_cand = np.vstack([self.V_cand, v])
+            self.explained = self.explained + v * v
+
+    def _refit(self):
+        gp = GaussianProcessRegressor(kernel=clone(self.kernel), alpha=self.alpha, normalize_y=self.normalize_y)
+        gp.fit(self.X, self.y)
+        self.kernel_ = gp.kernel_
+        self.L = gp.L_
+        self.K_cand = None
+        self.V_cand = None
+
+    def _factorize(self):
+        K = self.kernel_(self.X)
+        K[np.diag_indices_from(K)] += self.alpha
+        self.L = np.linalg.cholesky(K)
+        self.V_cand = None
+
+    def _extend(self, x):
+        # Append one row to L: [[L, 0], [l^T, sqrt(k(x, x) - l^T l)]]
+        k = self.kernel_(self.X[:-1], x)[:, 0]
+        l = solve_triangular(self.L, k, lower=True, check_finite=False)
+        d = self.kernel_.diag(x)[0] + self.alpha - l @ l
+        if not np.isfinite(d) or d <= 0:
+            self._factorize()
+            return
+
+        n = self.L.shape[0]
+        L = np.zeros((n + 1, n + 1))
+        L[:n, :n] = self.L
+        L[n, :n] = l
+        L[n, n] = np.sqrt(d)
+        self.L = L
+
+    def _evict(self, update_factor):
+        # Dropping the first sample leaves K22 = L22 L22^T + l21 l21^T
+        if update_factor:
+            self.L = _cholupdate(self.L[1:, 1:], self.L[1:, 0])
+        self.X = self.X[1:]
+        self.y = self.y[1:]
+        if self.K_cand is not None:
+            self.K_cand = self.K_cand[1:]
+        self.V_cand = None
+
+    def _solve(self):
+        if self.normalize_y:
+            self.y_mean = np.mean(self.y)
+            self.y_std = np.std(self.y)
+            if self.y_std == 0:
+                self.y_std = 1.0
+        y = (self.y - self.y_mean) / self.y_std
+
+        self.alpha_ = cho_solve((self.L, True), y, check_finite=False)
+        if not np.all(np.isfinite(self.alpha_)):
+            self._factorize()
+            self.alpha_ = cho_solve((self.L, True), y, check_finite=False)
+
+def _cholupdate(L, x):
+    """Returns the lower Cholesky factor of L L^T + x x^T"""
+    L = L.copy()
+    x = x.copy()
+    for k in range(len(x)):
+        r = np.hypot(L[k, k], x[k])
+        c = r / L[k, k]
+        s = x[k] / L[k, k]
+        L[k, k] = r
+        L[k+1:, k] = (L[k+1:, k] + s * x[k+1:]) / c
+        x[k+1:] = c * x[k+1:] - s * L[k+1:, k]
+    return L
@@ -0,0 +1,119 @@
+import itertools
+from bisect import bisect_left
+
+import numpy as np
+
+class LookupTableController:
+    """Answers min-power SLO queries from the offline profiles, without models or exploration.
+
+    The (cpu, gpu[, emc]) grid, or the product of `knobs`, is flattened first knob slowest, as in DVFSController. Only configs on the
+    joint Pareto frontier (no other config has at least the same fps_od, fps_p and tps at
+    no more power) can ever be optimal, so the index keeps those alone. The distinct
+    frontier fps_od and fps_p values form the axes of a 2-D table; each cell holds the
+    power staircase over tps of the frontier points meeting both thresholds. A query is
+    three binary searches.
+    """
+
+    def __init__(self, cpu_frequency_list, gpu_frequency_list, fps_od, fps_p, tps, power, emc_frequency_list=None,
+                 knobs=None):
+        self.cpu_frequency_list = cpu_frequency_list
+        self.gpu_frequency_list = gpu_frequency_list
+        self.emc_frequency_list = emc_frequency_list
+        self.knobs = knobs
+        if knobs is None:
+            knobs = [cpu_frequency_list, gpu_frequency_list]
+            if emc_frequency_list is not None:
+                knobs.append(emc_frequency_list)
+        self.candidate_list = list(itertools.product(*knobs))
+        self.fallback = tuple(max(knob) for knob in knobs)
+
+        self.throughput = np.stack([np.asarray(fps_od, dtype=float),
+                                    np.asarray(fps_p, dtype=float),
+                                    np.asarray(tps, dtype=float)])
+        self.power = np.asarray(power, dtype=float)
+        if self.throughput.shape[1] != len(self.candidate_list) or self.power.shape[0] != len(self.candidate_list):
+            raise ValueError("Profiles must cover the full frequency grid")
+
+        self.frontiers = [self._workload_frontier(w) for w in range(3)]
+        self.joint_frontier = self._joint_frontier()
+        self._build_table()
+
+    def _workload_frontier(self, w):
+        """Indices on the throughput-vs-power frontier of one workload, by increasing power"""
+        order = np.lexsort((-self.throughput[w], self.power))
+        running_max = np.maximum.accumulate(self.throughput[w, order])
+        keep = np.concatenate([[True], self.throughput[w, order[1:]] > running_max[:-1]])
+        return order[keep]
+
+    def _joint_frontier(self):
+        """Indices not dominated in (fps_od, fps_p, tps, -power)"""
+        t, p = self.throughput, self.power
+        geq = np.all(t[:, :, None] >= t[:, None, :], axis=0) & (p[:, None] <= p[None, :])
+        strict = np.any(t[:, :, None] > t[:, None, :], axis=0) | (p[:, None] < p[None, :])
+        dominated = np.any(geq & strict, axis=0)
+        return np.flatnonzero(~dominated)
+
+    def _build_table(self):
+        points = self.joint_frontier
+        self.thresholds = [np.unique(self.throughput[w, points]).tolist() for w in range(2)]
+
+        # Cells whose fps_od/fps_p thresholds admit the same points share one staircase
+        staircases = {}
+        self.table = []
+        t = self.throughput[:, points]
+        for od_threshold in self.thresholds[0]:
+            meets_od = t[0] >= od_threshold
+            row = []
+            for p_threshold in self.thresholds[1]:
+                mask = meets_od & (t[1] >= p_threshold)
+                key = mask.tobytes()
+                if key not in staircases:
+                    staircases[key] = self._staircase(points[mask])
+                row.append(staircases[key])
+            self.table.append(row)
+        self.n_staircases = len(staircases)
+
+    def _staircase(self, points):
+        """(tps thresholds, grid indices) of the min-power config meeting each tps level, by increasing tps"""
+        if points.size == 0:
+            return np.empty(0), np.empty(0, dtype=np.int32)
+        # Descending tps; on equal tps, lower power then lower cpu/gpu first
+        order = np.lexsort((points, self.power[points], -self.throughput[2, points]))
+        tps_levels, indices = [], []
+        best_power = np.inf
+        for idx in points[order]:
+            if self.power[idx] < best_power:
+                best_power = self.power[idx]
+                tps_levels.append(float(self.throughput[2, idx]))
+                indices.append(int(idx))
+        return np.array(tps_levels[::-1]), np.array(indices[::-1], dtype=np.int32)
+
+    def frontier(self, workload):
+        """(cpu_freq, gpu_freq[, emc_freq] or knob values, throughput, power) along one workload's frontier; workload is 0, 1 or 2"""
+        return [self.candidate_list[i] + (float(self.throughput[workload, i]), float(self.power[i]))
+                for i in self.frontiers[workload]]
+
+    def query(self, required_fps_od, required_fps_p, required_tps):
+        """Grid index of the min-power config meeting the SLOs, or None if no config does"""
+        i = bisect_left(self.thresholds[0], required_fps_od)
+        j = bisect_left(self.thresholds[1], required_fps_p)
+        if i == len(self.thresholds[0]) or j == len(self.thresholds[1]):
+            return None
+        tps_levels, indices = self.table[i][j]
+        k = np.searchsorted(tps_levels, required_tps)
+        if k == len(tps_levels):
+            return None
+        return int(indices[k])
+
+    def tell(self, required_fps_od, required_fps_p, required_tps):
+        idx = self.query(required_fps_od, required_fps_p, required_tps)
+        if idx is None:
+            return self.fallback
+        return self.candidate_list[idx]
+
+    def update(self, cpu_freq, gpu_freq, fps_od, fps_p, tps, power, emc_freq=None):
+        """The table is built from offline profiles; online observations are ignored"""
+        pass
+
+    def update_config(self, config, fps_od, fps_p, tps, power):
+        pass
@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+from SLOForecaster import make_forecaster
+
+class ProactiveController:
+    """Forecasts the SLO demand in front of a controller, so clocks move before the demand does.
+
+    A configuration takes `lead` seconds (the measured frequency-transition latency) to be in
+    effect, so the one asked for now has to meet the demand of the next ceil(lead / period)
+    steps as well. Every workload's SLO is raised to the upper forecast (mean + `z` std) over
+    that horizon, capped at the largest demand seen, and a lower SLO is held off for `hold`
+    steps (default: twice the horizon, the round trip of a down-step and the step back up), so
+    dips shorter than that cause no transitions. With `lead` 0 the SLOs are passed through unchanged.
+
+    controller is any controller with tell() and update()/update_config(); forecaster is a
+    name from SLOForecaster.FORECASTERS, built with `forecaster_options` once per workload.
+    """
+
+    def __init__(self, controller, forecaster="ewma", lead=0.0, period=1.0, z=1.0, hold=None, **forecaster_options):
+        self.controller = controller
+        self.forecasters = [make_forecaster(forecaster, **forecaster_options) for _ in range(3)]
+        self.period = period
+        self.z = z
+        self.fixed_hold = hold
+        self.set_lead(lead)
+
+        self.peak = [0.0, 0.0, 0.0]
+        self.targets = None
+        self.below = [0, 0, 0]
+        self.stats = {"pre_raised": 0, "held": 0}
+
+    def set_lead(self, lead):
+        """Updates the transition latency, e.g. from the actuator's recent transitions"""
+        self.lead = lead
+        self.horizon = math.ceil(lead / self.period - 1e-9) if lead > 0 else 0
+        self.hold = self.fixed_hold if self.fixed_hold is not None else 2 * self.horizon
+
+    def forecast(self, required):
+        """SLOs to ask the controller for, given the current ones"""
+        targets = []
+        for w, value in enumerate(required):
+            forecaster = self.forecasters[w]
+            forecaster.observe(value)
+            self.peak[w] = max(self.peak[w], value)
+
+            target = value
+            if self.horizon:
+                mean, std = forecaster.forecast(self.horizon)
+                upper = min(float(np.max(mean + self.z * std)), self.peak[w])
+                if upper > value:
+                    target = upper
+                    self.stats["pre_raised"] += 1
+
+            if self.targets is not None and target < self.targets[w]:
+                self.below[w] += 1
+                if self.below[w] <= self.hold:
+                    target = self.targets[w]
+                    self.stats["held"] += 1
+                else:
+                    self.below[w] = 0
+            else:
+                self.below[w] = 0
+            targets.append(target)
+        self.targets = targets
+        return targets
+
+    def tell(self, required_fps_od, required_fps_p, required_tps, **kwargs):
+        return self.controller.tell(*self.forecast((required_fps_od, required_fps_p, required_tps)), **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self.controller.update(*args, **kwargs)
+
+    def update_config(self, config, fps_od, fps_p, tps, power):
+        return self.controller.update_config(config, fps_od, fps_p, tps, power)
+
+    def __getattr__(self, name):
+        # Anything else (e.g. cache_stats) is the wrapped controller's
+        return getattr(self.controller, name)
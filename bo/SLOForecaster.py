@@ -0,0 +1,109 @@
+from collections import deque
+
+import numpy as np
+
+class EWMAForecaster:
+    """Exponentially weighted level and residual variance; the forecast is flat at the level"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.level = None
+        self.var = 0.0
+
+    def observe(self, value):
+        if self.level is None:
+            self.level = float(value)
+            return
+        residual = value - self.level
+        self.var = (1 - self.alpha) * (self.var + self.alpha * residual ** 2)
+        self.level += self.alpha * residual
+
+    def forecast(self, horizon):
+        """(mean, std) of the next `horizon` steps"""
+        return np.full(horizon, self.level), np.full(horizon, np.sqrt(self.var))
+
+class ARForecaster:
+    """AR(`order`) model with intercept, least-squares fit over the last `window` observations.
+
+    Until the window holds enough samples to fit, it forecasts the last value with the spread
+    of the values seen so far."""
+
+    def __init__(self, order=2, window=32):
+        self.order = order
+        self.history = deque(maxlen=window)
+
+    def observe(self, value):
+        self.history.append(float(value))
+
+    def forecast(self, horizon):
+        y = np.array(self.history)
+        p = self.order
+        if len(y) < 2 * p + 2:
+            return np.full(horizon, y[-1]), np.full(horizon, y.std())
+
+        X = np.column_stack([np.ones(len(y) - p)] + [y[p - k - 1:len(y) - k - 1] for k in range(p)])
+        coef, *_ = np.linalg.lstsq(X, y[p:], rcond=None)
+        sigma = np.std(y[p:] - X @ coef)
+
+        # Iterated forecast; the std grows with the psi weights of the AR polynomial
+        lags = list(y[-p:][::-1])
+        psi = [1.0]
+        mean = np.empty(horizon)
+        for h in range(horizon):
+            mean[h] = coef[0] + np.dot(coef[1:], lags)
+            lags = [mean[h]] + lags[:-1]
+            psi.append(sum(coef[1 + k] * psi[-1 - k] for k in range(min(p, len(psi)))))
+        std = sigma * np.sqrt(np.cumsum(np.square(psi[:horizon])))
+        return mean, std
+
+class ChangePointForecaster:
+    """Piecewise-constant demand: a two-sided CUSUM detects level shifts.
+
+    Deviations from the current segment mean beyond `drift` std accumulate; once either sum exceeds
+    `threshold` std, a new segment starts at the latest value. The forecast is flat at the segment
+    mean, with the std of the residuals within segments. Segments keep a running count and mean, so
+    a long stable segment costs O(1) memory and time per observation."""
+
+    def __init__(self, threshold=2.0, drift=0.5, min_std=1e-6):
+        self.threshold = threshold
+        self.drift = drift
+        self.min_std = min_std
+        self.count = 0
+        self.mean = 0.0
+        self.high = self.low = 0.0
+        self.residuals = deque(maxlen=64)
+        self.changes = 0
+
+    def std(self):
+        return max(np.std(self.residuals), self.min_std) if self.residuals else self.min_std
+
+    def observe(self, value):
+        value = float(value)
+        if not self.count:
+            self.count, self.mean = 1, value
+            return
+        s = self.std()
+        self.high = max(0.0, self.high + (value - self.mean) / s - self.drift)
+        self.low = max(0.0, self.low - (value - self.mean) / s - self.drift)
+        if self.high > self.threshold or self.low > self.threshold:
+            self.count, self.mean = 1, value
+            self.high = self.low = 0.0
+            self.changes += 1
+        else:
+            self.residuals.append(value - self.mean)
+            self.count += 1
+            self.mean += (value - self.mean) / self.count
+
+    def forecast(self, horizon):
+        return np.full(horizon, self.mean), np.full(horizon, self.std())
+
+FORECASTERS = {
+    "ewma": EWMAForecaster,
+    "ar": ARForecaster,
+    "changepoint": ChangePointForecaster,
+}
+
+def make_forecaster(name, **options):
+    if name not in FORECASTERS:
+        raise ValueError(f"Unknown forecaster {name!r}, expected one of {tuple(FORECASTERS)}")
+    return FORECASTERS[name](**options)
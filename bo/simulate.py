@@ -0,0 +1,395 @@
+"""Headless trace replay for the DVFS controllers.
+
+Loads the offline profiles and SLO traces once into arrays, replays the traces
+through a controller and reports SLO misses, power/energy against the offline
+optimum and the default governor, and controller decisions per second.
+
+    python bo/simulate.py --acquisition lcb --output metrics.json --csv steps.csv
+"""
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / 'profiler'))
+
+from store.ProfileStore import ProfileStore, KNOBS
+
+FPS_OD_TRACE_PATH = ROOT / 'dataset/fps-od-trace.json'
+FPS_P_TRACE_PATH = ROOT / 'dataset/fps-p-trace.json'
+TPS_TRACE_PATH = ROOT / 'dataset/tps-trace.json'
+
+FPS_OD_PERFORMANCE_PATH = ROOT / 'result/final/yolov8-640.json'
+FPS_P_PERFORMANCE_PATH = ROOT / 'result/final/gemma-3-4B-prefill.json'
+TPS_PERFORMANCE_PATH = ROOT / 'result/final/gemma-3-4B-decode.json'
+
+# Written by profiler/profiler_colocated.py: throughput under contention, power of the three tasks together
+FPS_OD_COLOCATED_PATH = ROOT / 'result/final/yolov8-640-colocated.json'
+FPS_P_COLOCATED_PATH = ROOT / 'result/final/gemma-3-4B-prefill-colocated.json'
+TPS_COLOCATED_PATH = ROOT / 'result/final/gemma-3-4B-decode-colocated.json'
+
+FPS_OD_PERFORMANCE_DEFAULT_PATH = ROOT / 'result/final/yolov8-640-default.json'
+FPS_P_PERFORMANCE_DEFAULT_PATH = ROOT / 'result/final/gemma-3-4B-prefill-default.json'
+TPS_PERFORMANCE_DEFAULT_PATH = ROOT / 'result/final/gemma-3-4B-decode-default.json'
+
+FPS_OD_MULTIPLIER = 60
+FPS_P_MULTIPLIER = 1
+TPS_MULTIPLIER = 100
+
+ENERGY_SCALE = 10**6
+
+WORKLOADS = ("fps_od", "fps_p", "tps")
+
+def load_json(filepath):
+    with open(filepath, 'r') as file:
+        data = json.load(file)
+
+    return data
+
+def knob_field(name):
+    """Record field of a knob: cpu_freq, cpu4_freq, cores4, ..."""
+    return name if name.startswith("cores") else name + "_freq"
+
+class Profile:
+    """Throughput and power of one workload over the dense knob grid, flattened with the first knob slowest.
+
+    knobs holds the values of every knob, names their names as in profiler/dvfs/knobs.py
+    (default: cpu, gpu[, emc]), e.g. per-cluster frequencies and online core counts."""
+
+    def __init__(self, knobs, latency, energy, multiplier, names=None):
+        self.knobs = [list(knob) for knob in knobs]
+        self.names = list(names) if names is not None else list(KNOBS[:len(self.knobs)])
+        self.latency = np.asarray(latency, dtype=float)
+        self.energy = np.asarray(energy, dtype=float)  # (n, 3) GPU, CPU, memory
+        self.multiplier = multiplier
+
+        self.throughput = multiplier / self.latency
+        # GPU and CPU rails; the memory rail counts too once the memory clock is a knob
+        rails = 3 if "emc" in self.names else 2
+        self.power = self.energy[:, :rails].sum(axis=1) / self.latency / ENERGY_SCALE
+
+    def knob(self, name):
+        """Values of a named knob, or None if the profile does not vary it"""
+        return self.knobs[self.names.index(name)] if name in self.names else None
+
+    @property
+    def cpu_list(self):
+        return self.knob("cpu")
+
+    @property
+    def gpu_list(self):
+        return self.knob("gpu")
+
+    @property
+    def emc_list(self):
+        return self.knob("emc")
+
+    @classmethod
+    def load(cls, path, multiplier):
+        """Loads a profile store, or the JSON profile when no .npz store sits next to it"""
+        path = Path(path)
+        store_path = path.with_suffix('.npz')
+        if store_path.exists():
+            return cls.fromStore(ProfileStore.load(store_path), multiplier)
+
+        data = load_json(path)
+        keys = [tuple(int(v) for v in k.split(":")) for k in data]
+        knobs = [sorted({k[d] for k in keys}) for d in range(len(keys[0]))]
+
+        table = {k: v for k, v in zip(keys, data.values())}
+        rows = np.array([table[config] for config in itertools.product(*knobs)], dtype=float)
+        return cls(knobs, rows[:, 0], rows[:, 1:4], multiplier)
+
+    @classmethod
+    def fromStore(cls, store, multiplier):
+        _, latency, energy = store.flat()
+        return cls([store.axes[name].tolist() for name in store.knobs], latency, energy[:, :3], multiplier,
+                   names=store.knobs)
+
+    @staticmethod
+    def load_default(path, multiplier):
+        """Returns (throughput, power) of the default governor"""
+        line = load_json(path)['default:default']
+        return multiplier / line[0], (line[1] + line[2]) / line[0] / ENERGY_SCALE
+
+class Environment:
+    """Ground truth the controller is replayed against"""
+
+    def __init__(self, fps_od, fps_p, tps, defaults=None):
+        self.cpu_list = fps_od.cpu_list
+        self.gpu_list = fps_od.gpu_list
+        self.emc_list = fps_od.emc_list
+        self.knobs = fps_od.knobs
+        self.names = fps_od.names
+        for profile in (fps_p, tps):
+            if profile.knobs != self.knobs or profile.names != self.names:
+                raise ValueError("Profiles do not share the same frequency grid")
+
+        self.configs = list(itertools.product(*self.knobs))
+        self.index = {config: i for i, config in enumerate(self.configs)}
+
+        self.throughput = np.stack([fps_od.throughput, fps_p.throughput, tps.throughput])
+        # The system power is read from the decode table, as in the notebook
+        self.power = tps.power
+        self.max_index = self.index[tuple(knob[-1] for knob in self.knobs)]
+        self.defaults = defaults
+
+        self._oracle = {}
+
+    @classmethod
+    def load(cls, colocated=False):
+        """The isolated profiles, or with `colocated` the joint profile of the tasks running together"""
+        paths = (FPS_OD_COLOCATED_PATH, FPS_P_COLOCATED_PATH, TPS_COLOCATED_PATH) if colocated else \
+            (FPS_OD_PERFORMANCE_PATH, FPS_P_PERFORMANCE_PATH, TPS_PERFORMANCE_PATH)
+        return cls(
+            Profile.load(paths[0], FPS_OD_MULTIPLIER),
+            Profile.load(paths[1], FPS_P_MULTIPLIER),
+            Profile.load(paths[2], TPS_MULTIPLIER),
+            defaults=[
+                Profile.load_default(FPS_OD_PERFORMANCE_DEFAULT_PATH, FPS_OD_MULTIPLIER),
+                Profile.load_default(FPS_P_PERFORMANCE_DEFAULT_PATH, FPS_P_MULTIPLIER),
+                Profile.load_default(TPS_PERFORMANCE_DEFAULT_PATH, TPS_MULTIPLIER),
+            ],
+        )
+
+    def oracle(self, required):
+        """Index of the min-power config meeting all SLOs, or None if nothing does"""
+        required = tuple(required)
+        if required not in self._oracle:
+            feasible = np.flatnonzero(np.all(self.throughput >= np.asarray(required, dtype=float)[:, None], axis=0))
+            self._oracle[required] = int(feasible[np.argmin(self.power[feasible])]) if feasible.size else None
+        return self._oracle[required]
+
+    def precompute_oracle(self, traces):
+        for required in set(zip(*traces)):
+            self.oracle(required)
+
+def load_traces():
+    return [load_json(FPS_OD_TRACE_PATH), load_json(FPS_P_TRACE_PATH), load_json(TPS_TRACE_PATH)]
+
+def synthetic_traces(traces, length, seed=0):
+    """Resamples whole SLO tuples from the recorded traces into a trace of the given length"""
+    rng = np.random.default_rng(seed)
+    steps = rng.integers(0, len(traces[0]), size=length)
+    return [[trace[i] for i in steps] for trace in traces]
+
+def transition_latency_from_settle(path):
+    """Median settle time of the transitions a profiler recorded in <config>-settle.json"""
+    seconds = [record["seconds"] for record in load_json(path).values() if "seconds" in record]
+    return float(np.median(seconds)) if seconds else 0.0
+
+def in_effect(selected, values, transition_latency, step_period):
+    """values (..., n configs) averaged over each step, with every config taking over
+    `transition_latency` seconds after the step it was chosen in begins"""
+    delay = transition_latency / step_period
+    whole = int(np.floor(delay))
+    fraction = delay - whole
+    steps = np.arange(len(selected))
+    current = selected[np.maximum(steps - whole, 0)]
+    previous = selected[np.maximum(steps - whole - 1, 0)]
+    return (1 - fraction) * values[..., current] + fraction * values[..., previous]
+
+def replay(controller, env, traces, step_period=1.0, bootstrap=True, transition_latency=0.0):
+    """Replays the SLO traces through a controller exposing tell() and, optionally, update_config().
+
+    With `bootstrap`, the first two steps probe the min and max config as in the notebook.
+    With `transition_latency`, a new config only takes over that many seconds after its step
+    begins, and throughput and power are averaged over the configs in effect during each step.
+    Returns (metrics, per-step records)."""
+    traces = [np.asarray(trace, dtype=float) for trace in traces]
+    n_steps = len(traces[0])
+    env.precompute_oracle(traces)
+    update = getattr(controller, "update_config", None)
+
+    selected = np.empty(n_steps, dtype=int)
+    tell_seconds = np.zeros(n_steps)
+    update_seconds = 0.0
+
+    start = time.perf_counter()
+    for i in range(n_steps):
+        required = (traces[0][i], traces[1][i], traces[2][i])
+        if bootstrap and i == 0:
+            config = tuple(knob[0] for knob in env.knobs)
+        elif bootstrap and i == 1:
+            config = tuple(knob[-1] for knob in env.knobs)
+        else:
+            t0 = time.perf_counter()
+            config = controller.tell(*required)
+            tell_seconds[i] = time.perf_counter() - t0
+
+        idx = env.index[tuple(config[:len(env.knobs)])]
+        selected[i] = idx
+
+        if update is not None:
+            t0 = time.perf_counter()
+            update(env.configs[idx], *env.throughput[:, idx], env.power[idx])
+            update_seconds += time.perf_counter() - t0
+    wall_seconds = time.perf_counter() - start
+
+    required = np.stack(traces)
+    achieved = in_effect(selected, env.throughput, transition_latency, step_period)
+    power = in_effect(selected, env.power, transition_latency, step_period)
+    miss = achieved < required
+    # Steps where some SLO rises: the ones a late transition misses
+    onset = np.concatenate([[False], np.any(np.diff(required, axis=1) > 0, axis=0)])
+
+    oracle = [env.oracle(r) for r in zip(*traces)]
+    has_oracle = np.array([o is not None for o in oracle])
+    oracle_power = np.array([env.power[o] if o is not None else np.nan for o in oracle])
+
+    n_decisions = n_steps - (2 if bootstrap else 0)
+    total_tell = tell_seconds.sum()
+    metrics = {
+        "steps": n_steps,
+        "slo_miss": {name: float(miss[w].mean()) for w, name in enumerate(WORKLOADS)},
+        "slo_miss_any": float(miss.any(axis=0).mean()),
+        "average_power": float(power.mean()),
+        "energy": float(power.sum() * step_period),
+        "oracle_average_power": float(np.nanmean(oracle_power)) if has_oracle.any() else None,
+        "oracle_energy": float(np.nansum(oracle_power) * step_period),
+        "oracle_infeasible_steps": int((~has_oracle).sum()),
+        "max_average_power": float(env.power[env.max_index]),
+        "transitions": int(np.count_nonzero(np.diff(selected))),
+        "transition_latency": transition_latency,
+        "onset_steps": int(onset.sum()),
+        "onset_miss": float(miss[:, onset].any(axis=0).mean()) if onset.any() else None,
+        "decisions_per_second": float(n_decisions / total_tell) if total_tell > 0 else None,
+        "tell_latency_mean": float(total_tell / n_decisions) if n_decisions > 0 else None,
+        "tell_latency_max": float(tell_seconds.max()),
+        "update_latency_mean": float(update_seconds / n_steps) if update is not None else None,
+        "steps_per_second": float(n_steps / wall_seconds) if wall_seconds > 0 else None,
+    }
+    if hasattr(controller, "cache_stats"):
+        metrics["decision_cache"] = controller.cache_stats()
+    if env.defaults is not None:
+        default_throughput = np.array([d[0] for d in env.defaults])[:, None]
+        metrics["default_slo_miss"] = {name: float((default_throughput[w] < required[w]).mean())
+                                       for w, name in enumerate(WORKLOADS)}
+        # The notebook reports the decode table's default power
+        metrics["default_average_power"] = float(env.defaults[2][1])
+
+    records = []
+    for i in range(n_steps):
+        idx = selected[i]
+        record = {
+            "step": i,
+            "required_fps_od": required[0][i],
+            "required_fps_p": required[1][i],
+            "required_tps": required[2][i],
+        }
+        for name, value in zip(env.names, env.configs[idx]):
+            record[knob_field(name)] = value
+        record.update({
+            "fps_od": achieved[0][i],
+            "fps_p": achieved[1][i],
+            "tps": achieved[2][i],
+            "power": power[i],
+            "oracle_power": oracle_power[i],
+            "miss": int(miss[:, i].any()),
+            "tell_latency": tell_seconds[i],
+        })
+        records.append(record)
+    return metrics, records
+
+def make_controller(args, env, period=None):
+    """The controller of --controller over the environment's knobs, behind a ProactiveController with --forecast"""
+    # Profiles over cpu, gpu[, emc] keep the frequency-list interface; any other knobs are passed by value
+    standard = list(env.names) == list(KNOBS[:len(env.names)])
+    grid = dict(emc_frequency_list=env.emc_list) if standard else dict(knobs=env.knobs)
+    if args.controller == "lut":
+        from LookupTableController import LookupTableController
+        controller = LookupTableController(env.cpu_list, env.gpu_list, *env.throughput, env.power, **grid)
+    else:
+        from DVFSController import DVFSController
+        controller = DVFSController(
+            env.cpu_list, env.gpu_list,
+            incremental=args.incremental,
+            max_history=args.max_history,
+            acquisition=args.acquisition,
+            beta=args.beta,
+            pof_threshold=args.pof_threshold,
+            cache_size=args.cache_size,
+            slo_quantum=args.slo_quantum,
+            update_tolerance=args.update_tolerance,
+            **grid,
+        )
+    if args.forecast:
+        from ProactiveController import ProactiveController
+        controller = ProactiveController(controller, args.forecast, lead=transition_latency(args) or 0.0,
+                                         period=period if period is not None else args.step_period,
+                                         z=args.forecast_z, hold=args.hold)
+    return controller
+
+def transition_latency(args):
+    """--transition-latency, or the median measured settle time of a --settle-file"""
+    if args.settle_file:
+        return transition_latency_from_settle(args.settle_file)
+    return args.transition_latency
+
+def write_csv(path, records):
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(records[0].keys()))
+        writer.writeheader()
+        writer.writerows(records)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay SLO traces through a DVFS controller")
+    parser.add_argument("--controller", choices=("bo", "lut"), default="bo",
+                        help="Bayesian optimisation (DVFSController) or profile lookup table (LookupTableController)")
+    parser.add_argument("--acquisition", choices=("greedy", "lcb", "cei"), default="greedy", help="DVFSController acquisition mode")
+    parser.add_argument("--beta", type=float, default=2.0)
+    parser.add_argument("--pof-threshold", type=float, default=0.9)
+    parser.add_argument("--incremental", action="store_true", help="Use incremental GP updates")
+    parser.add_argument("--max-history", type=int, default=None)
+    parser.add_argument("--cache-size", type=int, default=256, help="Decisions tell() memoises (0 disables the cache)")
+    parser.add_argument("--slo-quantum", type=float, nargs=3, default=None, metavar=("FPS_OD", "FPS_P", "TPS"),
+                        help="Round each SLO up to a multiple of its step (FPS, prefills/s, tokens/s; 0 keeps it) before the cache lookup")
+    parser.add_argument("--update-tolerance", type=float, default=None,
+                        help="Drop observations every model already predicts within this relative error")
+    parser.add_argument("--colocated", action="store_true",
+                        help="Replay against the co-located profile (profiler_colocated.py) instead of the isolated ones")
+    parser.add_argument("--synthetic", type=int, default=None, metavar="N",
+                        help="Replay an N-step trace resampled from the recorded one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--step-period", type=float, default=1.0, help="Seconds per trace step")
+    parser.add_argument("--transition-latency", type=float, default=0.0,
+                        help="Seconds a new configuration takes to be in effect")
+    parser.add_argument("--settle-file", default=None,
+                        help="Take --transition-latency as the median settle time in a profiler's <config>-settle.json")
+    parser.add_argument("--forecast", choices=("ewma", "ar", "changepoint"), default=None,
+                        help="Forecast the SLOs over the transition latency and act ahead of them (ProactiveController)")
+    parser.add_argument("--forecast-z", type=float, default=1.0, help="Std of headroom above the forecast mean")
+    parser.add_argument("--hold", type=int, default=None,
+                        help="Steps a lower SLO is held off (default: twice the forecast horizon)")
+    parser.add_argument("--output", default=None, help="Write metrics as JSON here (default: stdout)")
+    parser.add_argument("--csv", default=None, help="Write per-step records as CSV here")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = Environment.load(colocated=args.colocated)
+    traces = load_traces()
+    if args.synthetic is not None:
+        traces = synthetic_traces(traces, args.synthetic, args.seed)
+
+    controller = make_controller(args, env)
+    metrics, records = replay(controller, env, traces, step_period=args.step_period,
+                              transition_latency=transition_latency(args))
+
+    if args.csv:
+        write_csv(args.csv, records)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(metrics, file, indent=4)
+    else:
+        json.dump(metrics, sys.stdout, indent=4)
+        print()
+
+if __name__ == "__main__":
+    main()
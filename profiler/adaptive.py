@@ -0,0 +1,176 @@
+import itertools
+import json
+import warnings
+from pathlib import Path
+import numpy as np
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import RBF, ConstantKernel, WhiteKernel
+from store.ProfileStore import ProfileStore
+from sweep import Sweep, point_key
+
+DATASET_DIR = Path(__file__).parent.parent / "dataset"
+LOG_FLOOR = 1e-9
+
+def trace_levels(fname):
+    """Distinct non-zero SLO levels of a dataset/ trace"""
+    with open(DATASET_DIR / fname, 'r') as file:
+        return sorted(set(v for v in json.load(file) if v > 0))
+
+class AdaptiveSweep(Sweep):
+    """Active-learning sweep that measures the grid points the surrogates are least sure about.
+
+    The grid is the product of the knob `axes` (e.g. cpu and gpu frequencies, or the per-cluster
+    knobs of dvfs.knobs.KnobSpace), each axis scaled to [0, 1] for the surrogates.
+
+    Every output (latency and the three rail energies of each workload) is modelled by a GP on
+    the log scale, so the posterior std of the noise-free surface reads as relative error.
+    Kernel hyperparameters are re-optimised every `refit_every` points. The next point maximises that std,
+    weighted up near the predicted throughput-vs-power Pareto frontier and near the SLO levels.
+    The sweep stops once the largest std over the unmeasured points falls below `target_error`,
+    or after `max_points`. results() fills the unmeasured points of the grid with predictions,
+    in the result/final schema.
+
+    outputs maps each output name to its throughput multiplier (throughput = multiplier / latency),
+    slo_levels each output name to the throughput levels the controller will be asked for.
+    """
+
+    def __init__(self, axes, outputs, slo_levels=None, target_error=0.05, max_points=None,
+                 repetitions=1, checkpoint=None, pareto_weight=1.0, slo_weight=1.0, refit_every=5,
+                 warmup=0, ci_width=None, confidence=0.95, max_repetitions=10):
+        self.axes = [list(axis) for axis in axes]
+        super().__init__(itertools.product(*self.axes), repetitions, checkpoint,
+                         warmup, ci_width, confidence, max_repetitions, ci_outputs=list(outputs))
+
+        self.outputs = outputs
+        self.slo_levels = slo_levels or {}
+        self.target_error = target_error
+        self.max_points = max_points if max_points is not None else len(self.points)
+        self.pareto_weight = pareto_weight
+        self.slo_weight = slo_weight
+        self.refit_every = refit_every
+        self.kernels = {}
+
+        points = np.array(self.points, dtype=float)
+        self.X = (points - points.min(axis=0)) / np.maximum(np.ptp(points, axis=0), 1.0)
+        self.mean = {}
+        self.std = {}
+        self.error = np.inf
+
+    def initial_points(self):
+        """Grid corners and centre; beyond three knobs, the lowest and highest corners, the centre and
+        the centre with each knob in turn at its extremes, so the design grows linearly with the knobs"""
+        centre = tuple(axis[len(axis) // 2] for axis in self.axes)
+        if len(self.axes) <= 3:
+            points = list(itertools.product(*[(axis[0], axis[-1]) for axis in self.axes])) + [centre]
+        else:
+            points = [tuple(axis[0] for axis in self.axes), tuple(axis[-1] for axis in self.axes), centre]
+            for d, axis in enumerate(self.axes):
+                for value in (axis[0], axis[-1]):
+                    points.append(centre[:d] + (value,) + centre[d + 1:])
+        return list(dict.fromkeys(points))
+
+    def measured(self):
+        return [i for i, point in enumerate(self.points) if self.complete(point_key(point))]
+
+    def fit(self):
+        """Refits the surrogates and returns the largest log-scale std over the unmeasured points"""
+        measured = self.measured()
+        unmeasured = np.setdiff1d(np.arange(len(self.points)), measured)
+        self.error = 0.0
+        for name in self.outputs:
+            table = self.measured_table(name)
+            # Floored so that a rail that drew nothing measurable stays finite on the log scale
+            y = np.log(np.maximum(np.array([table[point_key(self.points[i])] for i in measured]), LOG_FLOOR))
+            refit = name not in self.kernels or len(measured) % self.refit_every == 0
+            mean, std = [], []
+            for column in range(y.shape[1]):
+                if refit:
+                    kernel = ConstantKernel(1.0) * RBF([0.3] * self.X.shape[1], (1e-2, 1e2)) + WhiteKernel(1e-3, (1e-6, 1e-1))
+                    gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True, n_restarts_optimizer=2, random_state=0)
+                else:
+                    gp = GaussianProcessRegressor(kernel=self.kernels[name][column], normalize_y=True, optimizer=None)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", ConvergenceWarning)
+                    gp.fit(self.X[measured], y[:, column])
+                if refit:
+                    self.kernels.setdefault(name, [None] * y.shape[1])[column] = gp.kernel_
+
+                m, s = gp.predict(self.X, return_std=True)
+                # Drop the measurement noise: the error of interest is that of the surface itself
+                noise = gp.kernel_.k2.noise_level * gp._y_train_std ** 2
+                mean.append(m)
+                std.append(np.sqrt(np.clip(s ** 2 - noise, 0.0, None)))
+            self.mean[name] = np.array(mean)
+            self.std[name] = np.array(std)
+            if unmeasured.size:
+                self.error = max(self.error, float(self.std[name][:, unmeasured].max()))
+        return self.error
+
+    def acquisition(self):
+        """Score of every grid point; measured points score -inf"""
+        score = np.zeros(len(self.points))
+        for name, multiplier in self.outputs.items():
+            mean, std = self.mean[name], self.std[name]
+            sigma = std.max(axis=0)
+
+            # Log throughput and log power (the rail energies summed over the latency)
+            throughput = np.log(multiplier) - mean[0]
+            power = np.log(np.exp(mean[1:]).sum(axis=0)) - mean[0]
+
+            # Near the frontier: not dominated by a margin of two posterior std
+            dominated = np.zeros(len(self.points), dtype=bool)
+            for i in range(len(self.points)):
+                dominated[i] = np.any((throughput >= throughput[i] + 2 * sigma[i]) & (power <= power[i] - 2 * sigma[i]))
+            weight = 1.0 + self.pareto_weight * ~dominated
+
+            levels = np.log(np.asarray(self.slo_levels.get(name, []), dtype=float))
+            levels = levels[np.isfinite(levels)]
+            if levels.size:
+                near_slo = np.any(np.abs(throughput[:, None] - levels[None, :]) <= 2 * sigma[:, None], axis=1)
+                weight = weight + self.slo_weight * near_slo
+
+            score = np.maximum(score, sigma * weight)
+
+        score[self.measured()] = -np.inf
+        return score
+
+    def run(self, set_point, measure):
+        """Measures the initial design, then the most informative point until the surface is accurate enough"""
+        for point in self.initial_points():
+            self.measure_point(point, set_point, measure)
+
+        while len(self.measured()) < min(self.max_points, len(self.points)):
+            error = self.fit()
+            print("Adaptive sweep:", len(self.measured()), "points, max relative std", round(error, 4))
+            if error <= self.target_error:
+                break
+            point = self.points[int(np.argmax(self.acquisition()))]
+            self.measure_point(point, set_point, measure)
+        self.fit()
+
+    def measured_table(self, name):
+        return Sweep.results(self, name)
+
+    def results(self, name):
+        """Measured means where available and surrogate predictions elsewhere, over the whole grid.
+
+        Outputs without a surrogate (e.g. frame statistics) are returned as measured."""
+        table = self.measured_table(name)
+        if name not in self.outputs:
+            return table
+        result = {}
+        for i, point in enumerate(self.points):
+            key = point_key(point)
+            if key in table:
+                result[key] = table[key]
+            else:
+                result[key] = tuple(float(v) for v in np.exp(self.mean[name][:, i]))
+        return result
+
+    def write_store(self, name, fname, **meta):
+        """The whole grid of results() as a ProfileStore, one repetition per point: the measured
+        mean or the surrogate prediction. meta["measured"] lists the measured points"""
+        meta.setdefault("workload", name)
+        meta.setdefault("measured", sorted(self.measured_table(name)))
+        ProfileStore.fromTable(self.results(name), **meta).save(fname)
@@ -0,0 +1,80 @@
+"""Device backends behind the DVFS and power-measurement layers.
+
+Everything that touches `/sys` goes through the current backend: the real
+`SysfsBackend` by default, or the `SimulatedBackend` from device/simulated.py
+to run the profilers, the power logger and the controller off-device.
+"""
+import glob
+import os
+import time
+
+class FileNode:
+    """A sysfs node kept open and accessed with pread/pwrite"""
+
+    def __init__(self, fname, writable=False, truncate=False):
+        self.fname = fname
+        self.fd = os.open(fname, os.O_RDWR if writable else os.O_RDONLY)
+        self.truncate = truncate
+
+    def read(self):
+        return os.pread(self.fd, 64, 0).decode().strip()
+
+    def write(self, value):
+        data = str(value).encode()
+        os.pwrite(self.fd, data, 0)
+        if self.truncate:
+            os.ftruncate(self.fd, len(data))
+
+    def close(self):
+        os.close(self.fd)
+
+class SysfsBackend:
+    """The real device, optionally relocated under `root` (e.g. a tree from fakesys.makeFakeSysfs)"""
+
+    speedup = 1.0
+
+    def __init__(self, root="/"):
+        self.root = root
+        # Writes into a fake tree of regular files must drop the previous, possibly longer, value
+        self.truncate = os.path.realpath(root) != "/"
+
+    def path(self, fname):
+        return os.path.join(self.root, fname.lstrip("/"))
+
+    def open(self, fname, writable=False):
+        return FileNode(self.path(fname), writable, self.truncate)
+
+    def read(self, fname):
+        with open(self.path(fname), 'r') as f:
+            return f.read().strip()
+
+    def write(self, fname, value):
+        with open(self.path(fname), 'w') as f:
+            f.write(str(value))
+
+    def exists(self, fname):
+        return os.path.exists(self.path(fname))
+
+    def glob(self, pattern):
+        """Matches pattern inside the tree and returns device paths (without the root)"""
+        prefix = os.path.join(self.root, "")
+        return sorted("/" + os.path.relpath(p, prefix) for p in glob.glob(self.path(pattern)))
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+_backend = SysfsBackend()
+
+def getBackend():
+    return _backend
+
+def setBackend(backend):
+    """Routes every subsequent DVFS and power-logger access through backend"""
+    global _backend
+    _backend = backend
@@ -0,0 +1,322 @@
+"""A simulated Jetson AGX Orin driven by the recorded profiles in result/final.
+
+The backend exposes the same frequency nodes and INA3221 rails as the real
+device. Rail power and workload latency are synthesised from the profiles at
+the frequencies currently in effect, frequency changes take effect after a
+configurable transition delay, and both can be perturbed with noise. Time runs
+on a simulated clock `speedup` times faster than the wall clock.
+"""
+import fnmatch
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from store.ProfileStore import ProfileStore, KNOBS
+from dvfs.knobs import parseKnob
+
+RESULT_DIR = Path(__file__).resolve().parent.parent.parent / "result" / "final"
+WORKLOADS = ("yolov8-640", "gemma-3-4B-prefill", "gemma-3-4B-decode")
+
+AGX_ORIN_POLICIES = {0: [0, 1, 2, 3], 4: [4, 5, 6, 7], 8: [8, 9, 10, 11]}
+CPUFREQ_DIR = "/sys/devices/system/cpu/cpufreq"
+GPU_DEVFREQ_DIR = "/sys/devices/platform/17000000.gpu/devfreq/17000000.gpu"
+EMC_CLK_DIR = "/sys/kernel/debug/bpmp/debug/clk/emc"
+EMC_CAP_FNAME = "/sys/kernel/nvpmodel_clk_cap/emc"
+# INA3221 (i2c address, hwmon index, channel) of the GPU, CPU and DDR rails, as in AGXPowerLogger
+RAILS = [('0040', '0', '1'), ('0040', '0', '2'), ('0041', '1', '2')]
+RAIL_VOLTAGE = 5000  # mV
+# Shortest wall-clock sleep of a streamed workload part; shorter parts are slept together
+MIN_SLEEP = 1e-3
+
+class SimNode:
+    """A node of the simulated tree; mirrors FileNode"""
+
+    def __init__(self, backend, fname):
+        self.backend = backend
+        self.fname = fname
+
+    def read(self):
+        return self.backend.read(self.fname)
+
+    def write(self, value):
+        self.backend.write(self.fname, value)
+
+    def close(self):
+        pass
+
+class Clock:
+    """Frequency knob whose current value follows its target after a transition delay"""
+
+    def __init__(self, freq, delay):
+        self.min = self.max = self.cur = freq
+        self.delay = delay
+        self.target = freq
+        self.changed_at = 0.0
+
+    def current(self, now):
+        if self.cur != self.target and now - self.changed_at >= self.delay:
+            self.cur = self.target
+        return self.cur
+
+    def retarget(self, now):
+        target = self.max if self.min <= self.max else self.min
+        if target != self.target:
+            self.current(now)
+            self.target = target
+            self.changed_at = now
+
+class SimulatedBackend:
+    """Simulated device backend.
+
+    profiles maps workload name to a {"cpu:gpu": [latency, gpu, cpu, memory energy]} table, or
+    {"cpu:gpu:emc": ...} for profiles swept over the memory clock; `knobs` names the key parts
+    (default: cpu, gpu, emc as in ProfileStore), e.g. per-cluster "cpu4"/"cores4" knobs.
+    A profile over the single "cpu" knob is looked up at the mean frequency over all cores,
+    offline cores counting as zero, so downclocking or parking clusters shows up as a slower CPU.
+    transitionDelay is the simulated time a frequency change takes to be in effect, noise the
+    relative standard deviation applied to synthesised latency and rail power.
+    """
+
+    def __init__(self, profiles, transitionDelay=0.0, noise=0.0, speedup=1.0, idlePower=None,
+                 policies=AGX_ORIN_POLICIES, seed=None, knobs=None):
+        self.speedup = speedup
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.tables = {}
+        for name, table in profiles.items():
+            self.tables[name] = {tuple(int(v) for v in k.split(":")): v for k, v in table.items()}
+        keys = next(iter(self.tables.values())).keys()
+        self.knobs = list(knobs) if knobs is not None else list(KNOBS[:len(next(iter(keys)))])
+        self.axes = {name: sorted({k[i] for k in keys}) for i, name in enumerate(self.knobs)}
+        if "cpu" in self.axes:
+            self.cpu_list = self.axes["cpu"]
+        else:
+            self.cpu_list = sorted({f for name in self.knobs if parseKnob(name)[0] == "cluster" for f in self.axes[name]})
+        self.gpu_list = self.axes["gpu"]
+        self.emc_list = self.axes.get("emc")
+
+        # Power of each rail in uW (mV * mA), as logged by AGXPowerLogger
+        if idlePower is None:
+            idlePower = [min(v[r + 1] / v[0] for t in self.tables.values() for v in t.values()) for r in range(3)]
+        self.idlePower = list(idlePower)
+        self.active = {}
+        self.nextRun = 0
+
+        self.policies = policies
+        self.cpuPolicy = {cpu: policy for policy, cpus in policies.items() for cpu in cpus}
+        self.cpu = {policy: Clock(self.cpu_list[-1], transitionDelay) for policy in policies}
+        self.gpu = Clock(self.gpu_list[-1], transitionDelay)
+        self.emc = Clock(self.emc_list[-1] if self.emc_list else 3199000000, transitionDelay)
+        self.online = {cpu: 1 for cpu in self.cpuPolicy}
+
+        self.epoch = time.time()
+        self.start = time.monotonic()
+
+    @classmethod
+    def fromResults(cls, directory=RESULT_DIR, workloads=WORKLOADS, **kwargs):
+        profiles = {}
+        for name in workloads:
+            store = Path(directory) / (name + ".npz")
+            if store.exists():
+                store = ProfileStore.load(store)
+                profiles[name] = store.toTable()
+                kwargs.setdefault("knobs", store.knobs)
+                continue
+            with open(Path(directory) / (name + ".json"), 'r') as f:
+                profiles[name] = json.load(f)
+        return cls(profiles, **kwargs)
+
+    # Clock
+
+    def monotonic(self):
+        return (time.monotonic() - self.start) * self.speedup
+
+    def time(self):
+        return self.epoch + self.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speedup)
+
+    # Workloads
+
+    def lookup(self, name):
+        """Profile entry of a workload at the frequencies currently in effect (nearest grid point)"""
+        now = self.monotonic()
+        key = []
+        for knob in self.knobs:
+            value = self.knobValue(knob, now)
+            key.append(min(self.axes[knob], key=lambda v: abs(v - value)))
+        return self.tables[name][tuple(key)]
+
+    def knobValue(self, knob, now):
+        kind, policy = parseKnob(knob)
+        if kind == "cpu":
+            # Each online core contributes its cluster's frequency, an offline one nothing
+            capacity = sum(self.online[c] * self.cpu[p].current(now) for p, cpus in self.policies.items() for c in cpus)
+            return capacity / len(self.cpuPolicy)
+        if kind == "cluster":
+            return self.cpu[policy].current(now)
+        if kind == "cores":
+            return sum(self.online[c] for c in self.policies[policy])
+        return self.gpu.current(now) if kind == "gpu" else self.emc.current(now)
+
+    def perturb(self, value):
+        if self.noise <= 0:
+            return value
+        return max(value * self.random.gauss(1.0, self.noise), 0.0)
+
+    def runWorkload(self, name):
+        """Runs one iteration of a profiled workload on the simulated clock and returns its latency"""
+        entry = self.lookup(name)
+        return self.occupy(entry, self.perturb(entry[0]))
+
+    def streamWorkload(self, name, frames):
+        """Runs one iteration of a profiled workload as `frames` equal parts, yielding the latency of each.
+
+        Each part ends at the cumulative deadline of the parts so far rather than sleeping its own
+        latency, and parts shorter than MIN_SLEEP of wall time are slept together, so sleep
+        granularity and the caller's per-part overhead do not add up over the run."""
+        deadline = self.monotonic()
+        with self.drawing() as power:
+            for i in range(frames):
+                entry = self.lookup(name)
+                power[:] = self.railDraw(entry)
+                latency = self.perturb(entry[0] / frames)
+                deadline += latency
+                remaining = deadline - self.monotonic()
+                if remaining >= MIN_SLEEP * self.speedup or (i == frames - 1 and remaining > 0):
+                    self.sleep(remaining)
+                yield latency
+
+    def occupy(self, entry, latency):
+        """Draws the workload's power on the rails for `latency` simulated seconds"""
+        with self.drawing(self.railDraw(entry)):
+            self.sleep(latency)
+        return latency
+
+    def railDraw(self, entry):
+        return [entry[r + 1] / entry[0] for r in range(3)]
+
+    @contextmanager
+    def drawing(self, power=None):
+        """Draws `power` (per rail, updated in place) on the rails while the block runs"""
+        power = power if power is not None else list(self.idlePower)
+        with self.lock:
+            run = self.nextRun
+            self.nextRun += 1
+            self.active[run] = power
+        try:
+            yield power
+        finally:
+            with self.lock:
+                del self.active[run]
+
+    def railPower(self, rail):
+        with self.lock:
+            extra = sum(max(p[rail] - self.idlePower[rail], 0.0) for p in self.active.values())
+        return self.perturb(self.idlePower[rail] + extra)
+
+    # Nodes
+
+    def open(self, fname, writable=False):
+        self.resolve(fname)
+        return SimNode(self, fname)
+
+    def exists(self, fname):
+        try:
+            self.resolve(fname)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def glob(self, pattern):
+        return sorted(p for p in self.listPaths() if fnmatch.fnmatch(p, pattern))
+
+    def listPaths(self):
+        paths = []
+        for policy in self.policies:
+            paths.append("%s/policy%d" % (CPUFREQ_DIR, policy))
+        for cpu in self.cpuPolicy:
+            paths.append("/sys/devices/system/cpu/cpu%d" % cpu)
+        paths.append(GPU_DEVFREQ_DIR)
+        paths.append(EMC_CLK_DIR)
+        for addr, index, channel in RAILS:
+            paths.append("/sys/bus/i2c/drivers/ina3221/1-%s/hwmon/hwmon%s" % (addr, index))
+        return paths
+
+    def resolve(self, fname):
+        """Maps a device path to (kind, key, attribute)"""
+        m = re.fullmatch(CPUFREQ_DIR + r"/policy(\d+)/(\w+)", fname)
+        if m and int(m.group(1)) in self.policies:
+            return "cpu", int(m.group(1)), m.group(2)
+        m = re.fullmatch(r"/sys/devices/system/cpu/cpu(\d+)/cpufreq/(\w+)", fname)
+        if m and int(m.group(1)) in self.cpuPolicy:
+            return "cpu", self.cpuPolicy[int(m.group(1))], m.group(2)
+        m = re.fullmatch(r"/sys/devices/system/cpu/cpu(\d+)/online", fname)
+        if m and int(m.group(1)) in self.cpuPolicy:
+            return "online", int(m.group(1)), None
+        m = re.fullmatch(GPU_DEVFREQ_DIR + r"/(\w+)", fname)
+        if m:
+            return "gpu", None, m.group(1)
+        m = re.fullmatch(EMC_CLK_DIR + r"/(\w+)", fname)
+        if m:
+            return "emc", None, m.group(1)
+        if fname == EMC_CAP_FNAME:
+            return "emc", None, "cap"
+        m = re.fullmatch(r"/sys/bus/i2c/drivers/ina3221/1-(\w+)/hwmon/hwmon(\d+)/(in|curr)(\d+)_input", fname)
+        if m and (m.group(1), m.group(2), m.group(4)) in RAILS:
+            return "rail", RAILS.index((m.group(1), m.group(2), m.group(4))), m.group(3)
+        raise FileNotFoundError(fname)
+
+    def read(self, fname):
+        kind, key, attr = self.resolve(fname)
+        now = self.monotonic()
+        if kind == "rail":
+            if attr == "in":
+                return str(RAIL_VOLTAGE)
+            return str(int(round(self.railPower(key) / RAIL_VOLTAGE)))
+        if kind == "online":
+            return str(self.online[key])
+
+        clock = self.cpu[key] if kind == "cpu" else self.gpu if kind == "gpu" else self.emc
+        if attr in ("scaling_min_freq", "min_freq"):
+            return str(clock.min)
+        if attr in ("scaling_max_freq", "max_freq", "cap"):
+            return str(clock.max)
+        if attr in ("scaling_cur_freq", "cpuinfo_cur_freq", "cur_freq", "rate"):
+            return str(clock.current(now))
+        if attr == "related_cpus":
+            return " ".join(str(c) for c in self.policies[key])
+        if attr in ("scaling_available_frequencies", "available_frequencies"):
+            return " ".join(str(f) for f in (self.cpu_list if kind == "cpu" else self.gpu_list))
+        if attr in ("mrq_rate_locked", "state"):
+            return "1"
+        raise FileNotFoundError(fname)
+
+    def write(self, fname, value):
+        kind, key, attr = self.resolve(fname)
+        now = self.monotonic()
+        value = int(str(value).strip())
+        if kind == "online":
+            self.online[key] = value
+            return
+        if kind == "rail":
+            raise PermissionError(fname)
+
+        clock = self.cpu[key] if kind == "cpu" else self.gpu if kind == "gpu" else self.emc
+        if attr in ("scaling_min_freq", "min_freq"):
+            clock.min = value
+        elif attr in ("scaling_max_freq", "max_freq", "cap"):
+            clock.max = value
+        elif attr == "rate":
+            clock.min = clock.max = value
+        elif attr in ("mrq_rate_locked", "state"):
+            return
+        else:
+            raise PermissionError(fname)
+        clock.retarget(now)
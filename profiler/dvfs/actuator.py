@@ -0,0 +1,268 @@
+import re
+import time
+from collections import deque
+from device.backend import SysfsBackend, getBackend
+from dvfs.knobs import parseKnob
+
+CPUFREQ_DIR = "/sys/devices/system/cpu/cpufreq"
+GPU_DEVFREQ_DIR = "/sys/devices/platform/17000000.gpu/devfreq/17000000.gpu"
+EMC_CLK_DIR = "/sys/kernel/debug/bpmp/debug/clk/emc"
+EMC_CAP_FNAME = "/sys/kernel/nvpmodel_clk_cap/emc"
+
+class Knob:
+	"""A min/max frequency pair written through kept-open nodes"""
+
+	def __init__(self, backend, name, min_fname, max_fname, cur_fname):
+		self.name = name
+		self.min_node = backend.open(min_fname, writable=True)
+		self.max_node = backend.open(max_fname, writable=True)
+		self.cur_node = backend.open(cur_fname)
+
+		# The only reads of the min/max nodes; from here on the state is tracked
+		self.min = int(self.min_node.read())
+		self.max = int(self.max_node.read())
+
+	def set(self, freq):
+		"""Pins the knob at freq, ordering the writes so that min <= max holds throughout"""
+		if freq == self.min and freq == self.max:
+			return False
+
+		if freq >= self.min:
+			self.max_node.write(freq)
+			self.min_node.write(freq)
+		else:
+			self.min_node.write(freq)
+			self.max_node.write(freq)
+		self.min = self.max = freq
+		return True
+
+	def current(self):
+		return int(self.cur_node.read())
+
+	def close(self):
+		for node in (self.min_node, self.max_node, self.cur_node):
+			node.close()
+
+class CoreKnob:
+	"""The number of online cores of a cluster, written through kept-open hotplug nodes.
+
+	Setting n keeps the cluster's first n cores online; cores without an online node
+	(usually cpu0) cannot be taken offline."""
+
+	def __init__(self, backend, cpus):
+		self.nodes = []
+		self.fixed = 0
+		for cpu in cpus:
+			fname = "/sys/devices/system/cpu/cpu{:d}/online".format(cpu)
+			if backend.exists(fname):
+				self.nodes.append(backend.open(fname, writable=True))
+			elif self.nodes:
+				raise ValueError("cpu{:d} has no hotplug node but follows cores that do".format(cpu))
+			else:
+				self.fixed += 1
+		self.size = len(cpus)
+		self.online = [int(node.read()) for node in self.nodes]
+
+	@property
+	def count(self):
+		return self.fixed + sum(self.online)
+
+	def set(self, count):
+		if count < self.fixed or count > self.size:
+			raise ValueError("Cannot keep {:d} of {:d} cores online".format(count, self.size))
+		changed = False
+		for i, node in enumerate(self.nodes):
+			online = 1 if self.fixed + i < count else 0
+			if online != self.online[i]:
+				node.write(online)
+				self.online[i] = online
+				changed = True
+		return changed
+
+	def current(self):
+		return self.fixed + sum(int(node.read()) for node in self.nodes)
+
+	def close(self):
+		for node in self.nodes:
+			node.close()
+
+class DVFSActuator:
+	"""Sets CPU/GPU/EMC frequencies through sysfs nodes opened once.
+
+	CPU frequencies are written once per cpufreq policy (cluster) rather than per
+	core, the current setting is tracked instead of re-read before each change, and
+	the latency of every transition is recorded. Clusters can also be clocked and
+	hotplugged individually (setClusterFreq, setOnlineCores), or all knobs set by
+	name as in dvfs.knobs.KnobSpace. The nodes come from `backend`
+	(default: the current device backend); `root` is a shortcut for a SysfsBackend
+	relocated to e.g. a fake tree built by fakesys.makeFakeSysfs().
+	"""
+
+	def __init__(self, root=None, emc=False, history=4096, backend=None):
+		if backend is None:
+			backend = SysfsBackend(root) if root is not None else getBackend()
+		self.backend = backend
+
+		self.policies = {}
+		self.cores = {}
+		for path in sorted(backend.glob(CPUFREQ_DIR + "/policy*"), key=policyNumber):
+			self.policies[policyNumber(path)] = Knob(
+				backend,
+				path.rsplit("/", 1)[-1],
+				path + "/scaling_min_freq",
+				path + "/scaling_max_freq",
+				path + "/scaling_cur_freq",
+			)
+			cpus = [int(cpu) for cpu in backend.read(path + "/related_cpus").split()]
+			self.cores[policyNumber(path)] = CoreKnob(backend, cpus)
+
+		self.gpu = Knob(
+			backend,
+			"gpu",
+			GPU_DEVFREQ_DIR + "/min_freq",
+			GPU_DEVFREQ_DIR + "/max_freq",
+			GPU_DEVFREQ_DIR + "/cur_freq",
+		)
+
+		self.emc = None
+		if emc:
+			self.emc = EmcKnob(backend)
+
+		self.latencies = deque(maxlen=history)
+
+	def getCurStatus(self):
+		"""Tracked (cpu, gpu, emc) frequencies; cpu is the first policy's setting"""
+		cpu = next(iter(self.policies.values())).max if self.policies else None
+		emc = self.emc.rate if self.emc is not None else None
+		return cpu, self.gpu.max, emc
+
+	def readCurStatus(self):
+		"""Frequencies the hardware currently runs at, read through the kept-open cur nodes"""
+		cpu = next(iter(self.policies.values())).current() if self.policies else None
+		emc = self.emc.current() if self.emc is not None else None
+		return cpu, self.gpu.current(), emc
+
+	def setCpuFreq(self, cpuFreq):
+		"""Sets every CPU cluster to cpuFreq"""
+		changed = False
+		for knob in self.policies.values():
+			changed |= knob.set(cpuFreq)
+		return changed
+
+	def setClusterFreq(self, policy, cpuFreq):
+		"""Sets the cluster of one cpufreq policy to cpuFreq"""
+		return self.policies[policy].set(cpuFreq)
+
+	def setOnlineCores(self, policy, count):
+		"""Keeps the first `count` cores of one cluster online and takes the rest offline"""
+		return self.cores[policy].set(count)
+
+	def setGpuFreq(self, gpuFreq):
+		return self.gpu.set(gpuFreq)
+
+	def setEmcFreq(self, emcFreq):
+		if self.emc is None:
+			raise RuntimeError("EMC control was not enabled for this actuator")
+		return self.emc.set(emcFreq)
+
+	def getKnob(self, name):
+		"""Tracked setting of a named knob (see dvfs.knobs)"""
+		kind, policy = parseKnob(name)
+		if kind == "cpu":
+			return next(iter(self.policies.values())).max
+		if kind == "cluster":
+			return self.policies[policy].max
+		if kind == "cores":
+			return self.cores[policy].count
+		if kind == "gpu":
+			return self.gpu.max
+		if self.emc is None:
+			raise RuntimeError("EMC control was not enabled for this actuator")
+		return self.emc.rate
+
+	def setKnob(self, name, value):
+		kind, policy = parseKnob(name)
+		if kind == "cpu":
+			return self.setCpuFreq(value)
+		if kind == "cluster":
+			return self.setClusterFreq(policy, value)
+		if kind == "cores":
+			return self.setOnlineCores(policy, value)
+		if kind == "gpu":
+			return self.setGpuFreq(value)
+		return self.setEmcFreq(value)
+
+	def setDVFS(self, conf, names=None):
+		"""Applies a (cpu, gpu) or (cpu, gpu, emc) configuration, or one value per knob of `names`,
+		and records its latency"""
+		status = self.getCurStatus if names is None else lambda: tuple(self.getKnob(name) for name in names)
+		before = status()
+		t0 = time.perf_counter()
+
+		if names is None:
+			changed = self.setCpuFreq(conf[0])
+			changed |= self.setGpuFreq(conf[1])
+			if len(conf) > 2 and conf[2] is not None:
+				changed |= self.setEmcFreq(conf[2])
+		else:
+			changed = False
+			for name, value in zip(names, conf):
+				changed |= self.setKnob(name, value)
+
+		elapsed = time.perf_counter() - t0
+		if changed:
+			self.latencies.append((self.backend.time(), before, status(), elapsed))
+		return elapsed
+
+	def getLatencies(self):
+		"""(timestamp, from, to, seconds) of the recorded transitions"""
+		return list(self.latencies)
+
+	def close(self):
+		for knob in self.policies.values():
+			knob.close()
+		for knob in self.cores.values():
+			knob.close()
+		self.gpu.close()
+		if self.emc is not None:
+			self.emc.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+class EmcKnob:
+	"""The BPMP debugfs EMC clock, capped through nvpmodel as in lib.setEmcFreq"""
+
+	def __init__(self, backend):
+		self.rate_node = backend.open(EMC_CLK_DIR + "/rate", writable=True)
+		self.cap_node = backend.open(EMC_CAP_FNAME, writable=True)
+
+		for fname in ("mrq_rate_locked", "state"):
+			backend.write(EMC_CLK_DIR + "/" + fname, 1)
+
+		self.rate = int(self.rate_node.read())
+
+	def set(self, emcFreq):
+		if emcFreq == self.rate:
+			return False
+
+		first, second = self.cap_node, self.rate_node
+		if emcFreq < self.rate:
+			first, second = self.rate_node, self.cap_node
+		first.write(emcFreq)
+		second.write(emcFreq)
+		self.rate = emcFreq
+		return True
+
+	def current(self):
+		return int(self.rate_node.read())
+
+	def close(self):
+		self.rate_node.close()
+		self.cap_node.close()
+
+def policyNumber(path):
+	return int(re.search(r"policy(\d+)$", path).group(1))
@@ -0,0 +1,121 @@
+import itertools
+import re
+from dvfs import lib
+
+CLUSTER_STEPS = 4
+
+def parseKnob(name):
+	"""Splits a knob name into (kind, cpufreq policy or None)"""
+	if name in ("cpu", "gpu", "emc"):
+		return name, None
+	m = re.fullmatch(r"(cpu|cores)(\d+)", name)
+	if m is None:
+		raise ValueError("Unknown knob {!r}".format(name))
+	return ("cluster" if m.group(1) == "cpu" else "cores"), int(m.group(2))
+
+def evenlySpaced(values, steps):
+	"""`steps` values spread evenly over the ascending list, always including both ends"""
+	if steps >= len(values):
+		return list(values)
+	return sorted({values[round(i * (len(values) - 1) / (steps - 1))] for i in range(steps)})
+
+class KnobSpace:
+	"""The searchable knobs of a sweep or controller; a config is a tuple of values in knob order.
+
+	Knob names are "cpu" (every CPU cluster at one frequency), "cpu<policy>" (the frequency of
+	the cluster of one cpufreq policy), "cores<policy>" (how many of that cluster's cores are
+	online), "gpu" and "emc". Configs are applied through dvfs.lib, or through a DVFSActuator.
+	"""
+
+	def __init__(self, names, values):
+		if len(names) != len(values):
+			raise ValueError("Every knob needs its values")
+		for name in names:
+			parseKnob(name)
+		self.names = list(names)
+		self.values = [sorted(v) for v in values]
+
+	@classmethod
+	def standard(cls, cpu, gpu, emc=None):
+		"""One CPU frequency for every cluster, the GPU and, given its values, the memory clock"""
+		names, values = ["cpu", "gpu"], [cpu, gpu]
+		if emc is not None:
+			names.append("emc")
+			values.append(emc)
+		return cls(names, values)
+
+	@classmethod
+	def perCluster(cls, gpu, emc=None, frequencies=None, coreCounts=None, steps=CLUSTER_STEPS):
+		"""A frequency knob for every cluster discovered under cpufreq/policy*, then gpu (and emc).
+
+		frequencies: cluster frequencies to search (default: `steps` of each cluster's available ones).
+		coreCounts: online core counts to search per cluster, clipped to its size; a cluster is never
+		parked below one core. None leaves hotplug alone."""
+		names, values = [], []
+		for policy, cpus in lib.getCpuPolicies().items():
+			available = lib.getClusterFrequencies(policy)
+			if frequencies is None:
+				clusterFrequencies = evenlySpaced(available, steps)
+			else:
+				clusterFrequencies = sorted(f for f in frequencies if f in available)
+				if not clusterFrequencies:
+					raise ValueError("None of the frequencies is available on cluster policy{:d}".format(policy))
+			names.append("cpu{:d}".format(policy))
+			values.append(clusterFrequencies)
+
+			if coreCounts is not None:
+				counts = sorted({min(max(n, 1), len(cpus)) for n in coreCounts})
+				names.append("cores{:d}".format(policy))
+				values.append(counts)
+
+		names.append("gpu")
+		values.append(gpu)
+		if emc is not None:
+			names.append("emc")
+			values.append(emc)
+		return cls(names, values)
+
+	def configs(self):
+		"""Every config, the first knob varying slowest"""
+		return list(itertools.product(*self.values))
+
+	def fallback(self):
+		"""Every knob at its largest value: max frequencies, all cores online"""
+		return tuple(max(v) for v in self.values)
+
+	def apply(self, config, actuator=None):
+		"""Sets the knobs to config, through dvfs.lib or the given DVFSActuator"""
+		if actuator is not None:
+			return actuator.setDVFS(config, self.names)
+		for name, value in zip(self.names, config):
+			kind, policy = parseKnob(name)
+			if kind == "cpu":
+				lib.setCpu(value)
+			elif kind == "cluster":
+				lib.setCluster(policy, value)
+			elif kind == "cores":
+				lib.setOnlineCores(policy, value)
+			elif kind == "gpu":
+				lib.setGpu(value)
+			else:
+				lib.setEmc(value)
+
+	def read(self):
+		"""Values the knobs are currently at, in knob order"""
+		values = []
+		for name in self.names:
+			kind, policy = parseKnob(name)
+			if kind == "cpu":
+				values.append(lib.getCpuStatus())
+			elif kind == "cluster":
+				values.append(lib.getClusterStatus(policy))
+			elif kind == "cores":
+				values.append(lib.getOnlineCores(policy))
+			elif kind == "gpu":
+				values.append(lib.getGpuStatus())
+			else:
+				values.append(lib.getEmcStatus())
+		return tuple(values)
+
+	def describe(self, config):
+		return " ".join("{}: {}".format(name, value) for name, value in zip(self.names, config))
@@ -1,20 +1,52 @@
 # Reference: https://github.com/hongpeng-guo/BoFL
 
-def setCpuFreq(cpuFreq, cpuFreq_cur=0):
-	"""Set all ARM CPUs frequencies based on the given param"""
+import re
+from device.backend import getBackend
+
+CPUFREQ_DIR = "/sys/devices/system/cpu/cpufreq"
+
+# (backend, policies) of the last discovery; the clusters do not change while a backend is in use
+_policies = (None, None)
+
+def getCpuPolicies():
+	"""Discover the CPU clusters: {cpufreq policy number: [cpus sharing its clock]}, once per backend"""
+
+	global _policies
+	backend = getBackend()
+	if _policies[0] is backend:
+		return _policies[1]
+
+	policies = {}
+	for path in backend.glob(CPUFREQ_DIR + "/policy*"):
+		policy = int(re.search(r"policy(\d+)$", path).group(1))
+		policies[policy] = [int(cpu) for cpu in backend.read(path + "/related_cpus").split()]
+	_policies = (backend, dict(sorted(policies.items())))
+	return _policies[1]
+
+def getClusterFrequencies(policy):
+	"""Frequencies a CPU cluster supports, ascending"""
+
+	fname = CPUFREQ_DIR + "/policy{:d}/scaling_available_frequencies".format(policy)
+	return sorted(int(f) for f in getBackend().read(fname).split())
+
+def setClusterFreq(policy, cpuFreq, cpuFreq_cur=0):
+	"""Set the frequency of one CPU cluster, through its cpufreq policy"""
+
+	max_fname = CPUFREQ_DIR + "/policy{:d}/scaling_max_freq".format(policy)
+	min_fname = CPUFREQ_DIR + "/policy{:d}/scaling_min_freq".format(policy)
 
-	for i in [0, 1, 2, 3, 4, 5, 6, 7]:
-		max_fname = "/sys/devices/system/cpu/cpu{:d}/cpufreq/scaling_max_freq".format(i)
-		min_fname = "/sys/devices/system/cpu/cpu{:d}/cpufreq/scaling_min_freq".format(i)
-		
-		first, second = max_fname, min_fname
-		if cpuFreq < cpuFreq_cur:
-			first, second = min_fname, max_fname
+	first, second = max_fname, min_fname
+	if cpuFreq < cpuFreq_cur:
+		first, second = min_fname, max_fname
+
+	getBackend().write(first, str(cpuFreq))
+	getBackend().write(second, str(cpuFreq))
+
+def setCpuFreq(cpuFreq, cpuFreq_cur=0):
+	"""Set all ARM CPUs frequencies based on the given param, once per cluster"""
 
-		with open(first, 'w') as f:
-			f.write(str(cpuFreq))
-		with open(second, 'w') as f:
-			f.write(str(cpuFreq))
+	for policy in getCpuPolicies():
+		setClusterFreq(policy, cpuFreq, cpuFreq_cur)
 
 
 def setGpuFreq(gpuFreq, gpuFreq_cur=0):
@@ -27,10 +59,8 @@ def setGpuFreq(gpuFreq, gpuFreq_cur=0):
 	if gpuFreq < gpuFreq_cur:
 		first, second = min_fname, max_fname
 
-	with open(first, 'w') as f:
-		f.write(str(gpuFreq))
-	with open(second, 'w') as f:
-		f.write(str(gpuFreq))
+	getBackend().write(first, str(gpuFreq))
+	getBackend().write(second, str(gpuFreq))
 
 
 def setEmcFreq(emcFreq, emcFreq_cur=0):
@@ -41,19 +71,15 @@ def setEmcFreq(emcFreq, emcFreq_cur=0):
 	rate_fname =  "/sys/kernel/debug/bpmp/debug/clk/emc/rate"
 	cap_fname = "/sys/kernel/nvpmodel_clk_cap/emc"
 
-	with open(lock_fname, 'w') as f:
-		f.write('1')
-	with open(state_fname, 'w') as f:
-		f.write('1')
+	getBackend().write(lock_fname, '1')
+	getBackend().write(state_fname, '1')
 
 	first, second = cap_fname, rate_fname
 	if emcFreq < emcFreq_cur:
 		first, second = rate_fname, cap_fname
 
-	with open(first, 'w') as f:
-		f.write(str(emcFreq))
-	with open(second, 'w') as f:
-		f.write(str(emcFreq))
+	getBackend().write(first, str(emcFreq))
+	getBackend().write(second, str(emcFreq))
 
 def getcurStatus():
 	"""Get current system knob status, including cpu/gpu/memory freqs
@@ -64,12 +90,9 @@ def getcurStatus():
 	emcFreq_fname = "/sys/kernel/debug/bpmp/debug/clk/emc/rate"
 
 	cpuFreq, gpuFreq, emcFreq = None, None, None
-	with open(cpuFreq_fname, 'r') as f:
-		cpuFreq = int(f.read().strip('\n'))
-	with open(gpuFreq_fname, 'r') as f:
-		gpuFreq = int(f.read().strip('\n'))
-	with open(emcFreq_fname, 'r') as f:
-		emcFreq = int(f.read().strip('\n'))
+	cpuFreq = int(getBackend().read(cpuFreq_fname))
+	gpuFreq = int(getBackend().read(gpuFreq_fname))
+	emcFreq = int(getBackend().read(emcFreq_fname))
 
 	return cpuFreq, gpuFreq, emcFreq
 
@@ -86,7 +109,7 @@ def setDVFS(conf):
 	if emcFreq != emcFreq_cur:
 		setEmcFreq(emcFreq, emcFreq_cur)
 
-	print("Current Frequency", cpuFreq_cur, gpuFreq_cur, emcFreq_cur)
+	# print("Current Frequency", cpuFreq_cur, gpuFreq_cur, emcFreq_cur)
 
 def getCpuStatus():
 	"""Get current system knob status, including cpu freqs
@@ -95,8 +118,7 @@ def getCpuStatus():
 	cpuFreq_fname = "/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq"
 
 	cpuFreq = None
-	with open(cpuFreq_fname, 'r') as f:
-		cpuFreq = int(f.read().strip('\n'))
+	cpuFreq = int(getBackend().read(cpuFreq_fname))
 
 	return cpuFreq
 
@@ -116,8 +138,7 @@ def getGpuStatus():
 	gpuFreq_fname = "/sys/devices/platform/17000000.gpu/devfreq/17000000.gpu/cur_freq"
 
 	gpuFreq = None
-	with open(gpuFreq_fname, 'r') as f:
-		gpuFreq = int(f.read().strip('\n'))
+	gpuFreq = int(getBackend().read(gpuFreq_fname))
 
 	return gpuFreq
 
@@ -137,8 +158,7 @@ def getEmcStatus():
 	emcFreq_fname = "/sys/kernel/debug/bpmp/debug/clk/emc/rate"
 
 	emcFreq = None
-	with open(emcFreq_fname, 'r') as f:
-		emcFreq = int(f.read().strip('\n'))
+	emcFreq = int(getBackend().read(emcFreq_fname))
 
 	return emcFreq
 
@@ -150,4 +170,41 @@ def setEmc(emcFreq):
 	if emcFreq != emcFreq_cur:
 		setEmcFreq(emcFreq, emcFreq_cur)
 
-	# print("Current EMC Frequency", emcFreq_cur)
\ No newline at end of file
+	# print("Current EMC Frequency", emcFreq_cur)
+
+def getClusterStatus(policy):
+	"""Get the current frequency of one CPU cluster"""
+
+	return int(getBackend().read(CPUFREQ_DIR + "/policy{:d}/scaling_cur_freq".format(policy)))
+
+def setCluster(policy, cpuFreq):
+	"""Set the frequency of one CPU cluster if it is not already there"""
+	cpuFreq_cur = getClusterStatus(policy)
+
+	if cpuFreq != cpuFreq_cur:
+		setClusterFreq(policy, cpuFreq, cpuFreq_cur)
+
+def onlineFname(cpu):
+	return "/sys/devices/system/cpu/cpu{:d}/online".format(cpu)
+
+def getOnlineCores(policy):
+	"""Get the number of online cores of a CPU cluster; cores without a hotplug node are always online"""
+
+	count = 0
+	for cpu in getCpuPolicies()[policy]:
+		fname = onlineFname(cpu)
+		count += int(getBackend().read(fname)) if getBackend().exists(fname) else 1
+	return count
+
+def setOnlineCores(policy, count):
+	"""Hotplug a CPU cluster down (or up) to its first `count` cores"""
+
+	for i, cpu in enumerate(getCpuPolicies()[policy]):
+		fname = onlineFname(cpu)
+		if not getBackend().exists(fname):
+			if i >= count:
+				raise ValueError("cpu{:d} cannot be taken offline".format(cpu))
+			continue
+		online = 1 if i < count else 0
+		if int(getBackend().read(fname)) != online:
+			getBackend().write(fname, str(online))
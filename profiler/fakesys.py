@@ -0,0 +1,61 @@
+"""Builds a fake Jetson AGX Orin sysfs/debugfs tree of regular files, for running the
+DVFS layer off-device (e.g. `DVFSActuator(root=tmpdir)` in benchmarks)."""
+import os
+
+AGX_ORIN_POLICIES = {0: [0, 1, 2, 3], 4: [4, 5, 6, 7], 8: [8, 9, 10, 11]}
+
+CPU_FREQUENCIES = [115200, 192000, 268800, 345600, 422400, 499200, 576000, 652800, 729600, 806400,
+                   883200, 960000, 1036800, 1113600, 1190400, 1267200, 1344000, 1420800, 1497600,
+                   1574400, 1651200, 1728000, 1804800, 1881600, 1958400, 2035200, 2112000, 2188800, 2201600]
+GPU_FREQUENCIES = [306000000, 408000000, 510000000, 612000000, 714000000, 816000000, 918000000,
+                   1020000000, 1122000000, 1224000000, 1300500000]
+EMC_FREQUENCIES = [204000000, 665600000, 2133000000, 3199000000]
+
+# INA3221 (i2c address, hwmon index, channel) of the GPU, CPU and DDR rails, as in power.AGXPowerLogger
+RAIL_NODES = [('0040', '0', '1'), ('0040', '0', '2'), ('0041', '1', '2')]
+RAIL_VOLTAGE = 5000
+RAIL_CURRENTS = [1000, 800, 600]
+
+def writeFile(fname, value):
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with open(fname, 'w') as f:
+        f.write(str(value) + "\n")
+
+def makeFakeSysfs(root, policies=AGX_ORIN_POLICIES, cpuFreq=CPU_FREQUENCIES[-1],
+                  gpuFreq=GPU_FREQUENCIES[-1], emcFreq=EMC_FREQUENCIES[-1], currents=RAIL_CURRENTS):
+    """Creates the CPU, GPU and EMC frequency nodes and the power rails (mV, mA) under root and returns root"""
+
+    cpu_root = os.path.join(root, "sys/devices/system/cpu")
+    for policy, cpus in policies.items():
+        policy_dir = os.path.join(cpu_root, "cpufreq", "policy%d" % policy)
+        writeFile(os.path.join(policy_dir, "scaling_min_freq"), CPU_FREQUENCIES[0])
+        writeFile(os.path.join(policy_dir, "scaling_max_freq"), cpuFreq)
+        writeFile(os.path.join(policy_dir, "scaling_cur_freq"), cpuFreq)
+        writeFile(os.path.join(policy_dir, "related_cpus"), " ".join(str(c) for c in cpus))
+        writeFile(os.path.join(policy_dir, "scaling_available_frequencies"), " ".join(str(f) for f in CPU_FREQUENCIES))
+        for cpu in cpus:
+            cpu_dir = os.path.join(cpu_root, "cpu%d" % cpu)
+            os.makedirs(cpu_dir, exist_ok=True)
+            link = os.path.join(cpu_dir, "cpufreq")
+            if not os.path.lexists(link):
+                os.symlink(os.path.relpath(policy_dir, cpu_dir), link)
+            writeFile(os.path.join(cpu_dir, "online"), 1)
+
+    gpu_dir = os.path.join(root, "sys/devices/platform/17000000.gpu/devfreq/17000000.gpu")
+    writeFile(os.path.join(gpu_dir, "min_freq"), GPU_FREQUENCIES[0])
+    writeFile(os.path.join(gpu_dir, "max_freq"), gpuFreq)
+    writeFile(os.path.join(gpu_dir, "cur_freq"), gpuFreq)
+    writeFile(os.path.join(gpu_dir, "available_frequencies"), " ".join(str(f) for f in GPU_FREQUENCIES))
+
+    emc_dir = os.path.join(root, "sys/kernel/debug/bpmp/debug/clk/emc")
+    writeFile(os.path.join(emc_dir, "mrq_rate_locked"), 0)
+    writeFile(os.path.join(emc_dir, "state"), 1)
+    writeFile(os.path.join(emc_dir, "rate"), emcFreq)
+    writeFile(os.path.join(root, "sys/kernel/nvpmodel_clk_cap/emc"), emcFreq)
+
+    for (i2cAddr, index, channel), current in zip(RAIL_NODES, currents):
+        hwmon = os.path.join(root, "sys/bus/i2c/drivers/ina3221/1-%s/hwmon/hwmon%s" % (i2cAddr, index))
+        writeFile(os.path.join(hwmon, "in%s_input" % channel), RAIL_VOLTAGE)
+        writeFile(os.path.join(hwmon, "curr%s_input" % channel), current)
+
+    return root
@@ -1,7 +1,10 @@
 # Reference: https://github.com/hongpeng-guo/BoFL
 
+import os
 import threading
 import time
+import numpy as np
+from device.backend import getBackend
 
 agx_orin_nodes = [
     ('module/gpu', '0040', '0', '1'),
@@ -15,12 +18,10 @@ def readValue(i2cAddr='0041', index='3', channel='1'):
     voltage, current = None, None
 
     fname_voltage = '/sys/bus/i2c/drivers/ina3221/1-%s/hwmon/hwmon%s/in%s_input' % (i2cAddr, index, channel)
-    with open(fname_voltage, 'r') as f:
-        voltage = f.read()
+    voltage = getBackend().read(fname_voltage)
     
     fname_current = '/sys/bus/i2c/drivers/ina3221/1-%s/hwmon/hwmon%s/curr%s_input' % (i2cAddr, index, channel)
-    with open(fname_current, 'r') as f:
-        current = f.read()
+    current = getBackend().read(fname_current)
     
     return [float(voltage), float(current), float(voltage) * float(current)]
 
@@ -36,12 +37,10 @@ def readPowerValue(i2cAddr='0041', index='3', channel='1'):
     voltage, current = None, None
 
     fname_voltage = '/sys/bus/i2c/drivers/ina3221/1-%s/hwmon/hwmon%s/in%s_input' % (i2cAddr, index, channel)
-    with open(fname_voltage, 'r') as f:
-        voltage = f.read()
+    voltage = getBackend().read(fname_voltage)
     
     fname_current = '/sys/bus/i2c/drivers/ina3221/1-%s/hwmon/hwmon%s/curr%s_input' % (i2cAddr, index, channel)
-    with open(fname_current, 'r') as f:
-        current = f.read()
+    current = getBackend().read(fname_current)
     
     return float(voltage) * float(current)
 
@@ -53,66 +52,159 @@ def readAllPowerValue(nodes = agx_orin_nodes):
 
 class AGXPowerLogger:
 
-    def __init__(self, interval=0.1, nodes=agx_orin_nodes):
-        """Constructs the power logger and sets a sampling interval (default: 0.1s)"""
+    def __init__(self, interval=0.1, nodes=agx_orin_nodes, capacity=1 << 16, cpu=None):
+        """Constructs the power logger and sets a sampling interval (default: 0.1s).
+
+        Samples are taken by one persistent thread on monotonic deadlines, read through
+        kept-open rail nodes and stored in a preallocated ring buffer of `capacity`
+        samples (the oldest are overwritten; 0 keeps no log, for listeners only).
+        `cpu` pins the sampler thread to a core."""
 
         self.interval = interval
-        self.startTime = -1
-        self.dataLog = []
         self.nodes = nodes
+        self.capacity = capacity
+        self.cpu = cpu
+
+        self.times = np.empty(capacity)
+        self.power = np.empty((capacity, len(nodes)))
+        self.scratch = np.empty(len(nodes))
+        # Running trapezoid integral of every sample since the last reset, whatever the capacity
+        self.energy = np.zeros(len(nodes))
+        self.lastTime = None
+        self.lastPower = np.empty(len(nodes))
+        self.listeners = []
+        self.count = 0
+        self.missed = 0
+        self.startTime = -1
+
+        self.backend = None
+        self.railNodes = None
+        self.thread = None
+        self.stopEvent = threading.Event()
+
+    def openNodes(self):
+        """Opens the voltage and current node of every rail once"""
+
+        self.backend = getBackend()
+        self.railNodes = []
+        for node in self.nodes:
+            fname = '/sys/bus/i2c/drivers/ina3221/1-%s/hwmon/hwmon%s/%s%s_input'
+            self.railNodes.append((
+                self.backend.open(fname % (node[1], node[2], 'in', node[3])),
+                self.backend.open(fname % (node[1], node[2], 'curr', node[3])),
+            ))
+
+    def sample(self):
+        """Reads all rails once and appends the sample to the ring buffer"""
+
+        t = self.backend.monotonic() - self.startTime
+        if self.capacity:
+            i = self.count % self.capacity
+            self.times[i] = t
+            power = self.power[i]
+        else:
+            power = self.scratch
+        for r, (voltage, current) in enumerate(self.railNodes):
+            power[r] = float(voltage.read()) * float(current.read())
+        # A reset() racing this sample restarts the clock under it; that interval is dropped
+        if self.lastTime is not None and t > self.lastTime:
+            self.energy += 0.5 * (power + self.lastPower) * (t - self.lastTime)
+        self.lastTime = t
+        self.lastPower[:] = power
+        self.count += 1
+
+        for listener in self.listeners:
+            listener(t, power)
+
+    def addListener(self, listener):
+        """Calls listener(t, power) from the sampler thread on every sample"""
+
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        self.listeners.remove(listener)
+
+    def now(self):
+        """Current time on the clock samples are stamped with"""
+
+        return self.backend.monotonic() - self.startTime
+
+    def run(self):
+        if self.cpu is not None:
+            os.sched_setaffinity(0, {self.cpu})
+
+        # Deadlines are kept in wall-clock time; the backend may run faster than that
+        period = self.interval / self.backend.speedup
+        deadline = time.monotonic()
+        while True:
+            self.sample()
+
+            deadline += period
+            now = time.monotonic()
+            if now > deadline:
+                # Skip the deadlines already missed instead of sampling in a burst
+                skipped = int((now - deadline) / period) + 1
+                self.missed += skipped
+                deadline += skipped * period
+            if self.stopEvent.wait(deadline - now):
+                return
 
     def start(self):
-        "Starts the logging activity"""
-
-        # define the inner function called regularly by the thread to log the data
-        def threadFun():
-            # start next timer
-            self.start()
-            # log data
-            t = time.time() - self.startTime
-            self.dataLog.append((t, readAllPowerValue(self.nodes)))
-
-        # setup the timer and launch it
-        self.tmr = threading.Timer(self.interval, threadFun)
-        self.tmr.start()
-        
+        """Starts the logging activity"""
+
+        if self.thread is not None and self.thread.is_alive():
+            return
+        if self.railNodes is None or self.backend is not getBackend():
+            self.openNodes()
         if self.startTime < 0:
-            self.startTime = time.time()
+            self.startTime = self.backend.monotonic()
+
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.run, name="AGXPowerLogger", daemon=True)
+        self.thread.start()
     
     def stop(self):
         """Stops the logging activity"""
 
-        self.tmr.cancel()
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        """Stops the logging activity and closes the rail nodes"""
+
+        self.stop()
+        if self.railNodes is not None:
+            for voltage, current in self.railNodes:
+                voltage.close()
+                current.close()
+            self.railNodes = None
 
     def reset(self):
         """Reset the logger as newly initialized"""
 
-        self.startTime = -1
-        self.dataLog = []
+        self.startTime = -1 if self.thread is None else self.backend.monotonic()
+        self.count = 0
+        self.missed = 0
+        self.energy = np.zeros(len(self.nodes))
+        self.lastTime = None
+
+    def getSamples(self):
+        """Returns (times, power) of the retained samples in chronological order"""
+
+        n = min(self.count, self.capacity)
+        if self.count <= self.capacity or self.capacity == 0:
+            return self.times[:n], self.power[:n]
+        i = self.count % self.capacity
+        return np.roll(self.times, -i), np.roll(self.power, -i, axis=0)
     
     def getDataLog(self):
-        return self.dataLog
+        times, power = self.getSamples()
+        return [(t, p) for t, p in zip(times.tolist(), power.tolist())]
 
     def getTotalEnergy(self):
-        data = self.dataLog
-        
-        total_gpu_energy = 0.0
-        total_cpu_energy = 0.0
-        total_memory_energy = 0.0
-
-        # Iterate through the list, except the last item
-        for i in range(len(data) - 1):
-            # Calculate the time difference between the current and next timestamp
-            time_diff = data[i+1][0] - data[i][0]
-
-            # Calculate energy for each component by multiplying the power by the time difference
-            gpu_energy =  0.5 * (data[i+1][1][0] + data[i][1][0]) * time_diff
-            cpu_energy = 0.5 * (data[i+1][1][1] + data[i][1][0]) * time_diff
-            memory_energy = 0.5 * (data[i+1][1][2] + data[i][1][0]) * time_diff
-
-            # Add the calculated energy to the total energy counters
-            total_gpu_energy += gpu_energy
-            total_cpu_energy += cpu_energy
-            total_memory_energy += memory_energy
-
-        return total_gpu_energy, total_cpu_energy, total_memory_energy
\ No newline at end of file
+        """Trapezoid integral of each rail's power over every sample since the last reset,
+        including those the ring buffer has already overwritten"""
+
+        return tuple(self.energy.tolist())
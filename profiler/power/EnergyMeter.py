@@ -0,0 +1,203 @@
+import threading
+from contextlib import ContextDecorator
+import numpy as np
+from power.AGXPowerLogger import AGXPowerLogger
+
+class RegionStats:
+    """Accumulated energy (uJ per rail), duration and count of one region name"""
+
+    def __init__(self, n_rails):
+        self.count = 0
+        self.energy = np.zeros(n_rails)
+        self.duration = 0.0
+
+    def asDict(self):
+        total = float(self.energy.sum())
+        return {
+            "count": self.count,
+            "energy": self.energy.tolist(),
+            "total_energy": total,
+            "duration": self.duration,
+            "average_power": total / self.duration if self.duration > 0 else None,
+            "energy_per_count": total / self.count if self.count else None,
+        }
+
+class Interval:
+    """One open or closing occurrence of a region"""
+
+    def __init__(self, name, start, n_rails):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.energy = np.zeros(n_rails)
+
+class Region(ContextDecorator):
+    """Context manager / decorator returned by EnergyMeter.region()"""
+
+    def __init__(self, meter, name):
+        self.meter = meter
+        self.name = name
+        self.intervals = threading.local()
+
+    def __enter__(self):
+        stack = getattr(self.intervals, "stack", None)
+        if stack is None:
+            stack = self.intervals.stack = []
+        stack.append(self.meter.begin(self.name))
+        return self
+
+    def __exit__(self, *exc):
+        self.meter.end(self.intervals.stack.pop())
+        return False
+
+class EnergyMeter:
+    """Named, nestable energy regions integrated online from AGXPowerLogger samples.
+
+    Every sample adds the trapezoid between it and the previous sample to each region
+    overlapping that segment (clipped to the region's start and end), so no raw log needs
+    to be kept. Regions entered inside other regions are named "outer/inner". mark(name)
+    closes the previous occurrence of a per-iteration marker and opens the next one,
+    e.g. once per decoded token or processed frame. Regions and markers are opened only
+    between start() and stop().
+    """
+
+    def __init__(self, logger=None, interval=0.01):
+        if logger is None:
+            logger = AGXPowerLogger(interval=interval, capacity=0)
+        self.logger = logger
+        self.nRails = len(logger.nodes)
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.open = []
+        self.closing = []
+        self.markers = {}
+        self.stats = {}
+        self.last = None
+
+        logger.addListener(self.onSample)
+
+    def start(self):
+        self.logger.start()
+
+    def stop(self):
+        """Stops sampling and settles regions still waiting for a sample past their end"""
+
+        self.logger.stop()
+        with self.lock:
+            if self.last is not None:
+                t, power = self.last
+                for interval in self.closing:
+                    # Hold the last sampled power until the region's end
+                    if interval.end > t:
+                        interval.energy += power * (interval.end - max(interval.start, t))
+                    self.finish(interval)
+            self.closing = []
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    # Regions
+
+    def now(self):
+        """Time on the logger's clock, for opening a region; RuntimeError unless the logger is running"""
+
+        if self.logger.thread is None:
+            raise RuntimeError("EnergyMeter is not running; call start() before opening regions or markers")
+        return self.logger.now()
+
+    def qualify(self, name):
+        stack = getattr(self.local, "stack", None)
+        if not stack:
+            return name
+        return stack[-1].name + "/" + name
+
+    def begin(self, name):
+        interval = Interval(self.qualify(name), self.now(), self.nRails)
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(interval)
+        with self.lock:
+            self.open.append(interval)
+        return interval
+
+    def end(self, interval):
+        interval.end = self.logger.now()
+        stack = self.local.stack
+        if interval in stack:
+            stack.remove(interval)
+        with self.lock:
+            self.open.remove(interval)
+            self.closing.append(interval)
+
+    def region(self, name):
+        """`with meter.region("prefill"):` or `@meter.region("prefill")`"""
+
+        return Region(self, name)
+
+    def mark(self, name):
+        """Ends the previous occurrence of marker `name` and begins the next"""
+
+        self.endMark(name)
+        interval = Interval(self.qualify(name), self.now(), self.nRails)
+        with self.lock:
+            self.open.append(interval)
+            self.markers[name] = interval
+
+    def endMark(self, name, discard=False):
+        """Ends the current occurrence of marker `name`, if any; `discard` drops it uncounted"""
+
+        with self.lock:
+            interval = self.markers.pop(name, None)
+            if interval is None:
+                return
+            interval.end = self.logger.now()
+            self.open.remove(interval)
+            if not discard:
+                self.closing.append(interval)
+
+    # Integration
+
+    def onSample(self, t, power):
+        with self.lock:
+            if self.last is not None:
+                t0, p0 = self.last
+                if t > t0:
+                    for interval in self.open:
+                        self.integrate(interval, t0, p0, t, power)
+                    for interval in self.closing:
+                        self.integrate(interval, t0, p0, t, power)
+
+                    settled = [i for i in self.closing if i.end <= t]
+                    for interval in settled:
+                        self.finish(interval)
+                    if settled:
+                        self.closing = [i for i in self.closing if i.end > t]
+            self.last = (t, power.copy())
+
+    def integrate(self, interval, t0, p0, t1, p1):
+        a = max(interval.start, t0)
+        b = t1 if interval.end is None else min(interval.end, t1)
+        if b <= a:
+            return
+        # Power is linear between samples: integrate the clipped trapezoid
+        slope = (p1 - p0) / (t1 - t0)
+        pa = p0 + slope * (a - t0)
+        pb = p0 + slope * (b - t0)
+        interval.energy += 0.5 * (pa + pb) * (b - a)
+
+    def finish(self, interval):
+        stats = self.stats.get(interval.name)
+        if stats is None:
+            stats = self.stats[interval.name] = RegionStats(self.nRails)
+        stats.count += 1
+        stats.energy += interval.energy
+        stats.duration += interval.end - interval.start
+
+    def getReport(self):
+        """{region name: count, energy per rail, total energy, duration, average power, energy per count}"""
+
+        with self.lock:
+            return {name: stats.asDict() for name, stats in self.stats.items()}
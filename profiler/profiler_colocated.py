@@ -0,0 +1,281 @@
+import sys
+from pathlib import Path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+import argparse
+import multiprocessing
+import threading
+import time
+import power.AGXPowerLogger as APL
+from dvfs.knobs import CLUSTER_STEPS
+from device.backend import setBackend
+from device.simulated import SimulatedBackend
+from sweep import Sweep, measure_energy, serpentine
+from settle import wait_settled
+from profiler_yolo import IMAGE_PATH, IMAGE_WIDTH, knob_space
+from profiler_yolo import CONFIG_NAME as YOLO_CONFIG_NAME, FPS_MULTIPLIER as YOLO_MULTIPLIER
+from profiler_vlm import PREFILL_CONFIG_NAME, DECODE_CONFIG_NAME, TPS_MULTIPLIER
+from profiler_vlm import FPS_MULTIPLIER as PREFILL_MULTIPLIER
+
+CONFIG_NAME = "colocated"
+THROUGHPUT_CONFIG_NAME = CONFIG_NAME + "-throughput"
+CHECKPOINT_NAME = CONFIG_NAME + "-sweep.json"
+# Task name -> throughput multiplier of its result/final profile (throughput = multiplier / latency)
+TASKS = {
+    YOLO_CONFIG_NAME: YOLO_MULTIPLIER,
+    PREFILL_CONFIG_NAME: PREFILL_MULTIPLIER,
+    DECODE_CONFIG_NAME: TPS_MULTIPLIER,
+}
+
+def colocated_name(task):
+    return task + "-" + CONFIG_NAME
+
+def task_steps(task, backend=None):
+    """Loads a task and returns a generator of the items (frames, prefills, tokens) each step completes.
+
+    Steps that complete nothing (the prefill before a decode) yield 0 and are left out of the busy time."""
+    if task == YOLO_CONFIG_NAME:
+        if backend:
+            def steps():
+                while True:
+                    for _ in backend.streamWorkload(task, YOLO_MULTIPLIER):
+                        yield 1
+            return steps()
+
+        from task.detect_yolo import YOLODetector
+        detector = YOLODetector(image_width=IMAGE_WIDTH)
+        detector.load()
+        def steps():
+            while True:
+                for _ in detector.stream(IMAGE_PATH):
+                    yield 1
+        return steps()
+
+    if backend:
+        def steps():
+            while True:
+                if task == DECODE_CONFIG_NAME:
+                    backend.runWorkload(PREFILL_CONFIG_NAME)
+                    yield 0
+                    for _ in backend.streamWorkload(task, TPS_MULTIPLIER):
+                        yield 1
+                else:
+                    backend.runWorkload(task)
+                    yield 1
+        return steps()
+
+    from task.VLMPipeline import VLMPipeline
+    pipeline = VLMPipeline()
+    pipeline.load_model()
+    pipeline.load_processor()
+    pipeline.load_inputs(pipeline.get_messages())
+    pipeline.setup_cache()
+    def steps():
+        while True:
+            pipeline.reset_cache()
+            pipeline.prefill()
+            if task == DECODE_CONFIG_NAME:
+                yield 0
+                pipeline.decode_benchmark()
+                yield len(pipeline.token_latencies())
+            else:
+                yield 1
+    return steps()
+
+def serve_task(task, conn, completed, backend=None):
+    """Worker loop: loads the task, then on every "start" runs it back to back until "stop"
+    and replies with its (start, end, items) steps. "exit" ends the worker.
+
+    completed (a shared multiprocessing.Value) counts the items as they complete."""
+    clock = backend.monotonic if backend else time.monotonic
+    steps = task_steps(task, backend)
+    conn.send("ready")
+    while True:
+        command = conn.recv()
+        if command == "exit":
+            return
+        records = []
+        t0 = clock()
+        for items in steps:
+            t1 = clock()
+            records.append((t0, t1, items))
+            completed.value += items
+            t0 = t1
+            if conn.poll():
+                break
+        conn.recv()
+        conn.send(records)
+
+def contended_rate(records, start, end):
+    """Items per busy second inside [start, end]; a step straddling either end counts pro rata.
+
+    The tasks run from before start until after end, so the steps cover the whole window."""
+    items, busy = 0.0, 0.0
+    for t0, t1, n in records:
+        overlap = min(t1, end) - max(t0, start)
+        if overlap > 0 and n:
+            items += n * overlap / (t1 - t0)
+            busy += overlap
+    return items / busy if busy > 0 else 0.0
+
+class Colocation:
+    """The three tasks running concurrently, each in its own process (threads on the simulated
+    backend, whose rails must see every task), started and stopped together at every point"""
+
+    def __init__(self, backend=None):
+        self.conns = {}
+        self.completed = {}
+        self.workers = []
+        context = multiprocessing.get_context("spawn")
+        for task in TASKS:
+            parent, child = multiprocessing.Pipe()
+            self.completed[task] = context.Value("q", 0)
+            if backend:
+                worker = threading.Thread(target=serve_task, args=(task, child, self.completed[task], backend), daemon=True)
+            else:
+                worker = context.Process(target=serve_task, args=(task, child, self.completed[task]), daemon=True)
+            worker.start()
+            self.conns[task] = parent
+            self.workers.append(worker)
+        for task, conn in self.conns.items():
+            if conn.recv() != "ready":
+                raise RuntimeError("%s worker failed to start" % task)
+
+    def start(self):
+        for conn in self.conns.values():
+            conn.send("start")
+
+    def items(self):
+        """Items each task has completed so far"""
+        return {task: completed.value for task, completed in self.completed.items()}
+
+    def stop(self):
+        for conn in self.conns.values():
+            conn.send("stop")
+        return {task: conn.recv() for task, conn in self.conns.items()}
+
+    def close(self):
+        for conn in self.conns.values():
+            conn.send("exit")
+        for worker in self.workers:
+            worker.join()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Profiles object detection, prefill and decode running together")
+    parser.add_argument("--simulate", action="store_true",
+                        help="Run against the simulated device backend driven by result/final")
+    parser.add_argument("--speedup", type=float, default=100.0, help="Simulated clock speedup")
+    parser.add_argument("--noise", type=float, default=0.0, help="Relative noise of simulated latency and power")
+    parser.add_argument("--transition-delay", type=float, default=0.0, help="Simulated frequency transition delay (s)")
+    parser.add_argument("--window", type=float, default=30.0,
+                        help="Seconds of co-located execution measured per repetition")
+    parser.add_argument("--max-window", type=float, default=300.0,
+                        help="Longest the window is extended for every task to complete an item in it (s)")
+    parser.add_argument("--ramp", type=float, default=5.0,
+                        help="Seconds the tasks run together before each measurement window")
+    parser.add_argument("--repetitions", type=int, default=1, help="Minimum measurements per frequency point")
+    parser.add_argument("--warmup", type=int, default=1, help="Discarded runs after each frequency transition")
+    parser.add_argument("--ci-width", type=float, default=None,
+                        help="Repeat until the confidence interval of mean latency and power is narrower than this (relative)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of --ci-width")
+    parser.add_argument("--max-repetitions", type=int, default=10, help="Cap on measurements per point with --ci-width")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Partial results are kept here and an interrupted sweep resumes from them")
+    parser.add_argument("--emc", action="store_true", help="Sweep the memory clock (EMC) as a third knob")
+    parser.add_argument("--clusters", action="store_true",
+                        help="Sweep each CPU cluster (cpufreq policy) as its own frequency knob")
+    parser.add_argument("--cluster-frequencies", type=int, nargs="+", default=None,
+                        help="Cluster frequencies to sweep with --clusters (default: %d of each cluster's available ones)" % CLUSTER_STEPS)
+    parser.add_argument("--core-counts", type=int, nargs="+", default=None,
+                        help="With --clusters, also sweep how many cores of each cluster stay online (hotplug)")
+    parser.add_argument("--settle-timeout", type=float, default=5.0,
+                        help="Longest wait for the frequencies and rail power to settle after a transition (s)")
+    args = parser.parse_args()
+    if (args.cluster_frequencies or args.core_counts) and not args.clusters:
+        parser.error("--cluster-frequencies and --core-counts need --clusters")
+    if args.checkpoint is None:
+        args.checkpoint = CHECKPOINT_NAME if not (args.clusters or args.emc) else \
+            CONFIG_NAME + "-clusters" * args.clusters + "-emc" * args.emc + "-sweep.json"
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    backend = None
+    if args.simulate:
+        backend = SimulatedBackend.fromResults(speedup=args.speedup, noise=args.noise, transitionDelay=args.transition_delay)
+        setBackend(backend)
+
+    clock = backend.monotonic if backend else time.monotonic
+    sleep = backend.sleep if backend else time.sleep
+
+    # Every task is loaded once, in its own process, for the whole sweep
+    colocation = Colocation(backend)
+    logger = APL.AGXPowerLogger()
+
+    space = knob_space(args)
+    print(CONFIG_NAME, " Knobs: ", " ".join(space.names), " Points: ", len(space.configs()))
+
+    def set_point(point):
+        space.apply(point)
+        settle = wait_settled(point, read_frequencies=space.read, clock=clock, sleep=sleep, timeout=args.settle_timeout)
+        print(CONFIG_NAME, space.describe(space.read()), " Settle: ", settle["seconds"])
+        return settle
+
+    def window():
+        """Sleeps --window, extended until every task has completed an item in it"""
+        before = colocation.items()
+        t0 = clock()
+        sleep(args.window)
+        while True:
+            waiting = [task for task, n in colocation.items().items() if n == before[task]]
+            if not waiting:
+                return
+            if clock() - t0 >= args.max_window:
+                raise RuntimeError("%s completed nothing in %g s" % (", ".join(waiting), clock() - t0))
+            sleep(min(args.window, args.max_window - (clock() - t0)))
+
+    def measure(point):
+        """Total rail energy over the window, and each task's throughput under contention.
+
+        Each task's profile carries its contended latency and the energy of the whole system over
+        that latency, so its power is the total power of the three tasks together."""
+        colocation.start()
+        try:
+            sleep(args.ramp)
+            start = clock()
+            joint = measure_energy(window, clock, logger)
+            end = clock()
+        finally:
+            records = colocation.stop()
+
+        rates = {task: contended_rate(records[task], start, end) for task in TASKS}
+        print("Window: ", joint[0])
+        print("GPU Energy Consumption: ", joint[1])
+        print("CPU Energy Consumption: ", joint[2])
+        print("Memory Energy Consumption: ", joint[3])
+        print("Throughput: ", " ".join("%s %.4g" % item for item in rates.items()))
+
+        results = {CONFIG_NAME: joint, THROUGHPUT_CONFIG_NAME: tuple(rates.values())}
+        for task, multiplier in TASKS.items():
+            latency = multiplier / rates[task]
+            results[colocated_name(task)] = (latency,) + tuple(e * latency / joint[0] for e in joint[1:])
+        return results
+
+    sweep = Sweep(serpentine(*space.values), args.repetitions, args.checkpoint, warmup=args.warmup,
+                  ci_width=args.ci_width, confidence=args.confidence, max_repetitions=args.max_repetitions,
+                  ci_outputs=[colocated_name(task) for task in TASKS])
+    try:
+        sweep.run(set_point, measure)
+    finally:
+        colocation.close()
+
+    sweep.write(CONFIG_NAME, CONFIG_NAME + ".json")
+    sweep.write_store(CONFIG_NAME, CONFIG_NAME + ".npz", knobs=space.names, tasks=list(TASKS))
+    sweep.write(THROUGHPUT_CONFIG_NAME, THROUGHPUT_CONFIG_NAME + ".json")
+    for task in TASKS:
+        name = colocated_name(task)
+        sweep.write(name, name + ".json")
+        sweep.write_store(name, name + ".npz", knobs=space.names)
+        sweep.write_statistics(name, name + "-stats.json")
+    sweep.write_transitions(CONFIG_NAME + "-settle.json")
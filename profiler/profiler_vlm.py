@@ -3,17 +3,29 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.append(str(parent_dir))
 
-import json
+import argparse
 import time
 import power.AGXPowerLogger as APL
-from dvfs.lib import setCpu, setGpu, getCpuStatus, getGpuStatus
-from task.VLMPipeline import VLMPipeline
+from dvfs.knobs import KnobSpace, CLUSTER_STEPS
+from device.backend import setBackend
+from device.simulated import SimulatedBackend
+from sweep import Sweep, measure_energy, serpentine
+from settle import wait_settled
+from adaptive import AdaptiveSweep, trace_levels
+from task.stats import latency_stats
 
 # MODEL_NAME = "EleutherAI/gpt-neo-1.3B"
 # CONTEXT_PATH = "./context/hp/context-0.15k.txt"
 # MAX_TOKEN = 30
 
-CONFIG_NAME = f"gemma-3-4B-prefill"
+CONFIG_NAME = f"gemma-3-4B"
+PREFILL_CONFIG_NAME = CONFIG_NAME + "-prefill"
+DECODE_CONFIG_NAME = CONFIG_NAME + "-decode"
+DECODE_TOKENS_CONFIG_NAME = DECODE_CONFIG_NAME + "-tokens"
+TOKEN_STATS = ("rate", "p50", "p95", "p99")
+CHECKPOINT_NAME = CONFIG_NAME + "-sweep.json"
+FPS_MULTIPLIER = 1
+TPS_MULTIPLIER = 100
 CPU_CONFIGS = [
     115200, 
     192000, 
@@ -58,41 +70,165 @@ GPU_CONFIGS = [
     1224000000,
     1300500000,
 ]
+EMC_CONFIGS = [
+    204000000,
+    665600000,
+    2133000000,
+    3199000000,
+]
+
+def knob_space(args):
+    """cpu, gpu (and emc) knobs, or with --clusters a frequency (and core count) knob per CPU cluster"""
+    emc = EMC_CONFIGS if args.emc else None
+    if args.clusters:
+        return KnobSpace.perCluster(GPU_CONFIGS, emc, args.cluster_frequencies, args.core_counts)
+    return KnobSpace.standard(CPU_CONFIGS, GPU_CONFIGS, emc)
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--simulate", action="store_true",
+                        help="Run against the simulated device backend driven by result/final")
+    parser.add_argument("--speedup", type=float, default=100.0, help="Simulated clock speedup")
+    parser.add_argument("--noise", type=float, default=0.0, help="Relative noise of simulated latency and power")
+    parser.add_argument("--transition-delay", type=float, default=0.0, help="Simulated frequency transition delay (s)")
+    parser.add_argument("--repetitions", type=int, default=1, help="Minimum measurements per frequency point")
+    parser.add_argument("--warmup", type=int, default=1, help="Discarded runs after each frequency transition")
+    parser.add_argument("--ci-width", type=float, default=None,
+                        help="Repeat until the confidence interval of mean latency and power is narrower than this (relative)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of --ci-width")
+    parser.add_argument("--max-repetitions", type=int, default=10, help="Cap on measurements per point with --ci-width")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Partial results are kept here and an interrupted sweep resumes from them")
+    parser.add_argument("--prefill-cache", action="store_true",
+                        help="Prefill through the image-embedding and prefix-KV caches (profiles the cache-hit prefill)")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="Measure decode served with continuous batching over this many slots instead of batch 1")
+    parser.add_argument("--requests", type=int, default=None, help="Requests per measurement when serving (default 2x concurrency)")
+    parser.add_argument("--max-cache-len", type=int, default=1024, help="KV cache length of the serving batch")
+    parser.add_argument("--emc", action="store_true", help="Sweep the memory clock (EMC) as a third knob")
+    parser.add_argument("--clusters", action="store_true",
+                        help="Sweep each CPU cluster (cpufreq policy) as its own frequency knob")
+    parser.add_argument("--cluster-frequencies", type=int, nargs="+", default=None,
+                        help="Cluster frequencies to sweep with --clusters (default: %d of each cluster's available ones)" % CLUSTER_STEPS)
+    parser.add_argument("--core-counts", type=int, nargs="+", default=None,
+                        help="With --clusters, also sweep how many cores of each cluster stay online (hotplug)")
+    parser.add_argument("--settle-timeout", type=float, default=5.0,
+                        help="Longest wait for the frequencies and rail power to settle after a transition (s)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Measure only the points a GP surrogate is least sure about and predict the rest")
+    parser.add_argument("--target-error", type=float, default=0.05,
+                        help="Adaptive sweep stops once the largest relative std of the surrogates falls below this")
+    parser.add_argument("--max-points", type=int, default=None, help="Measurement budget of the adaptive sweep")
+    args = parser.parse_args()
+    if args.concurrency and args.simulate:
+        parser.error("--concurrency needs the real model; the simulated backend only has batch-1 profiles")
+    if (args.cluster_frequencies or args.core_counts) and not args.clusters:
+        parser.error("--cluster-frequencies and --core-counts need --clusters")
+    if args.checkpoint is None:
+        args.checkpoint = CHECKPOINT_NAME if not (args.clusters or args.emc) else \
+            CONFIG_NAME + "-clusters" * args.clusters + "-emc" * args.emc + "-sweep.json"
+    return args
 
 if __name__ == "__main__":
-    result = {}
-    for cpu_config in CPU_CONFIGS:
-        for gpu_config in GPU_CONFIGS:
-            setCpu(cpu_config)
-            setGpu(gpu_config)
-            time.sleep(5)
-            print(CONFIG_NAME, " CPU: ", getCpuStatus(), " GPU: ", getGpuStatus())
-
-            pipeline = VLMPipeline()
-            pipeline.load_model()
-            pipeline.load_processor()
-            msgs = pipeline.get_messages()
-            pipeline.load_inputs(msgs)
-            pipeline.setup_cache()
-            
-            # Logging
-            logger = APL.AGXPowerLogger()
-            logger.start()
-            t0 = time.perf_counter()
-
-            pipeline.prefill()
-
-            t1 = time.perf_counter()
-            logger.stop()
-
-            latency = t1 - t0
-            energy = logger.getTotalEnergy()
-            print("Latency: ", latency)
-            print("GPU Energy Consumption: ", energy[0])
-            print("CPU Energy Consumption: ", energy[1])
-            print("Memory Energy Consumption: ", energy[2])
-            result[str(cpu_config) + ":" + str(gpu_config)] = (float(latency), float(energy[0]), float(energy[1]), float(energy[2]))
-            logger.reset()
-    
-    with open(CONFIG_NAME + ".json", 'w') as file:
-        json.dump(result, file, indent=4)
\ No newline at end of file
+    args = parse_args()
+    SERVE_CONFIG_NAME = DECODE_CONFIG_NAME + "-c%d" % args.concurrency
+    backend = None
+    if args.simulate:
+        backend = SimulatedBackend.fromResults(speedup=args.speedup, noise=args.noise, transitionDelay=args.transition_delay)
+        setBackend(backend)
+    else:
+        from task.VLMPipeline import VLMPipeline
+        from task.VLMServer import VLMServer, Request
+
+    clock = backend.monotonic if backend else time.perf_counter
+    sleep = backend.sleep if backend else time.sleep
+
+    # The model, processor, inputs and cache stay resident for the whole sweep
+    if not backend:
+        pipeline = VLMPipeline()
+        pipeline.load_model()
+        pipeline.load_processor()
+        msgs = pipeline.get_messages()
+        pipeline.load_inputs(msgs)
+        pipeline.setup_cache()
+        if args.prefill_cache:
+            pipeline.enable_caches()
+        if args.concurrency:
+            server = VLMServer(pipeline, max_batch_size=args.concurrency, max_cache_len=args.max_cache_len)
+
+    logger = APL.AGXPowerLogger()
+
+    space = knob_space(args)
+    print(CONFIG_NAME, " Knobs: ", " ".join(space.names), " Points: ", len(space.configs()))
+
+    def set_point(point):
+        space.apply(point)
+        settle = wait_settled(point, read_frequencies=space.read, clock=clock, sleep=sleep, timeout=args.settle_timeout)
+        print(CONFIG_NAME, space.describe(space.read()), " Settle: ", settle["seconds"])
+        return settle
+
+    def serve():
+        """Decode TPS at concurrency, in the result/final schema: seconds and energy per TPS_MULTIPLIER tokens"""
+        report = {}
+        for i in range(args.requests or 2 * args.concurrency):
+            server.submit(Request(pipeline.get_messages(), pipeline.OUTPUT_TOKENS, request_id=i))
+        values = measure_energy(lambda: report.update(server.run()), clock, logger)
+        print(SERVE_CONFIG_NAME, "TPS: ", report["tps"], " per request p50: ", report["request_tps_p50"],
+              " min: ", report["request_tps_min"])
+        scale = TPS_MULTIPLIER / report["tokens"]
+        return tuple(v * scale for v in values)
+
+    def measure(point):
+        if args.concurrency:
+            return {SERVE_CONFIG_NAME: serve()}
+
+        latencies = []
+        if backend:
+            prefill = measure_energy(lambda: backend.runWorkload(PREFILL_CONFIG_NAME), clock, logger)
+            decode = measure_energy(lambda: latencies.extend(backend.streamWorkload(DECODE_CONFIG_NAME, TPS_MULTIPLIER)), clock, logger)
+        else:
+            pipeline.reset_cache()
+            prefill = measure_energy(pipeline.prefill, clock, logger)
+            decode = measure_energy(pipeline.decode_benchmark, clock, logger)
+            latencies = pipeline.token_latencies()
+        tokens = latency_stats(latencies, sum(latencies))
+
+        for name, values in ((PREFILL_CONFIG_NAME, prefill), (DECODE_CONFIG_NAME, decode)):
+            print(name, "Latency: ", values[0])
+            print("GPU Energy Consumption: ", values[1])
+            print("CPU Energy Consumption: ", values[2])
+            print("Memory Energy Consumption: ", values[3])
+        print("TPS: ", tokens["rate"], " p50: ", tokens["p50"], " p95: ", tokens["p95"], " p99: ", tokens["p99"])
+        return {
+            PREFILL_CONFIG_NAME: prefill,
+            DECODE_CONFIG_NAME: decode,
+            DECODE_TOKENS_CONFIG_NAME: tuple(tokens[k] for k in TOKEN_STATS),
+        }
+
+    outputs = {PREFILL_CONFIG_NAME: FPS_MULTIPLIER, DECODE_CONFIG_NAME: TPS_MULTIPLIER}
+    slo_levels = {
+        PREFILL_CONFIG_NAME: trace_levels("fps-p-trace.json"),
+        DECODE_CONFIG_NAME: trace_levels("tps-trace.json"),
+    }
+    if args.concurrency:
+        outputs = {SERVE_CONFIG_NAME: TPS_MULTIPLIER}
+        slo_levels = {SERVE_CONFIG_NAME: slo_levels[DECODE_CONFIG_NAME]}
+
+    repetition_options = dict(warmup=args.warmup, ci_width=args.ci_width, confidence=args.confidence,
+                              max_repetitions=args.max_repetitions)
+    if args.adaptive:
+        sweep = AdaptiveSweep(space.values, outputs, slo_levels=slo_levels,
+                              target_error=args.target_error, max_points=args.max_points,
+                              repetitions=args.repetitions, checkpoint=args.checkpoint, **repetition_options)
+    else:
+        sweep = Sweep(serpentine(*space.values), args.repetitions, args.checkpoint,
+                      ci_outputs=list(outputs), **repetition_options)
+    sweep.run(set_point, measure)
+
+    for name in outputs:
+        sweep.write(name, name + ".json")
+        sweep.write_store(name, name + ".npz", knobs=space.names)
+        sweep.write_statistics(name, name + "-stats.json")
+    if not args.concurrency:
+        sweep.write(DECODE_TOKENS_CONFIG_NAME, DECODE_TOKENS_CONFIG_NAME + ".json")
+    sweep.write_transitions(CONFIG_NAME + "-settle.json")
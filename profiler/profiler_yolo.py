@@ -3,17 +3,27 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.append(str(parent_dir))
 
-import json
+import argparse
 import time
 import power.AGXPowerLogger as APL
-from dvfs.lib import setCpu, setGpu, getCpuStatus, getGpuStatus
-from task.detect_yolo import detect_yolov8
+from dvfs.knobs import KnobSpace, CLUSTER_STEPS
+from device.backend import setBackend
+from device.simulated import SimulatedBackend
+from sweep import Sweep, measure_energy, serpentine
+from settle import wait_settled
+from adaptive import AdaptiveSweep, trace_levels
+from task.detect_yolo import YOLODetector
+from task.stats import latency_stats
 
 # MODEL_NAME = "/home/jiaxi/cs525/Assets/120_1K"
 IMAGE_PATH = "/home/jiaxi/cs525/Assets/60_1K"
 IMAGE_WIDTH = 640
 
 CONFIG_NAME = f"yolov8-640"
+FRAMES_CONFIG_NAME = CONFIG_NAME + "-frames"
+FRAME_STATS = ("rate", "p50", "p95", "p99")
+CHECKPOINT_NAME = CONFIG_NAME + "-sweep.json"
+FPS_MULTIPLIER = 60
 CPU_CONFIGS = [
     115200, 
     192000, 
@@ -58,34 +68,115 @@ GPU_CONFIGS = [
     1224000000,
     1300500000,
 ]
+EMC_CONFIGS = [
+    204000000,
+    665600000,
+    2133000000,
+    3199000000,
+]
+
+def knob_space(args):
+    """cpu, gpu (and emc) knobs, or with --clusters a frequency (and core count) knob per CPU cluster"""
+    emc = EMC_CONFIGS if args.emc else None
+    if args.clusters:
+        return KnobSpace.perCluster(GPU_CONFIGS, emc, args.cluster_frequencies, args.core_counts)
+    return KnobSpace.standard(CPU_CONFIGS, GPU_CONFIGS, emc)
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--simulate", action="store_true",
+                        help="Run against the simulated device backend driven by result/final")
+    parser.add_argument("--speedup", type=float, default=100.0, help="Simulated clock speedup")
+    parser.add_argument("--noise", type=float, default=0.0, help="Relative noise of simulated latency and power")
+    parser.add_argument("--transition-delay", type=float, default=0.0, help="Simulated frequency transition delay (s)")
+    parser.add_argument("--repetitions", type=int, default=1, help="Minimum measurements per frequency point")
+    parser.add_argument("--warmup", type=int, default=1, help="Discarded runs after each frequency transition")
+    parser.add_argument("--ci-width", type=float, default=None,
+                        help="Repeat until the confidence interval of mean latency and power is narrower than this (relative)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of --ci-width")
+    parser.add_argument("--max-repetitions", type=int, default=10, help="Cap on measurements per point with --ci-width")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Partial results are kept here and an interrupted sweep resumes from them")
+    parser.add_argument("--batch", type=int, default=1, help="Frames per detector batch")
+    parser.add_argument("--emc", action="store_true", help="Sweep the memory clock (EMC) as a third knob")
+    parser.add_argument("--clusters", action="store_true",
+                        help="Sweep each CPU cluster (cpufreq policy) as its own frequency knob")
+    parser.add_argument("--cluster-frequencies", type=int, nargs="+", default=None,
+                        help="Cluster frequencies to sweep with --clusters (default: %d of each cluster's available ones)" % CLUSTER_STEPS)
+    parser.add_argument("--core-counts", type=int, nargs="+", default=None,
+                        help="With --clusters, also sweep how many cores of each cluster stay online (hotplug)")
+    parser.add_argument("--settle-timeout", type=float, default=5.0,
+                        help="Longest wait for the frequencies and rail power to settle after a transition (s)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Measure only the points a GP surrogate is least sure about and predict the rest")
+    parser.add_argument("--target-error", type=float, default=0.05,
+                        help="Adaptive sweep stops once the largest relative std of the surrogates falls below this")
+    parser.add_argument("--max-points", type=int, default=None, help="Measurement budget of the adaptive sweep")
+    args = parser.parse_args()
+    if (args.cluster_frequencies or args.core_counts) and not args.clusters:
+        parser.error("--cluster-frequencies and --core-counts need --clusters")
+    if args.checkpoint is None:
+        args.checkpoint = CHECKPOINT_NAME if not (args.clusters or args.emc) else \
+            CONFIG_NAME + "-clusters" * args.clusters + "-emc" * args.emc + "-sweep.json"
+    return args
 
 if __name__ == "__main__":
-    result = {}
-    for cpu_config in CPU_CONFIGS:
-        for gpu_config in GPU_CONFIGS:
-            setCpu(cpu_config)
-            setGpu(gpu_config)
-            time.sleep(5)
-            print(CONFIG_NAME, " CPU: ", getCpuStatus(), " GPU: ", getGpuStatus())
-            
-            # Logging
-            logger = APL.AGXPowerLogger()
-            logger.start()
-            t0 = time.perf_counter()
+    args = parse_args()
+    backend = None
+    if args.simulate:
+        backend = SimulatedBackend.fromResults(speedup=args.speedup, noise=args.noise, transitionDelay=args.transition_delay)
+        setBackend(backend)
+    else:
+        # Loaded and warmed up once; the sweep measures steady-state detection only
+        detector = YOLODetector(image_width=IMAGE_WIDTH, batch=args.batch)
+        detector.load()
+
+    clock = backend.monotonic if backend else time.perf_counter
+    sleep = backend.sleep if backend else time.sleep
+
+    logger = APL.AGXPowerLogger()
+
+    space = knob_space(args)
+    print(CONFIG_NAME, " Knobs: ", " ".join(space.names), " Points: ", len(space.configs()))
+
+    def set_point(point):
+        space.apply(point)
+        settle = wait_settled(point, read_frequencies=space.read, clock=clock, sleep=sleep, timeout=args.settle_timeout)
+        print(CONFIG_NAME, space.describe(space.read()), " Settle: ", settle["seconds"])
+        return settle
+
+    def detect():
+        if backend:
+            t0 = clock()
+            latencies = list(backend.streamWorkload(CONFIG_NAME, FPS_MULTIPLIER))
+            return latency_stats(latencies, clock() - t0)
+        return detector.run(IMAGE_PATH, clock=clock)
+
+    def measure(point):
+        stats = {}
+        values = measure_energy(lambda: stats.update(detect()), clock, logger)
 
-            detect_yolov8(IMAGE_PATH, IMAGE_WIDTH)
+        print("Latency: ", values[0])
+        print("GPU Energy Consumption: ", values[1])
+        print("CPU Energy Consumption: ", values[2])
+        print("Memory Energy Consumption: ", values[3])
+        print("FPS: ", stats["rate"], " p50: ", stats["p50"], " p95: ", stats["p95"], " p99: ", stats["p99"])
+        return {CONFIG_NAME: values, FRAMES_CONFIG_NAME: tuple(stats[k] for k in FRAME_STATS)}
 
-            t1 = time.perf_counter()
-            logger.stop()
+    repetition_options = dict(warmup=args.warmup, ci_width=args.ci_width, confidence=args.confidence,
+                              max_repetitions=args.max_repetitions)
+    if args.adaptive:
+        sweep = AdaptiveSweep(space.values, {CONFIG_NAME: FPS_MULTIPLIER},
+                              slo_levels={CONFIG_NAME: trace_levels("fps-od-trace.json")},
+                              target_error=args.target_error, max_points=args.max_points,
+                              repetitions=args.repetitions, checkpoint=args.checkpoint, **repetition_options)
+    else:
+        sweep = Sweep(serpentine(*space.values), args.repetitions, args.checkpoint,
+                      ci_outputs=[CONFIG_NAME], **repetition_options)
+    sweep.run(set_point, measure)
 
-            latency = t1 - t0
-            energy = logger.getTotalEnergy()
-            print("Latency: ", latency)
-            print("GPU Energy Consumption: ", energy[0])
-            print("CPU Energy Consumption: ", energy[1])
-            print("Memory Energy Consumption: ", energy[2])
-            result[str(cpu_config) + ":" + str(gpu_config)] = (float(latency), float(energy[0]), float(energy[1]), float(energy[2]))
-            logger.reset()
-    
-    with open(CONFIG_NAME + ".json", 'w') as file:
-        json.dump(result, file, indent=4)
\ No newline at end of file
+    sweep.write(CONFIG_NAME, CONFIG_NAME + ".json")
+    sweep.write_store(CONFIG_NAME, CONFIG_NAME + ".npz", knobs=space.names)
+    sweep.write_statistics(CONFIG_NAME, CONFIG_NAME + "-stats.json")
+    sweep.write(FRAMES_CONFIG_NAME, FRAMES_CONFIG_NAME + ".json")
+    sweep.write_transitions(CONFIG_NAME + "-settle.json")
@@ -0,0 +1,40 @@
+import time
+import numpy as np
+import power.AGXPowerLogger as APL
+from dvfs.lib import getCpuStatus, getGpuStatus, getEmcStatus
+
+def current_frequencies(emc=False):
+    """Frequencies the CPU and GPU (and with `emc` the memory clock) currently run at"""
+    if emc:
+        return getCpuStatus(), getGpuStatus(), getEmcStatus()
+    return getCpuStatus(), getGpuStatus()
+
+def wait_settled(target, read_frequencies=None, read_power=APL.readAllPowerValue,
+                 clock=time.perf_counter, sleep=time.sleep, timeout=5.0, poll=0.05, window=5, tolerance=0.05):
+    """Polls until the current frequencies reach target and the rail power stops drifting.
+
+    Power counts as settled once the means of two consecutive windows of `window` polls agree
+    within `tolerance` (relative, per rail). Returns {"seconds": time taken, "settled": False
+    if `timeout` ran out first}.
+    """
+    t0 = clock()
+    target = tuple(target)
+    if read_frequencies is None:
+        emc = len(target) > 2
+        read_frequencies = lambda: current_frequencies(emc)
+    reached = False
+    samples = []
+    while True:
+        elapsed = clock() - t0
+        if not reached:
+            reached = tuple(read_frequencies()) == target
+        if reached:
+            samples.append(read_power())
+            if len(samples) >= 2 * window:
+                previous = np.mean(samples[-2 * window:-window], axis=0)
+                current = np.mean(samples[-window:], axis=0)
+                if np.all(np.abs(current - previous) <= tolerance * np.maximum(np.abs(previous), 1e-9)):
+                    return {"seconds": float(clock() - t0), "settled": True}
+        if elapsed >= timeout:
+            return {"seconds": float(elapsed), "settled": False}
+        sleep(poll)
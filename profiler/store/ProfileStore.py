@@ -0,0 +1,207 @@
+"""Columnar profile store.
+
+A profile is kept as an uncompressed .npz with one dense array per quantity over the
+frequency grid, so it can be memory-mapped member by member instead of parsed:
+
+    axis_<knob>   (n_knob,)                       int64, one per knob, sorted
+    latency       (n_knob0, n_knob1, ..., reps)   float64 seconds, NaN where not measured
+    energy        (n_knob0, n_knob1, ..., reps, rails)  float64 uJ per rail
+    meta          0-d str                         JSON: workload, device, date, knobs, rails, units
+
+Convert the JSON profiles with
+
+    python profiler/store/ProfileStore.py result/final/yolov8-640.json ...
+
+Profiles swept over the memory clock have a third knob, emc.
+"""
+import argparse
+import datetime
+import json
+import struct
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+KNOBS = ("cpu", "gpu", "emc")
+RAILS = ("gpu", "cpu", "memory")
+UNITS = {"latency": "s", "energy": "uJ", "cpu": "kHz", "gpu": "Hz", "emc": "Hz"}
+
+def parse_key(key):
+    return tuple(int(v) for v in key.split(":"))
+
+class ProfileStore:
+    """Latency and per-rail energy of one workload over a dense frequency grid, with repetitions"""
+
+    def __init__(self, axes, latency, energy, meta=None):
+        self.axes = {name: np.asarray(axis) for name, axis in axes.items()}
+        self.knobs = tuple(self.axes)
+        self.latency = latency
+        self.energy = energy
+        self.meta = dict(meta or {})
+        self.meta.setdefault("knobs", list(self.knobs))
+        self.meta.setdefault("rails", list(RAILS))
+        self.meta.setdefault("units", {k: UNITS[k] for k in ("latency", "energy") + self.knobs if k in UNITS})
+
+    @property
+    def shape(self):
+        return tuple(len(axis) for axis in self.axes.values())
+
+    @property
+    def repetitions(self):
+        return self.latency.shape[-1]
+
+    # Construction
+
+    @classmethod
+    def fromTable(cls, table, knobs=None, **meta):
+        """From {"cpu:gpu": [latency, energies...]} or {"cpu:gpu": [[latency, energies...], ...]} (per repetition).
+
+        The keys must cover the full grid of their distinct knob values, or ValueError is raised.
+        Keys may carry an EMC frequency ("cpu:gpu:emc"); knobs default to the leading KNOBS of the key length."""
+        keys = [parse_key(k) for k in table]
+        if knobs is None:
+            knobs = KNOBS[:len(keys[0])] if keys else KNOBS[:2]
+        if any(len(k) != len(knobs) for k in keys):
+            raise ValueError("keys do not match the knobs %s" % (knobs,))
+        runs = []
+        for values in table.values():
+            values = np.asarray(values, dtype=float)
+            runs.append(values[None, :] if values.ndim == 1 else values)
+
+        axes = {name: np.unique([k[i] for k in keys]).astype(np.int64) for i, name in enumerate(knobs)}
+        reps = max(r.shape[0] for r in runs)
+        rails = runs[0].shape[1] - 1
+        shape = tuple(len(a) for a in axes.values())
+        if len(set(keys)) != int(np.prod(shape)):
+            raise ValueError("%d points do not cover the %s grid of their axes" % (len(set(keys)), "x".join(map(str, shape))))
+        latency = np.full(shape + (reps,), np.nan)
+        energy = np.full(shape + (reps, rails), np.nan)
+        for key, values in zip(keys, runs):
+            index = tuple(int(np.searchsorted(axes[name], v)) for name, v in zip(knobs, key))
+            latency[index][:values.shape[0]] = values[:, 0]
+            energy[index][:values.shape[0]] = values[:, 1:]
+        return cls(axes, latency, energy, meta)
+
+    @classmethod
+    def fromJson(cls, path, knobs=None, **meta):
+        path = Path(path)
+        with open(path, 'r') as file:
+            table = json.load(file)
+        meta.setdefault("workload", path.stem)
+        meta.setdefault("source", path.name)
+        return cls.fromTable(table, knobs, **meta)
+
+    # Persistence
+
+    def save(self, path):
+        meta = dict(self.meta)
+        meta.setdefault("date", datetime.datetime.now().isoformat(timespec="seconds"))
+        arrays = {"axis_" + name: axis for name, axis in self.axes.items()}
+        np.savez(path, latency=np.asarray(self.latency), energy=np.asarray(self.energy),
+                 meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads a store; with mmap the arrays are read-only views of the file"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            knobs = meta["knobs"]
+            if not mmap:
+                axes = {name: data["axis_" + name] for name in knobs}
+                return cls(axes, data["latency"], data["energy"], meta)
+
+        arrays = memmap_npz(path)
+        axes = {name: arrays["axis_" + name] for name in knobs}
+        return cls(axes, arrays["latency"], arrays["energy"], meta)
+
+    # Queries
+
+    def index(self, **freqs):
+        """Grid index of exact knob frequencies, e.g. index(cpu=..., gpu=...)"""
+        index = []
+        for name in self.knobs:
+            axis = self.axes[name]
+            i = int(np.searchsorted(axis, freqs[name]))
+            if i >= len(axis) or axis[i] != freqs[name]:
+                raise KeyError("%s frequency %s is not on the grid" % (name, freqs[name]))
+            index.append(i)
+        return tuple(index)
+
+    def at(self, **freqs):
+        """(latency per repetition, energy per repetition and rail) at one grid point"""
+        index = self.index(**freqs)
+        return self.latency[index], self.energy[index]
+
+    def mean(self):
+        """(latency, energy) averaged over repetitions, shapes grid and grid + (rails,)"""
+        return np.nanmean(self.latency, axis=-1), np.nanmean(self.energy, axis=-2)
+
+    def configs(self):
+        """Every grid point, (n, knobs), with the first knob varying slowest"""
+        grids = np.meshgrid(*self.axes.values(), indexing="ij")
+        return np.stack([g.ravel() for g in grids], axis=1)
+
+    def flat(self):
+        """(configs, latency, energy) over the flattened grid, averaged over repetitions"""
+        latency, energy = self.mean()
+        return self.configs(), latency.ravel(), energy.reshape(-1, energy.shape[-1])
+
+    def toTable(self):
+        """The string-keyed JSON schema of result/final (mean over repetitions)"""
+        configs, latency, energy = self.flat()
+        table = {}
+        for config, l, e in zip(configs, latency, energy):
+            if not np.isnan(l):
+                table[":".join(str(int(v)) for v in config)] = [float(l)] + [float(v) for v in e]
+        return table
+
+def memmap_npz(path):
+    """Memory-maps every member of an uncompressed .npz as a read-only array"""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as file:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("%s is compressed and cannot be memory-mapped" % info.filename)
+            # Skip the local file header to the .npy member
+            file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", file.read(4))
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(file)
+            name = info.filename[:-len(".npy")] if info.filename.endswith(".npy") else info.filename
+            if dtype.hasobject:
+                raise ValueError("%s holds Python objects" % name)
+            if not shape or 0 in shape:
+                # 0-d and empty members cannot be mapped; they are small, read them directly
+                arrays[name] = np.fromfile(file, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=file.tell(), shape=shape,
+                                     order='F' if fortran else 'C')
+    return arrays
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Converts result/final JSON profiles to .npz profile stores")
+    parser.add_argument("profiles", nargs="+", help="JSON profiles keyed by \"cpu:gpu\" or \"cpu:gpu:emc\"")
+    parser.add_argument("--output-dir", default=None, help="Default: next to each JSON file")
+    parser.add_argument("--device", default="jetson-agx-orin")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    for path in map(Path, args.profiles):
+        with open(path, 'r') as file:
+            table = json.load(file)
+        if "default:default" in table:
+            print("Skipping", path, "(default governor, not a grid)")
+            continue
+        store = ProfileStore.fromTable(table, workload=path.stem, device=args.device, source=path.name)
+        output = Path(args.output_dir or path.parent) / (path.stem + ".npz")
+        store.save(output)
+        print(path, "->", output, store.shape, store.repetitions, "repetitions")
+
+if __name__ == "__main__":
+    main()
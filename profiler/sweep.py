@@ -0,0 +1,187 @@
+import json
+import os
+import time
+import numpy as np
+from scipy.stats import t as student_t
+import power.AGXPowerLogger as APL
+from store.ProfileStore import ProfileStore
+
+def point_key(point):
+    return ":".join(str(v) for v in point)
+
+def serpentine(*axes):
+    """Grid over the knob axes (e.g. cpu, gpu[, emc]) in boustrophedon order: each axis reverses
+    direction whenever the axis before it steps, so consecutive points differ by one step of a single knob"""
+    points = [()]
+    for axis in axes:
+        rows = []
+        for i, prefix in enumerate(points):
+            row = axis if i % 2 == 0 else list(reversed(axis))
+            rows.extend(prefix + (value,) for value in row)
+        points = rows
+    return points
+
+def relative_interval(values, confidence=0.95):
+    """Full width of the Student-t confidence interval of the mean, relative to the mean"""
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    mean = values.mean() if n else 0.0
+    if n < 2 or mean == 0:
+        return np.inf
+    half = student_t.ppf((1 + confidence) / 2, n - 1) * values.std(ddof=1) / np.sqrt(n)
+    return float(2 * half / abs(mean))
+
+def summarize(values):
+    values = np.asarray(values, dtype=float)
+    p50, p99 = np.percentile(values, [50, 99])
+    return {
+        "mean": float(values.mean()),
+        "std": float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+        "p50": float(p50),
+        "p99": float(p99),
+    }
+
+def measure_energy(fn, clock=time.perf_counter, logger=None):
+    """Runs fn under the power logger and returns (latency, GPU, CPU, memory energy)"""
+    if logger is None:
+        logger = APL.AGXPowerLogger()
+    logger.reset()
+    logger.start()
+    t0 = clock()
+
+    fn()
+
+    t1 = clock()
+    logger.stop()
+
+    energy = logger.getTotalEnergy()
+    return (float(t1 - t0), float(energy[0]), float(energy[1]), float(energy[2]))
+
+class Sweep:
+    """Measures several outputs at every frequency point, with repetitions and resumable checkpoints.
+
+    The checkpoint holds every repetition as {output: {"cpu:gpu": [[latency, energies...], ...]}}
+    and the transitions into each point as {"cpu:gpu": {"from": previous point, settle record}},
+    and is rewritten atomically after each repetition, so an interrupted sweep picks up where it stopped.
+    Points are measured in the given order; serpentine() keeps every transition small.
+
+    Each point gets `warmup` discarded runs after its transition, then at least `repetitions`
+    runs. With `ci_width` set, runs continue until the `confidence` interval of the mean latency
+    and mean power of every output in `ci_outputs` (default: all) is narrower than ci_width
+    (relative to the mean), up to `max_repetitions`, so noisy points get more runs than stable ones.
+    """
+
+    def __init__(self, points, repetitions=1, checkpoint=None, warmup=0, ci_width=None, confidence=0.95,
+                 max_repetitions=10, ci_outputs=None):
+        self.points = list(points)
+        self.repetitions = repetitions
+        self.checkpoint = checkpoint
+        self.warmup = warmup
+        self.ci_width = ci_width
+        self.confidence = confidence
+        self.ci_outputs = ci_outputs
+        self.max_repetitions = max(max_repetitions, repetitions) if ci_width is not None else repetitions
+        self.runs = {}
+        self.transitions = {}
+        self.previous = None
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint, 'r') as file:
+                state = json.load(file)
+            if "runs" in state:
+                self.runs = state["runs"]
+                self.transitions = state.get("transitions", {})
+            else:
+                self.runs = state
+
+    def done(self, key):
+        """Number of repetitions completed at a point, for every output"""
+        if not self.runs:
+            return 0
+        return min(len(runs.get(key, [])) for runs in self.runs.values())
+
+    def complete(self, key):
+        """Whether a point has enough repetitions: the minimum, and a narrow enough interval or the cap"""
+        n = self.done(key)
+        if n >= self.max_repetitions:
+            return True
+        if n < self.repetitions:
+            return False
+        for name, runs in self.runs.items():
+            if self.ci_outputs is not None and name not in self.ci_outputs:
+                continue
+            values = np.asarray(runs[key], dtype=float)
+            power = values[:, 1:].sum(axis=1) / values[:, 0]
+            if max(relative_interval(values[:, 0], self.confidence), relative_interval(power, self.confidence)) > self.ci_width:
+                return False
+        return True
+
+    def run(self, set_point, measure):
+        """Calls set_point(point) once per point with work left, then measure(point) per repetition.
+
+        set_point may return a settle record (e.g. settle.wait_settled()), which is kept per transition.
+        measure returns {output name: (latency, GPU, CPU, memory energy)}."""
+        for point in self.points:
+            self.measure_point(point, set_point, measure)
+
+    def measure_point(self, point, set_point, measure):
+        key = point_key(point)
+        if self.complete(key):
+            return
+
+        settle = set_point(point)
+        if settle is not None:
+            self.transitions[key] = dict(settle, **{"from": self.previous})
+        self.previous = key
+
+        for _ in range(self.warmup):
+            measure(point)
+        while not self.complete(key):
+            for name, values in measure(point).items():
+                self.runs.setdefault(name, {}).setdefault(key, []).append(list(values))
+            self.save()
+
+    def save(self):
+        if self.checkpoint is None:
+            return
+        tmp = self.checkpoint + ".tmp"
+        with open(tmp, 'w') as file:
+            json.dump({"runs": self.runs, "transitions": self.transitions}, file)
+        os.replace(tmp, self.checkpoint)
+
+    def results(self, name):
+        """Mean over repetitions per point, in the result/final schema"""
+        result = {}
+        for key, runs in self.runs.get(name, {}).items():
+            result[key] = tuple(float(sum(column) / len(column)) for column in zip(*runs))
+        return result
+
+    def write(self, name, fname):
+        with open(fname, 'w') as file:
+            json.dump(self.results(name), file, indent=4)
+
+    def statistics(self, name):
+        """Per point: repetitions, and mean/std/p50/p99 of latency, power and per-rail energy"""
+        result = {}
+        for key, runs in self.runs.get(name, {}).items():
+            values = np.asarray(runs, dtype=float)
+            result[key] = {
+                "repetitions": len(values),
+                "latency": summarize(values[:, 0]),
+                "power": summarize(values[:, 1:].sum(axis=1) / values[:, 0]),
+                "energy": [summarize(values[:, r]) for r in range(1, values.shape[1])],
+            }
+        return result
+
+    def write_statistics(self, name, fname):
+        with open(fname, 'w') as file:
+            json.dump(self.statistics(name), file, indent=4)
+
+    def write_store(self, name, fname, **meta):
+        """Every repetition of an output as a columnar ProfileStore (.npz)"""
+        meta.setdefault("workload", name)
+        ProfileStore.fromTable(self.runs.get(name, {}), **meta).save(fname)
+
+    def write_transitions(self, fname):
+        """Settle record of the transition into each point, {"cpu:gpu": {"from", "seconds", "settled"}}"""
+        with open(fname, 'w') as file:
+            json.dump(self.transitions, file, indent=4)
@@ -1,7 +1,9 @@
 import torch
 import time
+from contextlib import nullcontext
 from transformers import AutoProcessor, Gemma3ForConditionalGeneration
 from transformers.cache_utils import HybridCache
+from task.caches import LRUCache, cache_tensors, tensor_digest
 
 torch._dynamo.config.disable = True
 
@@ -9,6 +11,9 @@ class VLMPipeline:
     MODEL_NAME = "google/gemma-3-4b-it-qat-q4_0-unquantized"
     IMAGE_PATH = "../assets/test.jpg"
     OUTPUT_TOKENS = 100
+    EOS_CHECK_EVERY = 8
+    VISION_CACHE_BYTES = 256 << 20
+    PREFIX_CACHE_BYTES = 1 << 30
     DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
     def __init__(self):
@@ -23,6 +28,13 @@ class VLMPipeline:
         self.batch_size = None
         self.past_kv = None
         self.prefill_output = None
+        self.full_mask = None
+        self.max_cache_len = None
+        self.cache_positions = None
+        self.token_buffer = None
+        self.timeline = None
+        self.vision_cache = None
+        self.prefix_cache = None
 
     def load_model(self):
         print("\nLoading model...")
@@ -86,19 +98,37 @@ class VLMPipeline:
         total_seq_len = self.prefill_seq_len + self.OUTPUT_TOKENS
         print(f"Initializing cache for total sequence length: {total_seq_len}")
 
+        self.max_cache_len = total_seq_len
+        self.past_kv = self.make_cache(self.batch_size, total_seq_len)
+        print("Created HybridCache instance.")
+
+        # Decode state for the whole output, so that decode_benchmark() allocates nothing per step
+        self.full_mask = torch.ones((self.batch_size, total_seq_len), dtype=self.attention_mask.dtype, device=self.DEVICE)
+        self.full_mask[:, :self.prefill_seq_len] = self.attention_mask
+        self.cache_positions = torch.arange(self.prefill_seq_len, total_seq_len, device=self.DEVICE)
+        self.token_buffer = torch.empty((self.batch_size, self.OUTPUT_TOKENS), dtype=torch.long, device=self.DEVICE)
+
+    def make_cache(self, batch_size, max_cache_len):
         cache_kwargs = {
-            "max_batch_size": self.batch_size,
-            "max_cache_len": total_seq_len
+            "max_batch_size": batch_size,
+            "max_cache_len": max_cache_len
         }
-        self.past_kv = HybridCache(
+        return HybridCache(
             self.model.language_model.config,
             device=self.DEVICE,
             dtype=self.model.dtype,
             **cache_kwargs
         )
-        print("Created HybridCache instance.")
 
-    def prefill(self):
+    def reset_cache(self):
+        """Clears the HybridCache in place so that the resident model can prefill again"""
+        self.past_kv.reset()
+        self.prefill_output = None
+
+    def prefill(self, meter=None):
+        if self.prefix_cache is not None:
+            return self.prefill_cached(meter)
+
         print("\nPrefilling...")
         start = time.time()
         inputs = {
@@ -111,12 +141,128 @@ class VLMPipeline:
             "output_attentions": False,
             "output_hidden_states": False,
         }
-        with torch.no_grad():
+        with torch.no_grad(), (meter.region("prefill") if meter is not None else nullcontext()):
             self.prefill_output = self.model(**inputs)
         self.past_kv = self.prefill_output.past_key_values
         print(f"Prefill time: {round(time.time() - start, 2)} seconds")
 
-    def decode(self):
+    def enable_caches(self, vision_bytes=VISION_CACHE_BYTES, prefix_bytes=PREFIX_CACHE_BYTES):
+        """Makes prefill() go through an image-embedding cache and a prefix-KV cache (LRU, bytes)"""
+        self.vision_cache = LRUCache(vision_bytes)
+        self.prefix_cache = LRUCache(prefix_bytes)
+
+    def image_token_id(self):
+        config = self.model.config
+        token = getattr(config, "image_token_id", None)
+        return token if token is not None else config.image_token_index
+
+    def image_features(self, key):
+        """Vision tower output for self.pixel_values, cached under its content hash"""
+        features = self.vision_cache.get(key)
+        if features is None:
+            features = self.model.get_image_features(self.pixel_values)
+            self.vision_cache.put(key, features)
+        return features
+
+    def embed(self, input_ids, image_features=None):
+        """Token embeddings with image_features scattered over the image tokens"""
+        image_mask = input_ids == self.image_token_id()
+        ids = input_ids.clone()
+        # The image token may lie outside the embedding table
+        ids[image_mask] = 0
+        embeds = self.model.get_input_embeddings()(ids)
+        if image_features is not None:
+            mask = image_mask.unsqueeze(-1).expand_as(embeds)
+            embeds = embeds.masked_scatter(mask, image_features.to(embeds.device, embeds.dtype))
+        return embeds
+
+    def chunk_mask(self, a, b):
+        """Additive 4-D mask of prompt tokens a..b over the whole cache, as Gemma3 builds it for a full
+        prefill: causal over the unpadded prompt, and bidirectional within each image. Gemma3 itself
+        would compare the chunk's token types against cache columns 0..b-a, not a..b."""
+        length = self.prefill_seq_len
+        keys = torch.arange(self.max_cache_len, device=self.DEVICE)
+        queries = keys[a:b]
+        valid = torch.zeros(self.max_cache_len, dtype=torch.bool, device=self.DEVICE)
+        valid[:length] = self.attention_mask[0].bool()
+        allowed = (keys[None, :] <= queries[:, None]) & valid[None, :]
+
+        if self.token_type_ids is not None:
+            image = torch.zeros(self.max_cache_len, dtype=torch.bool, device=self.DEVICE)
+            image[:length] = self.token_type_ids[0] == 1
+            # Consecutive image tokens form one image
+            starts = image & ~torch.cat([image.new_zeros(1), image[:-1]])
+            group = torch.cumsum(starts, dim=0)
+            allowed |= image[a:b, None] & image[None, :] & (group[a:b, None] == group[None, :])
+
+        mask = torch.zeros(allowed.shape, dtype=self.model.dtype, device=self.DEVICE)
+        mask.masked_fill_(~allowed, torch.finfo(self.model.dtype).min)
+        return mask[None, None]
+
+    def prefill_cached(self, meter=None):
+        """prefill() that reuses cached vision features and prompt-prefix KV.
+
+        The prompt is split at two boundaries: before the first image token (the system and
+        chat-template text, shared by all requests), and before the last token (keyed by the
+        token ids and the image hash, so a repeated frame with a fixed prompt hits). The
+        longest cached prefix is copied into the HybridCache and only the tail is run. The
+        vision tower runs only on an image-cache miss. Missing prefixes are stored on the way.
+        Needs batch size 1, and a cache no longer than the sliding window so that every layer
+        is indexed by position. Every chunk gets the mask of chunk_mask(), so its image tokens
+        attend to each other exactly as in a full prefill.
+        """
+        if self.batch_size != 1:
+            raise ValueError("the prefill caches hold batch-1 prompts")
+        window = getattr(self.model.language_model.config, "sliding_window", None)
+        if window is not None and self.max_cache_len > window:
+            raise ValueError("max_cache_len %d exceeds the sliding window %d" % (self.max_cache_len, window))
+
+        print("\nPrefilling...")
+        start = time.time()
+        ids = self.input_ids[0].tolist()
+        length = len(ids)
+        image_token = self.image_token_id()
+        image_start = ids.index(image_token) if image_token in ids else None
+        image_key = tensor_digest(self.pixel_values) if image_start is not None else ""
+
+        boundaries = sorted({b for b in (image_start, length - 1) if b})
+        keys = {}
+        for b in boundaries:
+            keys[b] = tensor_digest(self.input_ids[:, :b]) + (image_key if image_start is not None and b > image_start else "")
+
+        with torch.no_grad(), (meter.region("prefill") if meter is not None else nullcontext()):
+            done = 0
+            for b in reversed(boundaries):
+                kv = self.prefix_cache.get(keys[b])
+                if kv is not None:
+                    for (k, v), (prefix_k, prefix_v) in zip(cache_tensors(self.past_kv), kv):
+                        k[:, :, :b] = prefix_k
+                        v[:, :, :b] = prefix_v
+                    done = b
+                    break
+
+            ends = [b for b in boundaries if b > done] + [length]
+            for a, b in zip([done] + ends[:-1], ends):
+                features = None
+                if image_start is not None and a <= image_start < b:
+                    features = self.image_features(image_key)
+                out = self.model(
+                    inputs_embeds=self.embed(self.input_ids[:, a:b], features),
+                    attention_mask=self.chunk_mask(a, b),
+                    past_key_values=self.past_kv,
+                    cache_position=torch.arange(a, b, device=self.DEVICE),
+                    use_cache=True,
+                    output_attentions=False,
+                    output_hidden_states=False,
+                )
+                self.past_kv = out.past_key_values
+                if b in keys:
+                    self.prefix_cache.put(keys[b], [(k[:, :, :b].clone(), v[:, :, :b].clone())
+                                                    for k, v in cache_tensors(self.past_kv)])
+            self.prefill_output = out
+        print(f"Prefill time: {round(time.time() - start, 2)} seconds (tail {length - done} tokens)")
+
+    def decode(self, meter=None):
         print("\nDecoding...")
         start = time.time()
         eos_id = self.processor.tokenizer.eos_token_id
@@ -128,6 +274,8 @@ class VLMPipeline:
         current_mask = self.attention_mask
 
         for step in range(self.OUTPUT_TOKENS):
+            if meter is not None:
+                meter.mark("decode_token")
             inp_id = next_token.unsqueeze(-1)
             cache_pos = torch.tensor([self.prefill_seq_len + step], device=self.DEVICE)
 
@@ -164,12 +312,95 @@ class VLMPipeline:
                 torch.ones((self.batch_size, 1), dtype=torch.long, device=self.DEVICE)
             ], dim=-1)
 
+        if meter is not None:
+            meter.endMark("decode_token")
+
         result = self.processor.decode(generated_ids, skip_special_tokens=True)
         print("\n--- Decoding Finished ---")
         print("Result:", result)
         print(f"Decoding time: {round(time.time() - start, 2)} seconds")
         return result
 
+    def decode_benchmark(self, meter=None, eos_every=None):
+        """Greedy decode without per-step host work, for measurement.
+
+        The attention mask, cache positions and token buffer are preallocated by setup_cache()
+        and sliced per step, tokens stay on the device, EOS is checked every `eos_every` steps
+        (one sync each) and the output is detokenized once at the end. Tokens generated past an
+        EOS within the last window are dropped. self.timeline holds the completion time (s) of
+        every token since the start of the loop; token_latencies() the per-token latencies.
+        With a meter, every step is synchronized so that its energy is attributed to its token.
+        """
+        eos_every = eos_every or self.EOS_CHECK_EVERY
+        eos_id = self.processor.tokenizer.eos_token_id
+        cuda = self.DEVICE == "cuda"
+
+        if cuda:
+            events = [torch.cuda.Event(enable_timing=True) for _ in range(self.OUTPUT_TOKENS + 1)]
+            events[0].record()
+        else:
+            stamps = [time.perf_counter()]
+
+        next_token = torch.argmax(self.prefill_output.logits[:, -1, :], dim=-1)
+        steps = 0
+        with torch.no_grad():
+            for step in range(self.OUTPUT_TOKENS):
+                if meter is not None:
+                    if cuda:
+                        torch.cuda.synchronize()
+                    meter.mark("decode_token")
+                self.token_buffer[:, step] = next_token
+                length = self.prefill_seq_len + step + 1
+
+                out = self.model(
+                    input_ids=self.token_buffer[:, step:step + 1],
+                    attention_mask=self.full_mask[:, :length],
+                    past_key_values=self.past_kv,
+                    cache_position=self.cache_positions[step:step + 1],
+                    pixel_values=None,
+                    token_type_ids=None,
+                    use_cache=True,
+                    output_attentions=False,
+                    output_hidden_states=False,
+                )
+                next_token = torch.argmax(out.logits[:, -1, :], dim=-1)
+                self.past_kv = out.past_key_values
+                steps = step + 1
+
+                if cuda:
+                    events[steps].record()
+                else:
+                    stamps.append(time.perf_counter())
+
+                if steps % eos_every == 0 or steps == self.OUTPUT_TOKENS:
+                    if (self.token_buffer[:, :steps] == eos_id).any(dim=1).all().item():
+                        break
+
+        if meter is not None:
+            if cuda:
+                torch.cuda.synchronize()
+            meter.endMark("decode_token")
+
+        if cuda:
+            torch.cuda.synchronize()
+            self.timeline = [events[0].elapsed_time(e) / 1e3 for e in events[1:steps + 1]]
+        else:
+            self.timeline = [t - stamps[0] for t in stamps[1:]]
+
+        tokens = self.token_buffer[:, :steps].tolist()
+        results = []
+        for ids in tokens:
+            if eos_id in ids:
+                ids = ids[:ids.index(eos_id) + 1]
+            results.append(self.processor.decode(ids, skip_special_tokens=True))
+        return results[0] if len(results) == 1 else results
+
+    def token_latencies(self):
+        """Per-token latency (s) of the last decode_benchmark()"""
+        if not self.timeline:
+            return []
+        return [self.timeline[0]] + [b - a for a, b in zip(self.timeline, self.timeline[1:])]
+
 
 if __name__ == "__main__":
     pipeline = VLMPipeline()
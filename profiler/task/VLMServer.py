@@ -0,0 +1,246 @@
+import time
+from collections import deque
+import numpy as np
+import torch
+from task.caches import cache_tensors
+
+class Request:
+    """One conversation submitted to a VLMServer, with its generated tokens and timing"""
+
+    def __init__(self, messages, max_new_tokens, request_id=None):
+        self.request_id = request_id
+        self.messages = messages
+        self.max_new_tokens = max_new_tokens
+
+        self.prompt_tokens = None
+        self.slot = None
+        self.start = None
+        self.arrival = None
+        self.admitted = None
+        self.first_token = None
+        self.finish = None
+        self.tokens = []
+        self.text = None
+
+    def stats(self):
+        decode = self.finish - self.first_token
+        return {
+            "id": self.request_id,
+            "prompt_tokens": self.prompt_tokens,
+            "tokens": len(self.tokens),
+            "queue": self.admitted - self.arrival,
+            "ttft": self.first_token - self.arrival,
+            "seconds": self.finish - self.admitted,
+            "tps": len(self.tokens) / (self.finish - self.admitted),
+            "decode_tps": (len(self.tokens) - 1) / decode if decode > 0 else None,
+        }
+
+class VLMServer:
+    """Serves a queue of requests from a resident VLMPipeline with continuous batching.
+
+    The decode batch has `max_batch_size` slots over one HybridCache. All slots advance at a
+    shared cache index, and each row carries its own position ids and attention mask. Queued
+    requests are left-padded and prefilled together in a scratch cache. Their KV is copied into
+    free slots, right-aligned to the current index, so new requests join between decode steps.
+    A finished sequence leaves its slot and its stale KV is masked out. When the index would run
+    past max_cache_len, admission waits for the batch to drain and the cache is reset. EOS is
+    checked every `eos_every` steps. max_cache_len must not exceed the sliding window, so that
+    every layer's cache is indexed by position.
+    """
+
+    def __init__(self, pipeline, max_batch_size=4, max_cache_len=1024, eos_every=1, clock=time.perf_counter):
+        self.pipeline = pipeline
+        self.model = pipeline.model
+        self.processor = pipeline.processor
+        self.device = pipeline.DEVICE
+        self.max_batch_size = max_batch_size
+        self.max_cache_len = max_cache_len
+        self.eos_every = eos_every
+        self.clock = clock
+
+        window = getattr(self.model.language_model.config, "sliding_window", None)
+        if window is not None and max_cache_len > window:
+            raise ValueError("max_cache_len %d exceeds the sliding window %d" % (max_cache_len, window))
+
+        tokenizer = self.processor.tokenizer
+        self.eos_id = tokenizer.eos_token_id
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else self.eos_id
+
+        B, C = max_batch_size, max_cache_len
+        self.cache = pipeline.make_cache(B, C)
+        self.mask = torch.zeros((B, C), dtype=torch.long, device=self.device)
+        self.positions = torch.arange(C, device=self.device)
+        self.token_buffer = torch.full((B, C), self.pad_id, dtype=torch.long, device=self.device)
+        self.next_tokens = torch.full((B,), self.pad_id, dtype=torch.long, device=self.device)
+        self.position_ids = torch.zeros((B,), dtype=torch.long, device=self.device)
+        self.starts = torch.zeros((B,), dtype=torch.long, device=self.device)
+
+        self.slots = [None] * B
+        self.queue = deque()
+        self.finished = []
+        self.pos = 0
+        self.seconds = None
+
+    def submit(self, request):
+        request.arrival = self.clock()
+        self.queue.append(request)
+
+    def occupied(self):
+        return [r for r in self.slots if r is not None]
+
+    # Prefill
+
+    def tokenize(self, requests):
+        return self.processor.apply_chat_template(
+            [r.messages for r in requests],
+            tokenize=True,
+            return_dict=True,
+            return_tensors="pt",
+            add_generation_prompt=True,
+            padding=True,
+        ).to(self.device)
+
+    def admit(self):
+        """Prefills as many queued requests as there are free slots, if they fit the cache"""
+        free = [i for i, r in enumerate(self.slots) if r is None]
+        if not free or not self.queue:
+            return 0
+        requests = [self.queue[i] for i in range(min(len(free), len(self.queue)))]
+        inputs = self.tokenize(requests)
+        length = inputs["input_ids"].shape[1]
+        budget = max(r.max_new_tokens for r in requests)
+
+        if not self.occupied():
+            if length + budget > self.max_cache_len - 1:
+                raise ValueError("request of %d + %d tokens does not fit max_cache_len %d"
+                                 % (length, budget, self.max_cache_len))
+            self.cache.reset()
+            self.mask.zero_()
+            self.pos = length
+        elif length > self.pos or self.pos + budget > self.max_cache_len - 1:
+            # Cannot be right-aligned to the current index: wait for the batch to drain
+            return 0
+
+        admitted = self.clock()
+        for _ in requests:
+            self.queue.popleft()
+        rows = free[:len(requests)]
+        index = torch.tensor(rows, device=self.device)
+
+        attention_mask = inputs["attention_mask"]
+        scratch = self.pipeline.make_cache(len(requests), length)
+        with torch.no_grad():
+            out = self.model(
+                input_ids=inputs["input_ids"],
+                attention_mask=attention_mask,
+                position_ids=(attention_mask.cumsum(-1) - 1).clamp(min=0),
+                pixel_values=inputs.get("pixel_values"),
+                token_type_ids=inputs.get("token_type_ids"),
+                past_key_values=scratch,
+                cache_position=self.positions[:length],
+                use_cache=True,
+                output_attentions=False,
+                output_hidden_states=False,
+            )
+
+        # Right-align the prompts' KV to the shared index in their slots
+        a, b = self.pos - length, self.pos
+        for (dst_k, dst_v), (src_k, src_v) in zip(cache_tensors(self.cache), cache_tensors(scratch)):
+            dst_k[index, :, a:b] = src_k[:, :, :length]
+            dst_v[index, :, a:b] = src_v[:, :, :length]
+        self.mask[index] = 0
+        self.mask[index, a:b] = attention_mask
+        self.next_tokens[index] = torch.argmax(out.logits[:, -1, :], dim=-1)
+        self.position_ids[index] = attention_mask.sum(dim=-1)
+        self.starts[index] = self.pos
+
+        if self.device == "cuda":
+            torch.cuda.synchronize()
+        now = self.clock()
+        for row, request, prompt in zip(rows, requests, attention_mask.sum(dim=-1).tolist()):
+            request.slot = row
+            request.start = self.pos
+            request.prompt_tokens = prompt
+            request.admitted = admitted
+            request.first_token = now
+            self.slots[row] = request
+        return len(requests)
+
+    # Decode
+
+    def step(self):
+        self.token_buffer[:, self.pos] = self.next_tokens
+        # Free slots attend to their own tokens, so that no row is fully masked
+        self.mask[:, self.pos] = 1
+        with torch.no_grad():
+            out = self.model(
+                input_ids=self.next_tokens[:, None],
+                attention_mask=self.mask[:, :self.pos + 1],
+                position_ids=self.position_ids[:, None],
+                past_key_values=self.cache,
+                cache_position=self.positions[self.pos:self.pos + 1],
+                pixel_values=None,
+                token_type_ids=None,
+                use_cache=True,
+                output_attentions=False,
+                output_hidden_states=False,
+            )
+        self.next_tokens = torch.argmax(out.logits[:, -1, :], dim=-1)
+        self.cache = out.past_key_values
+        self.position_ids += 1
+        self.pos += 1
+
+    def retire(self):
+        """Frees the slots of sequences that emitted EOS or used up their token budget"""
+        valid = self.positions[None, :self.pos] >= self.starts[:, None]
+        eos = ((self.token_buffer[:, :self.pos] == self.eos_id) & valid).any(dim=1).tolist()
+        now = self.clock()
+
+        for row, request in enumerate(self.slots):
+            if request is None:
+                continue
+            if not eos[row] and self.pos - request.start < request.max_new_tokens:
+                continue
+            ids = self.token_buffer[row, request.start:self.pos].tolist()[:request.max_new_tokens]
+            if self.eos_id in ids:
+                ids = ids[:ids.index(self.eos_id) + 1]
+            request.tokens = ids
+            request.text = self.processor.decode(ids, skip_special_tokens=True)
+            request.finish = now
+            self.slots[row] = None
+            self.mask[row] = 0
+            self.finished.append(request)
+
+    def due(self):
+        """Whether some sequence may have finished since the last check"""
+        if (self.pos % self.eos_every) == 0:
+            return True
+        return any(self.pos - r.start >= r.max_new_tokens for r in self.occupied())
+
+    def run(self):
+        """Serves until the queue is empty and every slot has finished; returns report() of this run"""
+        self.finished = []
+        t0 = self.clock()
+        while self.queue or self.occupied():
+            self.admit()
+            self.step()
+            if self.due():
+                self.retire()
+        self.seconds = self.clock() - t0
+        return self.report()
+
+    def report(self):
+        """Aggregate and per-request TPS of the requests finished in the last run"""
+        per_request = [r.stats() for r in self.finished]
+        tokens = sum(s["tokens"] for s in per_request)
+        tps = np.array([s["tps"] for s in per_request]) if per_request else np.zeros(0)
+        return {
+            "requests": len(per_request),
+            "tokens": tokens,
+            "seconds": self.seconds,
+            "tps": tokens / self.seconds if self.seconds else None,
+            "request_tps_mean": float(tps.mean()) if tps.size else None,
+            "request_tps_p50": float(np.percentile(tps, 50)) if tps.size else None,
+            "request_tps_min": float(tps.min()) if tps.size else None,
+            "per_request": per_request,
+        }
@@ -0,0 +1,61 @@
+import hashlib
+from collections import OrderedDict
+import torch
+
+def cache_tensors(cache):
+    """(key, value) buffers of every layer, for both cache layouts of transformers"""
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+def tensor_digest(*tensors):
+    """Content hash of tensors (dtype, shape and bytes)"""
+    digest = hashlib.sha1()
+    for tensor in tensors:
+        tensor = tensor.detach().to("cpu").contiguous()
+        digest.update(str((tensor.dtype, tuple(tensor.shape))).encode())
+        digest.update(tensor.view(-1).view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()
+
+def nbytes(value):
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    return sum(nbytes(v) for v in value)
+
+class LRUCache:
+    """Tensors (or nested lists/tuples of tensors) under a total byte budget, evicting least recently used"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        size = nbytes(value)
+        if size > self.capacity:
+            return
+        if key in self.entries:
+            self.size -= nbytes(self.entries.pop(key))
+        while self.entries and self.size + size > self.capacity:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= nbytes(evicted)
+        self.entries[key] = value
+        self.size += size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
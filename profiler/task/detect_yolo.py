@@ -1,8 +1,69 @@
-from ultralytics import YOLO
+import time
+import numpy as np
+from task.stats import latency_stats
 
-def detect_yolov8(source_path, image_width, model_path="/home/jiaxi/cs525/Assets/models/yolov8n.pt", save_result=False):
-    model = YOLO(model_path)
-    results = model(source_path, imgsz=image_width, save=save_result)
+MODEL_PATH = "/home/jiaxi/cs525/Assets/models/yolov8n.pt"
+
+class YOLODetector:
+    """YOLOv8 detector that loads, fuses and warms up once and then streams over sources.
+
+    Frames are consumed one at a time from the streaming predictor, so no results are kept
+    and memory stays flat whatever the size of the source. With batch > 1 the per-frame
+    latency is that of the batch divided over its frames.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, image_width=640, batch=1, warmup=3, device=None):
+        self.model_path = model_path
+        self.image_width = image_width
+        self.batch = batch
+        self.warmup = warmup
+        self.device = device
+        self.model = None
+
+    def load(self):
+        from ultralytics import YOLO
+
+        print("\nLoading model...")
+        start = time.time()
+        self.model = YOLO(self.model_path)
+        self.model.fuse()
+        frame = np.zeros((self.image_width, self.image_width, 3), dtype=np.uint8)
+        for _ in range(self.warmup):
+            self.model.predict(frame, imgsz=self.image_width, device=self.device, verbose=False)
+        print(f"Model load time: {round(time.time() - start, 2)} seconds")
+
+    def stream(self, source_path, save_result=False):
+        """Yields (result, latency in s) per frame"""
+        if self.model is None:
+            self.load()
+        results = self.model.predict(source_path, imgsz=self.image_width, batch=self.batch, device=self.device,
+                                     save=save_result, stream=True, verbose=False)
+        for result in results:
+            # Preprocess, inference and postprocess time of this frame (ms, batch time per frame)
+            yield result, sum(result.speed.values()) / 1e3
+
+    def run(self, source_path, meter=None, clock=time.perf_counter, save_result=False):
+        """Detects every frame of source_path and returns its latency_stats(); model load and warmup are not timed"""
+        if self.model is None:
+            self.load()
+        latencies = []
+        t0 = clock()
+        if meter is not None:
+            meter.mark("frame")
+        for _, latency in self.stream(source_path, save_result):
+            latencies.append(latency)
+            if meter is not None:
+                meter.mark("frame")
+        if meter is not None:
+            meter.endMark("frame", discard=True)
+        return latency_stats(latencies, clock() - t0)
+
+def detect_yolov8(source_path, image_width, model_path=MODEL_PATH, save_result=False, meter=None):
+    """One-shot detection over source_path; long runs should keep a YOLODetector instead"""
+    detector = YOLODetector(model_path, image_width)
+    return detector.run(source_path, meter=meter, save_result=save_result)
 
 if __name__=="__main__":
-    detect_yolov8("/home/jiaxi/cs525/Assets/120_1K", 640)
+    detector = YOLODetector()
+    detector.load()
+    print(detector.run("/home/jiaxi/cs525/Assets/120_1K"))
@@ -0,0 +1,17 @@
+import numpy as np
+
+def latency_stats(latencies, seconds):
+    """Per-item (frame or token) latency percentiles (s) and the sustained rate (items/s) of a run"""
+    latencies = np.asarray(latencies, dtype=float)
+    if latencies.size == 0:
+        return {"count": 0, "seconds": seconds, "rate": 0.0, "mean": None, "p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "count": int(latencies.size),
+        "seconds": float(seconds),
+        "rate": latencies.size / seconds if seconds > 0 else None,
+        "mean": float(latencies.mean()),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+    }
@@ -0,0 +1,424 @@
+"""Closed-loop DVFS runtime daemon.
+
+Runs a DVFS controller in an asyncio loop. Every control period it takes the latest SLO
+targets, the GPU+CPU rail power measured by AGXPowerLogger over the period and the
+throughput reported by the running tasks, feeds the observation to the controller, asks
+it for a configuration and applies it through DVFSActuator. A decision that takes longer
+than --decision-timeout is abandoned, transitions are rate limited, and a watchdog thread
+pins the maximum frequencies when decisions or telemetry stop arriving.
+
+SLO targets and throughput come as JSON objects from an --slo-file (re-read when it
+changes), a unix --socket (one object per line) or RuntimeDaemon.queue in-process:
+
+    {"slo": {"fps_od": 30, "fps_p": 0.5, "tps": 5}}
+    {"count": {"tps": 12}}          items completed since the last message
+    {"status": true}                replies with the daemon statistics (socket only)
+
+    python runtime/daemon.py --controller lut --fake-sysfs /tmp/eocs-sys --slo-file slo.json
+    python runtime/daemon.py --simulate --speedup 10 --simulate-load --duration 600
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / 'bo'))
+sys.path.append(str(ROOT / 'profiler'))
+
+from simulate import Environment, ENERGY_SCALE, FPS_OD_MULTIPLIER, FPS_P_MULTIPLIER, TPS_MULTIPLIER, WORKLOADS, make_controller
+from dvfs.actuator import DVFSActuator
+from dvfs.knobs import KnobSpace
+from power.AGXPowerLogger import AGXPowerLogger
+from device.backend import SysfsBackend, getBackend, setBackend
+
+MULTIPLIERS = {"fps_od": FPS_OD_MULTIPLIER, "fps_p": FPS_P_MULTIPLIER, "tps": TPS_MULTIPLIER}
+
+class ThroughputCounter:
+    """Items completed by a task; rate() is the items per second since the last rate() that counted any.
+
+    A period in which the task completed nothing gives None and is carried into the next one, so a
+    task whose items take longer than the control period is not observed at zero throughput."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.count = 0
+        self.since = clock()
+
+    def add(self, n=1):
+        with self.lock:
+            self.count += n
+
+    def rate(self):
+        now = self.clock()
+        with self.lock:
+            if not self.count:
+                return None
+            count, self.count = self.count, 0
+            elapsed, self.since = now - self.since, now
+        return count / elapsed if elapsed > 0 else None
+
+class PowerMonitor:
+    """Mean power (W) of the first `rails` rails (GPU, CPU[, memory]) between reads, from AGXPowerLogger samples"""
+
+    def __init__(self, logger, rails=2):
+        self.logger = logger
+        self.rails = rails
+        self.lock = threading.Lock()
+        self.total = 0.0
+        self.samples = 0
+        self.last = None
+        logger.addListener(self.on_sample)
+
+    def on_sample(self, t, power):
+        with self.lock:
+            self.total += sum(power[:self.rails])
+            self.samples += 1
+            self.last = t
+
+    def read(self):
+        with self.lock:
+            if not self.samples:
+                return None
+            mean = self.total / self.samples / ENERGY_SCALE
+            self.total, self.samples = 0.0, 0
+        return mean
+
+    def age(self):
+        """Seconds since the last sample, on the logger's clock"""
+        return None if self.last is None else self.logger.now() - self.last
+
+class RuntimeDaemon:
+    """Ticks the controller every `period` seconds of the backend clock.
+
+    controller has the update_config()/tell() interface of DVFSController and LookupTableController,
+    over the knobs of `space` (a dvfs.knobs.KnobSpace); with an "emc" knob the actuator must control EMC.
+    With `measure_lead`, a ProactiveController is told the longest of the actuator's recent
+    transition latencies before every decision.
+    """
+
+    def __init__(self, controller, actuator, space, period=1.0, decision_timeout=0.2,
+                 min_transition_interval=2.0, watchdog_timeout=5.0, interval=0.05, history=4096, log=None,
+                 measure_lead=False):
+        self.controller = controller
+        self.measure_lead = measure_lead
+        self.actuator = actuator
+        self.backend = actuator.backend
+        self.clock = self.backend.monotonic
+        self.period = period
+        self.decision_timeout = decision_timeout
+        self.min_transition_interval = min_transition_interval
+        self.watchdog_timeout = watchdog_timeout
+        self.space = space
+        self.fallback = space.fallback()
+        self.log = log
+
+        self.logger = AGXPowerLogger(interval=interval, capacity=0)
+        self.power = PowerMonitor(self.logger, rails=3 if "emc" in space.names else 2)
+        self.counters = {w: ThroughputCounter(self.clock) for w in WORKLOADS}
+        self.targets = {w: 0.0 for w in WORKLOADS}
+        self.queue = asyncio.Queue()
+
+        self.lock = threading.Lock()
+        self.current = None
+        self.last_transition = -float("inf")
+        self.last_decision = self.clock()
+        self.pending = None
+        self.records = deque(maxlen=history)
+        self.stats = {k: 0 for k in ("ticks", "decisions", "timeouts", "busy", "errors", "transitions",
+                                     "rate_limited", "fallbacks", "late_ticks", "stale_ticks")}
+
+        self.slo_file = None
+        self.slo_mtime = None
+        self.stop_event = threading.Event()
+        self.watchdog = None
+
+    # Inputs
+
+    def handle(self, message):
+        """Applies one {"slo": {...}} / {"count": {...}} message; returns a reply or None"""
+        for w, target in message.get("slo", {}).items():
+            if w in self.targets:
+                self.targets[w] = float(target)
+        for w, n in message.get("count", {}).items():
+            if w in self.counters:
+                self.counters[w].add(n)
+        if message.get("status"):
+            return self.status()
+        return None
+
+    def poll_file(self):
+        if self.slo_file is None:
+            return
+        try:
+            mtime = os.stat(self.slo_file).st_mtime_ns
+            if mtime == self.slo_mtime:
+                return
+            with open(self.slo_file, 'r') as file:
+                message = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.slo_mtime = mtime
+        self.handle(message if "slo" in message else {"slo": message})
+
+    async def serve_client(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                reply = self.handle(json.loads(line))
+            except ValueError:
+                reply = {"error": "invalid JSON"}
+            if reply is not None:
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        writer.close()
+
+    def status(self):
+        status = {"targets": self.targets, "current": self.current, "stats": self.stats}
+        if hasattr(self.controller, "cache_stats"):
+            status["decision_cache"] = self.controller.cache_stats()
+        return status
+
+    # Control
+
+    def apply(self, conf, force=False):
+        """Actuates conf unless rate limited; the watchdog forces its fallback through"""
+        with self.lock:
+            if conf == self.current:
+                return False
+            now = self.clock()
+            if not force and now - self.last_transition < self.min_transition_interval:
+                self.stats["rate_limited"] += 1
+                return False
+            self.space.apply(conf, self.actuator)
+            self.current = conf
+            self.last_transition = now
+            self.stats["transitions"] += 1
+            return True
+
+    def decide(self, observation, targets):
+        """Runs in the executor: update the controller with (config, (fps_od, fps_p, tps, power)) of the last period, then tell"""
+        if observation is not None:
+            conf, values = observation
+            self.controller.update_config(conf, *values)
+        latencies = self.actuator.getLatencies() if self.measure_lead else None
+        if latencies:
+            self.controller.set_lead(max(latency[3] for latency in latencies))
+        conf = self.controller.tell(targets["fps_od"], targets["fps_p"], targets["tps"])
+        return tuple(int(v) for v in conf[:len(self.fallback)])
+
+    async def tick(self):
+        self.stats["ticks"] += 1
+        while not self.queue.empty():
+            self.handle(self.queue.get_nowait())
+        self.poll_file()
+
+        power = self.power.read()
+        rates = {w: c.rate() for w, c in self.counters.items()}
+        observation = None
+        # Only periods in which every task completed something are observed; the others are carried over
+        if self.current is not None and power is not None and all(r is not None for r in rates.values()):
+            observation = (self.current, (*(rates[w] for w in WORKLOADS), power))
+
+        record = {"time": self.backend.time(), "targets": dict(self.targets), "power": power, "rates": rates,
+                  "decision": None, "applied": False}
+        if self.telemetry_stale():
+            # The watchdog holds the fallback; decisions resume once fresh power samples arrive
+            self.stats["stale_ticks"] += 1
+            record["stale"] = True
+        elif self.pending is not None and not self.pending.done():
+            # The controller is still busy with an abandoned decision; it is not thread-safe
+            self.stats["busy"] += 1
+        else:
+            loop = asyncio.get_running_loop()
+            self.pending = loop.run_in_executor(None, self.decide, observation, dict(self.targets))
+            t0 = time.perf_counter()
+            try:
+                conf = await asyncio.wait_for(asyncio.shield(self.pending), self.decision_timeout)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                record["error"] = repr(e)
+            else:
+                self.stats["decisions"] += 1
+                self.last_decision = self.clock()
+                record["decision"] = conf
+                record["applied"] = self.apply(conf)
+            record["decision_latency"] = time.perf_counter() - t0
+
+        self.records.append(record)
+        if self.log is not None:
+            self.log.write(json.dumps(record) + "\n")
+
+    def telemetry_stale(self):
+        """Whether no power sample arrived for longer than the watchdog timeout"""
+        age = self.power.age()
+        return age is None or age > self.watchdog_timeout
+
+    def watch(self):
+        """Watchdog thread: pins the maximum frequencies when decisions or telemetry go stale"""
+        while not self.stop_event.wait(self.watchdog_timeout / 4 / self.backend.speedup):
+            stale = self.clock() - self.last_decision > self.watchdog_timeout or self.telemetry_stale()
+            if stale and self.apply(self.fallback, force=True):
+                self.stats["fallbacks"] += 1
+
+    async def run(self, duration=None, socket=None, slo_file=None):
+        self.slo_file = slo_file
+        server = None
+        if socket is not None:
+            if os.path.exists(socket):
+                os.unlink(socket)
+            server = await asyncio.start_unix_server(self.serve_client, path=socket)
+
+        self.logger.start()
+        self.apply(self.fallback, force=True)
+        self.last_decision = self.clock()
+        self.stop_event.clear()
+        self.watchdog = threading.Thread(target=self.watch, name="DVFSWatchdog", daemon=True)
+        self.watchdog.start()
+
+        start = self.clock()
+        deadline = start
+        try:
+            while duration is None or self.clock() - start < duration:
+                await self.tick()
+                deadline += self.period
+                now = self.clock()
+                if now > deadline:
+                    # Overran the period: skip the missed ticks instead of bursting
+                    self.stats["late_ticks"] += 1
+                    deadline = now
+                await asyncio.sleep((deadline - now) / self.backend.speedup)
+        finally:
+            self.stop_event.set()
+            self.watchdog.join()
+            self.logger.stop()
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+            # Leave the device at the safe configuration
+            self.apply(self.fallback, force=True)
+        return self.status()
+
+class SimulatedLoad:
+    """Runs the profiled workloads back to back on a SimulatedBackend and feeds the daemon's counters
+    one frame or token at a time, as the real tasks report them"""
+
+    def __init__(self, backend, daemon):
+        self.backend = backend
+        self.daemon = daemon
+        self.threads = []
+        self.stop_event = threading.Event()
+
+    def loop(self, name, workload):
+        counter = self.daemon.counters[workload]
+        while not self.stop_event.is_set():
+            for _ in self.backend.streamWorkload(name, MULTIPLIERS[workload]):
+                counter.add()
+
+    def start(self):
+        from device.simulated import WORKLOADS as SIMULATED_WORKLOADS
+        for name, workload in zip(SIMULATED_WORKLOADS, WORKLOADS):
+            thread = threading.Thread(target=self.loop, args=(name, workload), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Closed-loop DVFS runtime daemon")
+    parser.add_argument("--controller", choices=("bo", "lut"), default="lut",
+                        help="Bayesian optimisation (DVFSController) or profile lookup table (LookupTableController)")
+    parser.add_argument("--acquisition", choices=("greedy", "lcb", "cei"), default="greedy", help="DVFSController acquisition mode")
+    parser.add_argument("--beta", type=float, default=2.0)
+    parser.add_argument("--pof-threshold", type=float, default=0.9)
+    parser.add_argument("--incremental", action="store_true", help="Use incremental GP updates")
+    parser.add_argument("--max-history", type=int, default=None)
+    parser.add_argument("--cache-size", type=int, default=256, help="Decisions tell() memoises (0 disables the cache)")
+    parser.add_argument("--slo-quantum", type=float, nargs=3, default=None, metavar=("FPS_OD", "FPS_P", "TPS"),
+                        help="Round each SLO up to a multiple of its step (FPS, prefills/s, tokens/s; 0 keeps it) before the cache lookup")
+    parser.add_argument("--update-tolerance", type=float, default=None,
+                        help="Drop observations every model already predicts within this relative error")
+    parser.add_argument("--forecast", choices=("ewma", "ar", "changepoint"), default=None,
+                        help="Forecast the SLOs over the transition latency and act ahead of them (ProactiveController)")
+    parser.add_argument("--forecast-z", type=float, default=1.0, help="Std of headroom above the forecast mean")
+    parser.add_argument("--hold", type=int, default=None,
+                        help="Periods a lower SLO is held off (default: twice the forecast horizon)")
+    parser.add_argument("--transition-latency", type=float, default=None,
+                        help="Lead of --forecast in seconds (default: measured from the actuator's transitions)")
+    parser.add_argument("--settle-file", default=None,
+                        help="Take --transition-latency as the median settle time in a profiler's <config>-settle.json")
+    parser.add_argument("--period", type=float, default=1.0, help="Control period (s)")
+    parser.add_argument("--decision-timeout", type=float, default=0.2, help="Longest wait for a decision (s)")
+    parser.add_argument("--min-transition-interval", type=float, default=2.0, help="Rate limit of transitions (s)")
+    parser.add_argument("--watchdog-timeout", type=float, default=5.0,
+                        help="Pin the maximum frequencies after this long without decisions or telemetry (s)")
+    parser.add_argument("--slo-file", default=None, help="JSON SLO targets, re-read when modified")
+    parser.add_argument("--socket", default=None, help="Unix socket accepting JSON-line messages")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--log", default=None, help="Append every tick as a JSON line")
+    parser.add_argument("--root", default=None, help="Relocate the sysfs tree (e.g. a fake one)")
+    parser.add_argument("--fake-sysfs", default=None, help="Build a fake sysfs tree here and run against it")
+    parser.add_argument("--simulate", action="store_true", help="Run against the simulated device backend")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Simulated clock speedup")
+    parser.add_argument("--simulate-load", action="store_true", help="Run the profiled workloads on the simulated device")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    backend = getBackend()
+    if args.simulate:
+        from device.simulated import SimulatedBackend
+        backend = SimulatedBackend.fromResults(speedup=args.speedup)
+    elif args.fake_sysfs or args.root:
+        root = args.root
+        if args.fake_sysfs:
+            from fakesys import makeFakeSysfs
+            root = makeFakeSysfs(args.fake_sysfs)
+        backend = SysfsBackend(root)
+    setBackend(backend)
+
+    env = Environment.load()
+    log = open(args.log, 'a') if args.log else None
+    space = KnobSpace(env.names, env.knobs)
+    with DVFSActuator(backend=backend, emc="emc" in space.names) as actuator:
+        daemon = RuntimeDaemon(
+            make_controller(args, env, period=args.period), actuator, space,
+            period=args.period,
+            decision_timeout=args.decision_timeout,
+            min_transition_interval=args.min_transition_interval,
+            watchdog_timeout=args.watchdog_timeout,
+            log=log,
+            measure_lead=bool(args.forecast) and args.transition_latency is None and args.settle_file is None,
+        )
+        load = None
+        if args.simulate_load:
+            if not args.simulate:
+                raise SystemExit("--simulate-load needs --simulate")
+            load = SimulatedLoad(backend, daemon)
+            load.start()
+        try:
+            status = asyncio.run(daemon.run(args.duration, args.socket, args.slo_file))
+        except KeyboardInterrupt:
+            status = daemon.status()
+        finally:
+            if load is not None:
+                load.stop()
+            if log is not None:
+                log.close()
+    print(json.dumps(status, indent=4))
+
+if __name__ == "__main__":
+    main()
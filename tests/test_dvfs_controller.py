@@ -0,0 +1,53 @@
+"""DVFSController decision cache: hits within a model version, recomputed after an update"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'bo'))
+
+from DVFSController import DVFSController
+
+CPU = [1.0, 2.0, 3.0, 4.0]
+GPU = [1.0, 2.0, 3.0]
+SLOS = (20.0, 0.5, 5.0)
+
+def observation(cpu, gpu):
+    """(fps_od, fps_p, tps, power) of a config: throughput and power grow with both clocks"""
+    return 8.0 * cpu + 4.0 * gpu, 0.1 * cpu + 0.2 * gpu, 1.5 * cpu + gpu, cpu ** 2 + 2.0 * gpu ** 2
+
+def fitted(incremental, configs=((1, 1), (4, 3), (2, 2), (3, 1), (1, 3), (4, 1))):
+    controller = DVFSController(CPU, GPU, incremental=incremental, warmup=3)
+    for cpu, gpu in configs:
+        controller.update(cpu, gpu, *observation(cpu, gpu))
+    return controller
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_cached_tell_is_invalidated_by_update(incremental):
+    controller = fitted(incremental)
+    decision = controller.tell(*SLOS)
+    assert controller.tell(*SLOS) == decision
+    assert (controller.cache_hits, controller.cache_misses) == (1, 1)
+
+    # A new observation bumps the version: the cached decision and grid are stale
+    grid = controller.predict_grid()
+    controller.update(3, 3, *observation(3, 3))
+    refreshed = controller.tell(*SLOS)
+    assert (controller.cache_hits, controller.cache_misses) == (1, 2)
+    assert controller.grid[0] == controller.version
+    assert not np.allclose(controller.predict_grid(), grid)
+
+    # The refreshed decision is the one a controller without a cache makes from the same samples
+    uncached = fitted(incremental, configs=((1, 1), (4, 3), (2, 2), (3, 1), (1, 3), (4, 1), (3, 3)))
+    uncached.cache_size = 0
+    assert refreshed == uncached.tell(*SLOS)
+
+def test_incremental_grid_matches_exact_predictions():
+    controller = fitted(incremental=True)
+    mean, std = controller.predict_grid(return_std=True)
+    models = (controller.gp_fps_od, controller.gp_fps_p, controller.gp_tps, controller.gp_power)
+    for gp, m, s in zip(models, mean, std):
+        ref_mean, ref_std = gp.predict(controller.candidates, return_std=True)
+        np.testing.assert_allclose(m, ref_mean, rtol=1e-8, atol=1e-8)
+        np.testing.assert_allclose(s, ref_std, rtol=1e-6, atol=1e-8)
@@ -0,0 +1,58 @@
+"""IncrementalGP against a GaussianProcessRegressor refitted from scratch with the same kernel"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import RBF
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'bo'))
+
+from IncrementalGP import IncrementalGP
+
+def surface(X):
+    return 10.0 + np.sin(3.0 * X[:, 0]) * np.cos(2.0 * X[:, 1]) + X[:, 0] ** 2
+
+def samples(count, seed=0):
+    X = np.random.default_rng(seed).uniform(0.0, 1.0, size=(count, 2))
+    return X, surface(X)
+
+def reference(gp):
+    """An exact GP over the same training set and kernel"""
+    exact = GaussianProcessRegressor(kernel=gp.kernel_, alpha=gp.alpha, normalize_y=True, optimizer=None)
+    return exact.fit(gp.X, gp.y)
+
+@pytest.mark.parametrize("max_history", [None, 12])
+def test_matches_exact_gp_after_extend_and_evict(max_history):
+    gp = IncrementalGP(RBF(0.3, "fixed"), alpha=1e-6, max_history=max_history, warmup=5)
+    X, y = samples(30)
+    for x, target in zip(X, y):
+        gp.update(x, target)
+    # Past the warmup every sample extended the factor, and with max_history evicted the oldest
+    assert len(gp.y) == (max_history or len(y))
+    np.testing.assert_allclose(gp.X, X[-len(gp.y):])
+
+    test, _ = samples(50, seed=1)
+    mean, std = gp.predict(test, return_std=True)
+    ref_mean, ref_std = reference(gp).predict(test, return_std=True)
+    np.testing.assert_allclose(mean, ref_mean, rtol=1e-6, atol=1e-6)
+    np.testing.assert_allclose(std, ref_std, rtol=1e-4, atol=1e-6)
+
+@pytest.mark.parametrize("max_history", [None, 12])
+def test_predict_candidates_matches_predict(max_history):
+    gp = IncrementalGP(RBF(0.3, "fixed"), alpha=1e-6, max_history=max_history, warmup=5)
+    candidates, _ = samples(40, seed=2)
+    gp.set_candidates(candidates)
+    X, y = samples(30)
+    for i, (x, target) in enumerate(zip(X, y)):
+        gp.update(x, target)
+        # Query between updates so that the cross-kernel and its solve are extended, not rebuilt
+        if i % 3 == 0:
+            gp.predict_candidates(return_std=True)
+
+    mean, std = gp.predict_candidates(return_std=True)
+    ref_mean, ref_std = gp.predict(candidates, return_std=True)
+    np.testing.assert_allclose(mean, ref_mean, rtol=1e-8, atol=1e-8)
+    np.testing.assert_allclose(std, ref_std, rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(gp.predict_candidates(), ref_mean, rtol=1e-8, atol=1e-8)
@@ -0,0 +1,81 @@
+"""VLMPipeline.prefill_cached() against an uncached prefill, on a tiny random Gemma3"""
+import sys
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers.models.gemma3")
+if not hasattr(pytest.importorskip("transformers.cache_utils"), "HybridCache"):
+    pytest.skip("VLMPipeline needs the HybridCache of transformers 4.x", allow_module_level=True)
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'profiler'))
+
+from transformers import Gemma3Config, Gemma3ForConditionalGeneration
+from task.VLMPipeline import VLMPipeline
+from task.caches import cache_tensors
+
+IMAGE_TOKEN, BOI_TOKEN, EOI_TOKEN = 60, 61, 62
+# System text, the image between its delimiters, and the prompt text
+PROMPT = [2, 5, 6, 7, BOI_TOKEN] + [IMAGE_TOKEN] * 4 + [EOI_TOKEN, 8, 9, 10, 11]
+
+def tiny_model(sliding_window=64):
+    torch.manual_seed(0)
+    config = Gemma3Config(
+        text_config=dict(vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=2, num_key_value_heads=1, head_dim=16,
+                         sliding_window=sliding_window, sliding_window_pattern=2, max_position_embeddings=128),
+        vision_config=dict(hidden_size=32, intermediate_size=64, num_hidden_layers=1, num_attention_heads=2,
+                           image_size=32, patch_size=8),
+        mm_tokens_per_image=4,
+        image_token_index=IMAGE_TOKEN,
+        boi_token_index=BOI_TOKEN,
+        eoi_token_index=EOI_TOKEN,
+    )
+    return Gemma3ForConditionalGeneration(config).eval()
+
+def make_pipeline(model, cached):
+    pipeline = VLMPipeline()
+    pipeline.DEVICE = "cpu"
+    pipeline.OUTPUT_TOKENS = 4
+    pipeline.model = model
+    input_ids = torch.tensor([PROMPT])
+    pipeline.inputs = {
+        "input_ids": input_ids,
+        "attention_mask": torch.ones_like(input_ids),
+        "pixel_values": torch.randn(1, 3, 32, 32, generator=torch.Generator().manual_seed(1)),
+        "token_type_ids": (input_ids == IMAGE_TOKEN).long(),
+    }
+    pipeline.setup_cache()
+    if cached:
+        pipeline.enable_caches()
+    return pipeline
+
+def assert_same_prefill(pipeline, reference):
+    torch.testing.assert_close(pipeline.prefill_output.logits[:, -1], reference.prefill_output.logits[:, -1],
+                               rtol=1e-5, atol=1e-5)
+    length = len(PROMPT)
+    for (k, v), (ref_k, ref_v) in zip(cache_tensors(pipeline.past_kv), cache_tensors(reference.past_kv)):
+        torch.testing.assert_close(k[:, :, :length], ref_k[:, :, :length], rtol=1e-5, atol=1e-5)
+        torch.testing.assert_close(v[:, :, :length], ref_v[:, :, :length], rtol=1e-5, atol=1e-5)
+
+def test_cached_prefill_matches_uncached():
+    model = tiny_model()
+    reference = make_pipeline(model, cached=False)
+    reference.prefill()
+
+    pipeline = make_pipeline(model, cached=True)
+    # Cold: every chunk runs, the image chunk starting past the cached system prefix
+    pipeline.prefill()
+    assert_same_prefill(pipeline, reference)
+
+    # Warm: the whole prompt but its last token comes from the prefix cache
+    pipeline.reset_cache()
+    pipeline.prefill()
+    assert pipeline.prefix_cache.hits == 1
+    assert_same_prefill(pipeline, reference)
+
+def test_cached_prefill_needs_cache_within_sliding_window():
+    pipeline = make_pipeline(tiny_model(sliding_window=8), cached=True)
+    with pytest.raises(ValueError, match="sliding window"):
+        pipeline.prefill()